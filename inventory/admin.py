@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from mptt.admin import MPTTModelAdmin
-from .models import Location, Item, Category, LocationPrintList
+from .models import Location, Item, Category, Loan, LocationPrintList
 
 class ItemAdmin(admin.ModelAdmin):
     fields = ['name', 'description', 'amount', 'location', 'category']
@@ -21,6 +21,13 @@ class CategoryAdmin(MPTTModelAdmin):
     list_filter = ['creation_date']
     search_fields = ['name', 'description']
 
+class LoanAdmin(admin.ModelAdmin):
+    fields = ['item', 'borrower', 'lent_date', 'due_date', 'returned_date', 'user']
+    raw_id_fields = ['item']
+    list_display = ['item', 'borrower', 'lent_date', 'due_date', 'returned_date']
+    list_select_related = ['item']
+    search_fields = ['borrower']
+
 class LocationPrintListAdmin(admin.ModelAdmin):
     fields = ['user', 'locations']
     list_display = ['user']
@@ -28,4 +35,5 @@ class LocationPrintListAdmin(admin.ModelAdmin):
 admin.site.register(Item, ItemAdmin)
 admin.site.register(Location, LocationAdmin)
 admin.site.register(Category, CategoryAdmin)
+admin.site.register(Loan, LoanAdmin)
 admin.site.register(LocationPrintList, LocationPrintListAdmin)
@@ -0,0 +1,68 @@
+"""
+Barcodes of locations, rendered in-process.
+
+Locations are labelled with a QR code of their UUID (segno), rendered as
+SVG. Rendering one takes a few milliseconds, so rendered codes are cached
+under a key made of the hash of everything that goes into them (content
+addressed): the same text always gives the same code, nothing ever needs
+to be invalidated, and the cache backend (memory, file, memcached, redis;
+see settings.py) decides where they live. Pages with many codes fetch them
+with one get_many.
+
+segno cannot render DataMatrix codes, which the labels used before; scanners
+reading DataMatrix usually read QR codes as well, and the content is the
+same UUID.
+"""
+
+import hashlib
+import io
+
+import segno
+from django.core.cache import cache
+
+TIMEOUT = 30 * 24 * 60 * 60
+ERROR = 'm'
+BORDER = 1
+# Pixels per module of standalone images
+SCALE = 4
+
+
+def _key(kind, text):
+    digest = hashlib.sha256('{}:{}:{}:{}:{}'.format(kind, ERROR, BORDER, SCALE, text).encode()).hexdigest()
+    return 'inventory:barcode:' + digest
+
+
+def etag(text):
+    """ETag of the standalone image of ``text``."""
+    return '"{}"'.format(_key('svg', text).rsplit(':', 1)[1])
+
+
+def _render(kind, text):
+    qr = segno.make_qr(text, error=ERROR)
+    if kind == 'inline':
+        # No size of its own, it fills the element around it
+        return qr.svg_inline(omitsize=True, border=BORDER, svgclass='w-100 h-100')
+    out = io.BytesIO()
+    qr.save(out, kind='svg', scale=SCALE, border=BORDER, xmldecl=False)
+    return out.getvalue().decode()
+
+
+def _cached(kind, texts):
+    keys = {text: _key(kind, text) for text in texts}
+    found = cache.get_many(keys.values())
+    rendered = {text: found[key] for text, key in keys.items() if key in found}
+    missing = {keys[text]: _render(kind, text) for text in texts if text not in rendered}
+    if missing:
+        cache.set_many(missing, TIMEOUT)
+        rendered.update({text: missing[keys[text]] for text in texts if keys[text] in missing})
+    return rendered
+
+
+def svg(text):
+    """Standalone SVG image of the QR code of ``text``."""
+    return _cached('svg', [text])[text]
+
+
+def inline(texts):
+    """Map each of ``texts`` to the SVG element of its QR code, for embedding in HTML."""
+    return _cached('inline', set(texts))
@@ -0,0 +1,174 @@
+"""
+Latency and query count benchmark of the inventory views.
+
+Every route of inventory/urls.py is requested through the test client with
+arguments taken from the current database, e.g. the biggest location of
+the seeded tree (see seed_inventory). Each request runs in a transaction
+which is rolled back afterwards, so views which change data are measured
+against the same data every time.
+"""
+
+import json
+import logging
+import time
+
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern
+
+from . import urls
+from .models import Item, Location, Category
+
+REPEAT = 20
+# Routes which need a query string to show something
+QUERIES = {
+    'search': {'q': 'screw', 'type': 'item'},
+    'export': {'type': 'location', 'format': 'csv'},
+    'locationfindfreeslot': {'amount': 1},
+}
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of ``values``."""
+    values = sorted(values)
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(rank)]
+
+
+def samples():
+    """The objects the routes are requested with, the ones with the most items where there is a choice."""
+    return {
+        'location': (Location.objects.filter(state='d').exclude(parent=None)
+                     .order_by('-subtree_item_count', 'pk').first() or Location.objects.first()),
+        'category': (Category.objects.filter(state='d').exclude(parent=None).annotate(items=Count('item'))
+                     .order_by('-items', 'pk').first() or Category.objects.first()),
+        'item': Item.objects.filter(state='d', location__isnull=False).order_by('-pk').first(),
+        'trashed location': Location.objects.filter(state='t').first(),
+        'trashed category': Category.objects.filter(state='t').first(),
+        'trashed item': Item.objects.filter(state='t').first(),
+        'uuid': Location.objects.exclude(uuid=None).values_list('uuid', flat=True).first(),
+        'barcode': Item.objects.exclude(barcode=None).aggregate(barcode=Max('barcode'))['barcode'],
+    }
+
+
+def kwargs_for(pattern, objects):
+    """URL arguments for ``pattern`` or None if the database has nothing to request it with."""
+    kwargs = {}
+    for name in pattern.pattern.converters:
+        if name == 'pk':
+            kind = next((kind for kind in ('location', 'category', 'item') if pattern.name.startswith(kind)),
+                        'location')
+            # Only trashed objects can be restored or deleted
+            if pattern.name.endswith(('untrash', 'delete')):
+                kind = 'trashed ' + kind
+            value = objects[kind] and objects[kind].pk
+        elif name == 'id':
+            value = objects['uuid']
+        elif name == 'code':
+            value = objects['barcode']
+        else:
+            value = None
+        if value is None:
+            return None
+        kwargs[name] = value
+    return kwargs
+
+
+def routes(objects):
+    """
+    (name, path, query) of every route of the inventory app and the names
+    of the routes which can't be requested with the current data.
+    """
+    result = []
+    skipped = []
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        kwargs = kwargs_for(pattern, objects)
+        if kwargs is None:
+            skipped.append(pattern.name)
+            continue
+        path = '/' + str(pattern.pattern)
+        for name, value in kwargs.items():
+            path = path.replace('<{}:{}>'.format(type(pattern.pattern.converters[name]).__name__
+                                                 .replace('Converter', '').lower(), name), str(value))
+        result.append((pattern.name, path, QUERIES.get(pattern.name, {})))
+    return result, skipped
+
+
+def measure(client, path, query, repeat):
+    timings = []
+    queries = []
+    status = None
+    for i in range(repeat):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(path, query)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            status = response.status_code
+            transaction.set_rollback(True)
+    return {
+        'path': path,
+        'status': status,
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'max_ms': round(max(timings) * 1000, 2),
+        'queries': max(queries),
+    }
+
+
+def run(user, repeat=REPEAT, names=None):
+    """Benchmark all routes (or the ones in ``names``) as ``user``, returns the JSON report."""
+    objects = samples()
+    requested, skipped = routes(objects)
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    views = {}
+    # Errors are part of the report, don't log them for every request
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, path, query in requested:
+                if names and name not in names:
+                    continue
+                # One request to warm up caches and the database
+                measure(client, path, query, 1)
+                views[name] = measure(client, path, query, repeat)
+    finally:
+        logger.setLevel(level)
+    return {
+        'repeat': repeat,
+        'locations': Location.objects.count(),
+        'categories': Category.objects.count(),
+        'items': Item.objects.count(),
+        'views': views,
+        'skipped': [name for name in skipped if not names or name in names],
+    }
+
+
+def compare(old, new):
+    """Lines comparing two reports of run(), slowest changes first."""
+    lines = []
+    for name, view in sorted(new['views'].items(), key=lambda e: -e[1]['p50_ms']):
+        before = old['views'].get(name)
+        if before is None:
+            lines.append("{:<24} {:>9.2f}ms {:>4} queries (new)".format(name, view['p50_ms'], view['queries']))
+            continue
+        lines.append("{:<24} {:>9.2f}ms -> {:>9.2f}ms ({:+6.1f}%) {:>4} -> {:>4} queries".format(
+            name, before['p50_ms'], view['p50_ms'],
+            (view['p50_ms'] - before['p50_ms']) * 100 / before['p50_ms'] if before['p50_ms'] else 0,
+            before['queries'], view['queries']))
+    return lines
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,118 @@
+"""
+Versioned cache keys.
+
+Cached data is stored under keys which contain a version number of the data
+it depends on. Instead of deleting every affected key when something
+changes, the version is bumped and the old entries simply expire.
+
+Rendered template fragments of the location and category trees (see the
+treecache template tag) depend on the version of their tree, which is
+bumped whenever a node of the tree or an item in it changes.
+The version 'categories' is bumped whenever an item or category changes,
+'locations' whenever a location changes. Conditional GET (conditional.py)
+builds its ETags from the same versions.
+
+The versions are rows of the database (CacheVersion), bumped in the
+transaction which changes the data, so every process sees them as soon as
+the change is committed, also changes made by management commands or other
+workers, and never before. The cached data itself can be in a cache of
+each process (locmem).
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.translation import get_language
+
+from . import routers
+from .models import CacheVersion
+
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def versions(names, request=None):
+    """
+    The numbers of the versions ``names``, read with one query. Remembered
+    for the rest of ``request``, if given, so the ETag and the fragments of
+    a page need one query together.
+    """
+    known = getattr(request, '_cache_versions', {})
+    missing = [name for name in names if name not in known]
+    if missing:
+        known.update(dict.fromkeys(missing, 0))
+        known.update(CacheVersion.objects.filter(name__in=missing).values_list('name', 'number'))
+    if request is not None:
+        request._cache_versions = known
+    return [known[name] for name in names]
+
+
+def version(name, request=None):
+    return versions([name], request)[0]
+
+
+def bump(name):
+    """Bump the version ``name``, in the current transaction."""
+    if not CacheVersion.objects.filter(name=name).update(number=F('number') + 1):
+        # Start from the current time, so that a version table restored from
+        # a backup never hands out the number of a cached version again.
+        _, created = CacheVersion.objects.get_or_create(name=name, defaults={'number': int(time.time() * 1000)})
+        if not created:
+            CacheVersion.objects.filter(name=name).update(number=F('number') + 1)
+
+
+def versioned_key(name, *parts, request=None):
+    return ':'.join(['inventory', name, str(version(name, request))] + [str(p) for p in parts])
+
+
+def tree_name(model, tree_id):
+    return 'tree:{}:{}'.format(model._meta.model_name, tree_id)
+
+
+def bump_trees(model, tree_ids):
+    for tree_id in set(tree_ids):
+        if tree_id is not None:
+            bump(tree_name(model, tree_id))
+
+
+class Stats:
+    """Hits and misses of the fragment cache in this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fragments = {}
+
+    def add(self, name, hit):
+        with self.lock:
+            entry = self.fragments.setdefault(name, [0, 0])
+            entry[0 if hit else 1] += 1
+
+    def summary(self):
+        with self.lock:
+            return [{'name': name, 'hits': hits, 'misses': misses,
+                     'ratio': hits / (hits + misses)}
+                    for name, (hits, misses) in sorted(self.fragments.items())]
+
+    def reset(self):
+        with self.lock:
+            self.fragments = {}
+
+
+stats = Stats()
+
+
+def fragment(node, name, render, request=None):
+    """
+    Cached result of ``render()`` for the fragment ``name`` of the tree
+    ``node`` is in. Valid until the tree changes. Not stored if
+    rendered from a replica, which may not have the current version yet.
+    """
+    key = versioned_key(tree_name(type(node), node.tree_id), name, node.pk, get_language(), request=request)
+    value = cache.get(key)
+    stats.add(name, value is not None)
+    if value is None:
+        value = render()
+        if routers.replica.get() is None:
+            cache.set(key, value, FRAGMENT_TIMEOUT)
+    return value
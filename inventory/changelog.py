@@ -0,0 +1,114 @@
+"""
+Append-only change log for clients keeping a copy of the inventory, e.g.
+offline scanners.
+
+Every save, trash and delete of an item, location or category appends a
+Change row. Its primary key is the sequence number: a client remembers the
+number of the last change it has seen and asks for the ones after it, so
+syncing costs as much as the changes since then, not the whole inventory.
+Set-based operations (bulk_saved) append one row per object with one bulk
+insert per batch.
+
+delta() reads up to BATCH_SIZE changes, keeps only the last action of
+every object and returns the current fields of the saved objects and the
+ids of the deleted ones. Trashed and archived objects are saved objects
+with their state.
+
+Change rows are inserted after the transaction which made the changes has
+committed (transaction.on_commit), however long it took, so sequence
+numbers are handed out in commit order. Only the short insert of the rows
+themselves can still commit after the insert of a later number. Changes
+younger than the CHANGES_DELAY setting, which must be longer than such an
+insert takes, are left for the next request, so they are not skipped
+either. A process which dies between the commit and the insert loses
+these log rows; clients resync with the export then.
+
+The log starts empty: a new client reads the current cursor first, then
+downloads everything (e.g. with the export) and then follows the log.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Change
+from .search import searchable as models, kind_of
+
+BATCH_SIZE = 1000
+SAVED = 's'
+DELETED = 'd'
+
+fields = {
+    'item': ['id', 'name', 'description', 'amount', 'location', 'category', 'barcode', 'state',
+             'lent', 'lent_to', 'change_date'],
+    'location': ['id', 'parent', 'name', 'description', 'uuid', 'free_space', 'capacity', 'state',
+                 'change_date'],
+    'category': ['id', 'parent', 'name', 'description', 'state', 'change_date'],
+}
+
+
+def record(kind, pks, action=SAVED):
+    """
+    Append a change of ``action`` for every object ``pks`` of ``kind`` when
+    the current transaction commits (right away outside of one).
+    """
+    pks = list(pks)
+    transaction.on_commit(lambda: insert(kind, pks, action))
+
+
+def insert(kind, pks, action):
+    batch = []
+    for pk in pks:
+        batch.append(Change(kind=kind, object_id=pk, action=action))
+        if len(batch) == BATCH_SIZE:
+            Change.objects.bulk_create(batch)
+            batch = []
+    Change.objects.bulk_create(batch)
+
+
+def record_queryset(queryset):
+    """Append a saved change for every object of ``queryset``."""
+    record(kind_of(queryset.model()),
+           queryset.order_by().values_list('pk', flat=True).iterator(chunk_size=BATCH_SIZE))
+
+
+def current():
+    """The sequence number of the latest change, 0 if there is none."""
+    return Change.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def delta(since, kinds=None, limit=BATCH_SIZE):
+    """
+    The changes after the sequence number ``since`` of the ``kinds`` (all
+    if not given), at most ``limit`` of them, as a dict with the sequence
+    number to continue from (``cursor``), whether there are more changes
+    (``more``) and per kind the ``saved`` objects and ``deleted`` ids.
+    """
+    kinds = [kind for kind in models if kinds is None or kind in kinds]
+    queryset = Change.objects.filter(pk__gt=since).order_by('pk')
+    if len(kinds) < len(models):
+        queryset = queryset.filter(kind__in=kinds)
+    if settings.CHANGES_DELAY:
+        queryset = queryset.filter(date__lt=timezone.now() - timedelta(seconds=settings.CHANGES_DELAY))
+    rows = list(queryset.values_list('pk', 'kind', 'object_id', 'action')[:limit])
+
+    last = {}
+    for pk, kind, object_id, action in rows:
+        last[kind, object_id] = action
+
+    changes = {}
+    for kind in kinds:
+        saved = [object_id for (k, object_id), action in last.items() if k == kind and action == SAVED]
+        deleted = {object_id for (k, object_id), action in last.items() if k == kind and action == DELETED}
+        objects = list(models[kind].objects.filter(pk__in=saved).order_by('pk').values(*fields[kind]))
+        # Objects deleted after the last change read here
+        deleted.update(set(saved) - {obj['id'] for obj in objects})
+        changes[kind] = {'saved': objects, 'deleted': sorted(deleted)}
+
+    return {
+        'cursor': rows[-1][0] if rows else since,
+        'more': len(rows) == limit,
+        'changes': changes,
+    }
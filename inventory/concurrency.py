@@ -0,0 +1,128 @@
+"""
+Concurrency benchmark of the database.
+
+``threads`` threads use the database at the same time for ``seconds``
+seconds, each with its own connection like the worker threads of a web
+server. Every operation either reads what a location page reads or writes
+like the edit views do: it loads an item, changes it and saves it in a
+transaction. The report has the operations per second, their latencies
+and how many failed with an OperationalError ("database is locked").
+
+Run it with and without the SQLite profile (INVENTORY_DB_SQLITE_PROFILE)
+and compare the reports. The items written are created in the biggest
+location for the run and deleted afterwards.
+"""
+
+import random
+import threading
+import time
+
+from django.db import OperationalError, connection, transaction
+
+from .benchmark import percentile
+from .models import Item, Location, Category
+
+THREADS = 8
+SECONDS = 10
+WRITE_RATIO = 0.2
+ITEMS_PER_THREAD = 4
+
+
+def read(location):
+    list(Item.objects.active().for_list().filter(location=location).order_by('name', 'pk')[:10])
+    list(location.get_descendants().active().for_list()[:50])
+
+
+def write(pk):
+    with transaction.atomic():
+        item = Item.objects.get(pk=pk)
+        item.amount += 1
+        item.save()
+
+
+def worker(deadline, location, pks, write_ratio, seed, results):
+    rng = random.Random(seed)
+    timings = {'read': [], 'write': []}
+    errors = 0
+    try:
+        while time.perf_counter() < deadline:
+            kind = 'write' if rng.random() < write_ratio else 'read'
+            start = time.perf_counter()
+            try:
+                if kind == 'write':
+                    write(rng.choice(pks))
+                else:
+                    read(location)
+            except OperationalError:
+                errors += 1
+                continue
+            timings[kind].append(time.perf_counter() - start)
+    finally:
+        connection.close()
+    results.append((timings, errors))
+
+
+def summary(timings, seconds):
+    if not timings:
+        return {'count': 0, 'per_second': 0, 'p50_ms': None, 'p95_ms': None}
+    return {
+        'count': len(timings),
+        'per_second': round(len(timings) / seconds, 1),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+    }
+
+
+def run(threads=THREADS, seconds=SECONDS, write_ratio=WRITE_RATIO):
+    """Run the benchmark, returns the JSON report."""
+    location = Location.objects.filter(state='d').order_by('-subtree_item_count', 'pk').first()
+    category = Category.objects.order_by('pk').first()
+    pks = [Item.objects.create(name="Concurrency benchmark {}".format(n), description="", amount=0,
+                               location=location, category=category).pk
+           for n in range(threads * ITEMS_PER_THREAD)]
+    results = []
+    try:
+        deadline = time.perf_counter() + seconds
+        workers = [threading.Thread(target=worker, args=(deadline, location, pks, write_ratio, n, results))
+                   for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        for item in Item.objects.filter(pk__in=pks):
+            item.delete()
+
+    journal_mode = None
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+    timings = {'read': [], 'write': []}
+    for result, errors in results:
+        for kind in timings:
+            timings[kind].extend(result[kind])
+    return {
+        'threads': threads,
+        'seconds': seconds,
+        'write_ratio': write_ratio,
+        'vendor': connection.vendor,
+        'journal_mode': journal_mode,
+        'transaction_mode': connection.settings_dict['OPTIONS'].get('transaction_mode'),
+        'per_second': round(sum(len(t) for t in timings.values()) / seconds, 1),
+        'errors': sum(errors for result, errors in results),
+        'read': summary(timings['read'], seconds),
+        'write': summary(timings['write'], seconds),
+    }
+
+
+def compare(old, new):
+    """Lines comparing two reports of run()."""
+    lines = ["{:<18} {:>10} -> {:>10}".format('', 'before', 'after'),
+             "{:<18} {:>10} -> {:>10}".format('ops/s', old['per_second'], new['per_second']),
+             "{:<18} {:>10} -> {:>10}".format('errors', old['errors'], new['errors'])]
+    for kind in ('read', 'write'):
+        for key in ('per_second', 'p50_ms', 'p95_ms'):
+            lines.append("{:<18} {:>10} -> {:>10}".format('{} {}'.format(kind, key.replace('_', ' ')),
+                                                         str(old[kind][key]), str(new[kind][key])))
+    return lines
@@ -0,0 +1,51 @@
+"""
+Conditional GET for pages polled by scanners and dashboards.
+
+A page gets an ETag made of the versions of the data it shows: the change
+dates of the objects on detail pages and the cache versions (see cache.py)
+of the trees and lists on list pages, plus everything else the page
+depends on (query string, language, user and CSRF cookie). If the client
+already has that version, it gets a 304 before any list is queried or any
+template rendered. Cache-Control: no-cache makes browsers ask every time
+instead of guessing how long a page stays fresh.
+
+Pages read from a replica get no ETag, so clients only keep versions read
+from the primary, never one of a replica which lags behind.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from . import routers
+
+
+def etag(request, *parts):
+    """ETag of the versions ``parts`` of a page for ``request``."""
+    parts = parts + (request.get_full_path(), get_language(), request.user.pk,
+                     request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def respond(request, response, etag=None, last_modified=None):
+    """
+    304 Not Modified if the client has the version ``etag`` or a version
+    not older than ``last_modified`` (a datetime), otherwise the result of
+    ``response()``, with both as headers. Without the ETag if the request
+    reads from a replica.
+    """
+    if routers.replica.get() is not None:
+        etag = None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    result = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if result is None:
+        result = response()
+    if etag:
+        result.headers.setdefault('ETag', etag)
+    if timestamp is not None:
+        result.headers.setdefault('Last-Modified', http_date(timestamp))
+    patch_cache_control(result, private=True, no_cache=True)
+    return result
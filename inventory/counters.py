@@ -0,0 +1,177 @@
+"""
+Denormalized item counters of locations.
+
+Every location stores the number and the summed amount of the items stored
+directly in it and of the items stored anywhere in its subtree, and how
+much of its capacity is left. Only items
+in the default state are counted. Single item changes are applied
+incrementally to the location and its ancestors, and so are bulk changes
+of items in a few locations. Bulk changes of items in many locations and
+moved locations recount the affected trees. Every change of the counters
+invalidates the cached fragments of the tree.
+"""
+
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import cache
+from .models import Item, Location
+
+BATCH_SIZE = 1000
+# Number of locations from which add_rows() recounts whole trees
+RECOUNT_THRESHOLD = 100
+
+
+def contribution(location_id, state, amount):
+    """What an item with these values adds to the counters of its location."""
+    if location_id is None or state != 'd':
+        return None
+    return (location_id, 1, amount)
+
+
+def apply(old, new):
+    """
+    Move an item's contribution from ``old`` to ``new``, both as returned
+    by contribution().
+    """
+    if old == new:
+        return
+    if old is not None:
+        add(old[0], -old[1], -old[2])
+    if new is not None:
+        add(*new)
+
+
+def add(location_id, count, amount):
+    """Add ``count`` items with a total of ``amount`` to a location."""
+    node = Location.objects.filter(pk=location_id).values('tree_id', 'lft', 'rght').first()
+    if node is None:
+        return
+    Location.objects.filter(pk=location_id).update(
+        # Before item_amount, MySQL evaluates the assignments in order
+        free_capacity=F('capacity') - F('item_amount') - amount,
+        item_count=F('item_count') + count,
+        item_amount=F('item_amount') + amount)
+    Location.objects.filter(tree_id=node['tree_id'], lft__lte=node['lft'], rght__gte=node['rght']).update(
+        subtree_item_count=F('subtree_item_count') + count,
+        subtree_item_amount=F('subtree_item_amount') + amount)
+    cache.bump_trees(Location, [node['tree_id']])
+
+
+def item_rows(queryset, sign=1):
+    """
+    Number and summed amount of the items of ``queryset`` per location,
+    negative with ``sign=-1``, read with one aggregate. Items without a
+    location are left out, the state is up to the caller.
+    """
+    return [dict(row, count=sign * row['count'], amount=sign * row['amount'])
+            for row in queryset.filter(location__isnull=False).order_by().values('location')
+            .annotate(count=Count('pk'), amount=Coalesce(Sum('amount'), 0))]
+
+
+def add_rows(rows):
+    """
+    Add the rows of item_rows() to their locations and their ancestors,
+    with two UPDATE statements. Rows of many locations recount the affected
+    trees instead.
+    """
+    deltas = {row['location']: (row['count'], row['amount']) for row in rows if row['count'] or row['amount']}
+    if len(deltas) > RECOUNT_THRESHOLD:
+        recount(Location.objects.filter(pk__in=deltas).order_by().values_list('tree_id', flat=True).distinct())
+        return
+    if not deltas:
+        return
+    nodes = list(Location.objects.filter(pk__in=deltas).values('pk', 'tree_id', 'lft', 'rght'))
+    condition = Q(pk__in=[])
+    for node in nodes:
+        condition |= Q(tree_id=node['tree_id'], lft__lte=node['lft'], rght__gte=node['rght'])
+    # Every ancestor gets the deltas of the locations in its subtree
+    subtree = {}
+    for ancestor in Location.objects.filter(condition).values('pk', 'tree_id', 'lft', 'rght'):
+        inside = [deltas[node['pk']] for node in nodes
+                  if node['tree_id'] == ancestor['tree_id'] and ancestor['lft'] <= node['lft'] <= ancestor['rght']]
+        subtree[ancestor['pk']] = (sum(count for count, amount in inside), sum(amount for count, amount in inside))
+
+    Location.objects.filter(pk__in=deltas).update(
+        # Before item_amount, MySQL evaluates the assignments in order
+        free_capacity=F('capacity') - F('item_amount') - _by_pk(deltas, 1),
+        item_count=F('item_count') + _by_pk(deltas, 0),
+        item_amount=F('item_amount') + _by_pk(deltas, 1))
+    Location.objects.filter(pk__in=subtree).update(
+        subtree_item_count=F('subtree_item_count') + _by_pk(subtree, 0),
+        subtree_item_amount=F('subtree_item_amount') + _by_pk(subtree, 1))
+    cache.bump_trees(Location, [node['tree_id'] for node in nodes])
+
+
+def _by_pk(values, index):
+    """Expression for the element ``index`` of the tuples ``values`` by pk."""
+    return Case(*[When(pk=pk, then=Value(value[index])) for pk, value in values.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+def add_items(queryset):
+    """Add the contribution of newly created items to their locations."""
+    add_rows(item_rows(queryset.filter(state='d')))
+
+
+def subtree_totals(location):
+    """
+    Count the items below ``location`` (including the location itself)
+    with one query over its lft/rght range.
+    """
+    totals = Item.objects.filter(state='d',
+                                 location__tree_id=location.tree_id,
+                                 location__lft__gte=location.lft,
+                                 location__lft__lte=location.rght).aggregate(
+        count=Count('pk'), amount=Coalesce(Sum('amount'), 0))
+    return totals['count'], totals['amount']
+
+
+def recount(tree_ids=None):
+    """
+    Recompute the counters of all locations in the given trees (all trees
+    if ``tree_ids`` is None). Reads one aggregate per tree, accumulates the
+    subtree totals in lft order and only writes back locations whose
+    counters changed.
+    """
+    if tree_ids is None:
+        tree_ids = Location.objects.values_list('tree_id', flat=True).distinct()
+    for tree_id in set(tree_ids):
+        _recount_tree(tree_id)
+
+
+def _recount_tree(tree_id):
+    direct = {row['location']: (row['count'], row['amount']) for row in
+              Item.objects.filter(state='d', location__tree_id=tree_id)
+              .order_by().values('location')
+              .annotate(count=Count('pk'), amount=Coalesce(Sum('amount'), 0))}
+
+    nodes = list(Location.objects.filter(tree_id=tree_id).order_by('lft').only(
+        'pk', 'lft', 'rght', 'capacity', *Location.counter_fields))
+    totals = {node.pk: list(direct.get(node.pk, (0, 0))) for node in nodes}
+    # Walk the nodes in reverse lft order, so every child is finished
+    # before its totals are added to its parent.
+    stack = []
+    for node in reversed(nodes):
+        while stack and stack[-1].lft < node.rght:
+            child = stack.pop()
+            totals[node.pk][0] += totals[child.pk][0]
+            totals[node.pk][1] += totals[child.pk][1]
+        stack.append(node)
+
+    changed = []
+    for node in nodes:
+        count, amount = direct.get(node.pk, (0, 0))
+        subtree_count, subtree_amount = totals[node.pk]
+        free = node.capacity - amount if node.capacity is not None else None
+        if (node.item_count, node.item_amount, node.subtree_item_count, node.subtree_item_amount,
+                node.free_capacity) != (count, amount, subtree_count, subtree_amount, free):
+            node.item_count = count
+            node.item_amount = amount
+            node.subtree_item_count = subtree_count
+            node.subtree_item_amount = subtree_amount
+            node.free_capacity = free
+            changed.append(node)
+    Location.objects.bulk_update(changed, Location.counter_fields, batch_size=BATCH_SIZE)
+    if changed:
+        cache.bump_trees(Location, [tree_id])
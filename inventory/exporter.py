@@ -0,0 +1,129 @@
+"""
+Streaming export of items, locations and categories as CSV or JSON lines.
+
+Rows are read in batches ordered by primary key (keyset pagination) and
+written out as soon as they are read, so neither the database driver nor
+the application ever holds a whole table in memory. Locations and
+categories are exported with their full paths, items with the paths of
+their location and category, which is the format import_items reads.
+"""
+
+import csv
+import json
+from uuid import UUID
+
+from .models import Location, Category
+from .search import searchable as models
+from . import tree
+
+CHUNK_SIZE = 2000
+
+columns = {
+    'item': ['id', 'name', 'description', 'amount', 'location', 'category', 'barcode', 'state',
+             'lent', 'lent_to', 'lent_date', 'creation_date', 'change_date'],
+    'location': ['id', 'path', 'name', 'description', 'uuid', 'free_space', 'state',
+                 'creation_date', 'change_date'],
+    'category': ['id', 'path', 'name', 'description', 'state', 'creation_date', 'change_date'],
+}
+
+
+def subtree(queryset, prefix, node):
+    """Restrict ``queryset`` to the subtree of ``node`` through the field ``prefix``."""
+    return queryset.filter(tree.subtrees([node], prefix))
+
+
+def queryset(kind, state=None, location=None, category=None):
+    """
+    Rows to export. ``location`` and ``category`` restrict items to the
+    subtrees of these nodes, and locations or categories to their own
+    subtree.
+    """
+    qs = models[kind].objects.all()
+    if state:
+        qs = qs.filter(state=state)
+    if kind == 'item':
+        if location is not None:
+            qs = subtree(qs, 'location__', location)
+        if category is not None:
+            qs = subtree(qs, 'category__', category)
+    elif kind == 'location' and location is not None:
+        qs = subtree(qs, '', location)
+    elif kind == 'category' and category is not None:
+        qs = subtree(qs, '', category)
+    return qs
+
+
+def rows(kind, qs, chunk_size=CHUNK_SIZE, location=None, category=None):
+    """
+    Yield one dict per object of ``qs``, with the columns of ``kind``.
+    ``qs`` must be restricted to the subtrees of ``location`` and
+    ``category``, if given: only their paths are read.
+    """
+    if kind == 'item':
+        locations = tree.paths(Location, location)
+        categories = tree.paths(Category, category)
+        fields = [c if c not in ('location', 'category') else c + '_id' for c in columns[kind]]
+    else:
+        paths = tree.paths(models[kind], location if kind == 'location' else category)
+        fields = [c for c in columns[kind] if c != 'path']
+
+    last = None
+    while True:
+        batch = qs.order_by('pk')
+        if last is not None:
+            batch = batch.filter(pk__gt=last)
+        batch = list(batch.values(*fields)[:chunk_size])
+        for row in batch:
+            if kind == 'item':
+                row['location'] = locations.get(row.pop('location_id'), '')
+                row['category'] = categories.get(row.pop('category_id'), '')
+            else:
+                row['path'] = paths.get(row['id'], '')
+            yield row
+        if len(batch) < chunk_size:
+            return
+        last = batch[-1]['id']
+
+
+class Echo:
+    """File-like object which returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def _value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def to_csv(kind, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns[kind])
+    for row in rows:
+        yield writer.writerow([_value(row[c]) for c in columns[kind]])
+
+
+def to_jsonl(kind, rows):
+    for row in rows:
+        yield json.dumps({c: _value(row[c]) for c in columns[kind]}) + '\n'
+
+
+writers = {
+    'csv': to_csv,
+    'jsonl': to_jsonl,
+}
+
+content_types = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def export(kind, format, chunk_size=CHUNK_SIZE, state=None, location=None, category=None):
+    """Generator of text chunks exporting ``kind`` in ``format``."""
+    qs = queryset(kind, state=state, location=location, category=category)
+    return writers[format](kind, rows(kind, qs, chunk_size, location=location, category=category))
@@ -1,7 +1,9 @@
 from django import forms
+from django.core.exceptions import ValidationError
 from django.utils.translation import gettext as _
 
-from .models import Item, Location, Category
+from .models import Item, Location, Category, Loan, ITEM_STATES
+from . import labels, tree
 
 class ItemEditForm(forms.ModelForm):
 
@@ -21,15 +23,18 @@ class ItemEditForm(forms.ModelForm):
 class ItemLendForm(forms.ModelForm):
 
     class Meta:
-        model = Item
-        fields = ['lent_to']
+        model = Loan
+        fields = ['borrower', 'due_date']
+        widgets = {
+            'due_date': forms.DateInput(attrs={'type': 'date'}),
+        }
 
         
 class LocationEditForm(forms.ModelForm):
 
     class Meta:
         model = Location
-        fields = ['name', 'description', 'parent']
+        fields = ['name', 'description', 'parent', 'free_space', 'capacity']
 
 
 class CategoryEditForm(forms.ModelForm):
@@ -43,3 +48,77 @@ class LocationUuidEditForm(forms.ModelForm):
     class Meta:
         model = Location
         fields = ['uuid']
+
+
+class TreeNodeField(forms.CharField):
+    """
+    A node of ``queryset`` given by primary key, path or location UUID (see
+    tree.resolve), instead of a select with every node of the tree.
+    """
+
+    def __init__(self, queryset, **kwargs):
+        super().__init__(**kwargs)
+        self.queryset = queryset
+
+    @property
+    def queryset(self):
+        return self._queryset
+
+    @queryset.setter
+    def queryset(self, queryset):
+        self._queryset = queryset
+        if queryset.model is Location:
+            self.help_text = _("Primary key, path or UUID, e.g. %(example)s") % {'example': 'Universe/Shelf 1'}
+        else:
+            self.help_text = _("Primary key or path, e.g. %(example)s") % {'example': 'Everything/Cables'}
+
+    def prepare_value(self, value):
+        return value.pk if isinstance(value, self.queryset.model) else value
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if value in self.empty_values:
+            return None
+        node = tree.resolve(self.queryset.model, value)
+        if node is None or not self.queryset.filter(pk=node.pk).exists():
+            raise ValidationError(_("Unknown %(model)s '%(value)s'"), code='invalid',
+                                  params={'model': self.queryset.model._meta.verbose_name, 'value': value})
+        return node
+
+
+class ItemImportForm(forms.Form):
+    file = forms.FileField(label=_("File"))
+    format = forms.ChoiceField(label=_("Format"), choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')])
+    chunk_size = forms.IntegerField(label=_("Chunk size"), initial=1000, min_value=1, max_value=10000)
+
+
+class ExportForm(forms.Form):
+    type = forms.ChoiceField(label=_("Type"), choices=[('item', _("Items")), ('location', _("Locations")), ('category', _("Categories"))])
+    format = forms.ChoiceField(label=_("Format"), choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')])
+    state = forms.ChoiceField(label=_("State"), required=False, choices=[('', _("All"))] + list(ITEM_STATES))
+    location = TreeNodeField(Location.objects.all(), label=_("Location"), required=False)
+    category = TreeNodeField(Category.objects.all(), label=_("Category"), required=False)
+
+
+class LabelSheetForm(forms.Form):
+    layout = forms.ChoiceField(label=_("Layout"),
+                               choices=[(name, layout['title']) for name, layout in labels.LAYOUTS.items()],
+                               widget=forms.Select(attrs={'class': 'form-control form-control-sm'}))
+    format = forms.ChoiceField(label=_("Format"), choices=[('pdf', 'PDF'), ('svg', 'SVG')],
+                               widget=forms.Select(attrs={'class': 'form-control form-control-sm ml-2'}))
+
+
+class FreeSlotForm(forms.Form):
+    amount = forms.IntegerField(label=_("Amount"), required=False, min_value=1)
+    location = forms.ModelChoiceField(queryset=Location.objects.all(), required=False, widget=forms.HiddenInput)
+
+
+class MoveForm(forms.Form):
+    nodes = forms.ModelMultipleChoiceField(label=_("Move"), queryset=Location.objects.none(),
+                                           widget=forms.CheckboxSelectMultiple)
+    target = TreeNodeField(Location.objects.none(), label=_("To"))
+
+    def __init__(self, *args, nodes, targets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['nodes'].queryset = nodes
+        self.fields['target'].queryset = targets
@@ -0,0 +1,172 @@
+"""
+Streaming item import from CSV or JSON lines.
+
+Rows are read one at a time and written in chunks with bulk_create, every
+chunk in its own transaction, so memory use does not depend on the size of
+the input. Locations and categories are resolved through lookup maps which
+are built once per import: locations by path ("Universe/Shelf 1/Bin 3") or
+UUID, categories by path.
+"""
+
+import csv
+import json
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import tree
+from .models import Item, Location, Category
+from .signals import bulk_saved
+from .tree import PATH_SEPARATOR
+
+CHUNK_SIZE = 1000
+FIELDS = ['name', 'description', 'amount', 'location', 'category', 'barcode']
+# Locations and categories are validated by the lookup maps
+VALIDATED = ['name', 'description', 'amount', 'barcode']
+
+
+def lookup(model):
+    """Map the lower case path of every node of ``model`` to its pk."""
+    result = {}
+    for pk, path in tree.paths(model).items():
+        result.setdefault(path.lower(), pk)
+    return result
+
+
+def read_csv(stream):
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+        yield line, row
+
+
+def read_jsonl(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, e
+            continue
+        yield line, row
+
+
+def describe(error):
+    if hasattr(error, 'error_dict'):
+        return '; '.join('{}: {}'.format(field, ' '.join(messages))
+                         for field, messages in error.message_dict.items())
+    return '; '.join(error.messages)
+
+
+readers = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+class ItemImporter:
+
+    def __init__(self, chunk_size=CHUNK_SIZE, default_category=None, dry_run=False):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.locations = lookup(Location)
+        self.location_uuids = {str(uuid): pk for pk, uuid in
+                               Location.objects.filter(uuid__isnull=False).values_list('pk', 'uuid')}
+        self.categories = lookup(Category)
+        self.default_category = default_category
+        self.imported = 0
+        self.failed = 0
+
+    def resolve_location(self, value):
+        value = str(value or '').strip()
+        try:
+            return self.location_uuids[str(UUID(value))]
+        except (ValueError, KeyError):
+            pass
+        try:
+            return self.locations[value.strip(PATH_SEPARATOR).lower()]
+        except KeyError:
+            raise ValidationError("Unknown location '{}'".format(value))
+
+    def resolve_category(self, value):
+        value = str(value or '').strip()
+        if not value and self.default_category is not None:
+            return self.default_category
+        try:
+            return self.categories[value.strip(PATH_SEPARATOR).lower()]
+        except KeyError:
+            raise ValidationError("Unknown category '{}'".format(value))
+
+    def build(self, row):
+        if not isinstance(row, dict):
+            raise ValidationError("Row must be an object")
+        item = Item(name=str(row.get('name') or '').strip(),
+                    description=str(row.get('description') or ''),
+                    location_id=self.resolve_location(row.get('location')),
+                    category_id=self.resolve_category(row.get('category')))
+        if row.get('amount') not in (None, ''):
+            item.amount = row['amount']
+        if row.get('barcode') not in (None, ''):
+            item.barcode = row['barcode']
+        item.full_clean(exclude=[f.name for f in Item._meta.fields if f.name not in VALIDATED],
+                        validate_unique=False)
+        return item
+
+    def run(self, stream, format, on_error=None):
+        """
+        Import all rows of ``stream``. ``on_error(line, message)`` is called
+        for every row which could not be imported.
+        """
+        if format not in readers:
+            raise ValueError("Unknown format '{}'".format(format))
+        chunk = []
+        for line, row in readers[format](stream):
+            try:
+                if isinstance(row, Exception):
+                    raise ValidationError(str(row))
+                chunk.append(self.build(row))
+            except ValidationError as e:
+                self.failed += 1
+                if on_error is not None:
+                    on_error(line, describe(e))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk)
+                chunk = []
+        self.write(chunk)
+        return self.imported, self.failed
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        if not self.dry_run:
+            stamp = timezone.now()
+            with transaction.atomic():
+                for item in chunk:
+                    item.creation_date = stamp
+                returns_pks = connection.features.can_return_rows_from_bulk_insert
+                if not returns_pks:
+                    last = Item.objects.aggregate(last=Max('pk'))['last'] or 0
+                Item.objects.bulk_create(chunk, batch_size=self.chunk_size)
+                if returns_pks:
+                    created = Item.objects.filter(pk__in=[item.pk for item in chunk])
+                else:
+                    created = created_items(chunk, stamp, last)
+                bulk_saved.send(sender=Item, queryset=created, created=True)
+        self.imported += len(chunk)
+
+
+def created_items(chunk, stamp, last):
+    """
+    The items of ``chunk`` after they were inserted by a database which does
+    not return the new primary keys: the ones newer than the primary key
+    ``last``, created at ``stamp`` with the name, location and barcode of
+    one of them. A concurrent import with the same timestamp only matches
+    if it imports the same items.
+    """
+    query = Q()
+    for name, location, barcode in {(item.name, item.location_id, item.barcode) for item in chunk}:
+        query |= Q(name=name, location_id=location, barcode=barcode)
+    return Item.objects.filter(query, pk__gt=last, creation_date=stamp)
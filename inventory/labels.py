@@ -0,0 +1,247 @@
+"""
+Label sheets of the print list as PDF or SVG.
+
+A layout describes a sheet of labels (page size, label size, columns and
+rows, position of the first label, gaps between labels, all in mm). Every
+label gets the QR code of the location's UUID (see barcodes.py) and its
+name.
+
+Sheets are streamed page by page, so thousands of locations never sit in
+memory at once. The print list is read in the order the locations were
+added (the id of the through table), so adding a location only changes
+the last page. Every rendered page is cached under a hash of its layout
+and its locations; pages which did not change come from the cache.
+
+The PDF is written directly: one uncompressed object per page and a
+Flate-compressed content stream with the built-in Helvetica font, so no
+PDF library is needed. PDFs have pages; the SVG stacks the pages below each
+other in one document.
+"""
+
+import hashlib
+import zlib
+from xml.sax.saxutils import escape
+
+import segno
+from django.core.cache import cache
+
+from .models import LocationPrintList
+
+TIMEOUT = 30 * 24 * 60 * 60
+# Pages read from the database at once
+CHUNK_PAGES = 10
+# Space between label edge and content, and between stacked SVG pages, in mm
+PADDING = 2
+PAGE_GAP = 10
+PT_PER_MM = 72 / 25.4
+
+LAYOUTS = {
+    'a4-3x8': {
+        'title': "A4, 3 × 8 labels, 70 × 37 mm",
+        'page': (210, 297), 'label': (70, 37), 'grid': (3, 8), 'origin': (0, 0.5), 'gap': (0, 0),
+    },
+    'a4-5x13': {
+        'title': "A4, 5 × 13 labels, 38.1 × 21.2 mm",
+        'page': (210, 297), 'label': (38.1, 21.2), 'grid': (5, 13), 'origin': (4.65, 10.7), 'gap': (2.5, 0),
+    },
+    'letter-3x10': {
+        'title': "Letter, 3 × 10 labels, 66.7 × 25.4 mm",
+        'page': (215.9, 279.4), 'label': (66.7, 25.4), 'grid': (3, 10), 'origin': (4.8, 12.7), 'gap': (3.2, 0),
+    },
+}
+
+content_types = {
+    'pdf': 'application/pdf',
+    'svg': 'image/svg+xml',
+}
+
+
+def per_page(layout):
+    columns, rows = layout['grid']
+    return columns * rows
+
+
+def page_count(print_list, layout):
+    return -(-print_list.locations.count() // per_page(layout))
+
+
+def pages(print_list, layout):
+    """Yield the locations of every page as lists of (pk, name, uuid), in the order they were added."""
+    through = LocationPrintList.locations.through.objects.filter(locationprintlist=print_list)
+    size = per_page(layout)
+    last = 0
+    while True:
+        rows = list(through.filter(id__gt=last).order_by('id')
+                    .values_list('id', 'location_id', 'location__name', 'location__uuid')[:size * CHUNK_PAGES])
+        for start in range(0, len(rows), size):
+            yield [(pk, name, str(uuid) if uuid else '') for id, pk, name, uuid in rows[start:start + size]]
+        if len(rows) < size * CHUNK_PAGES:
+            return
+        last = rows[-1][0]
+
+
+def positions(layout):
+    """Top left corner of every label of a page, row by row."""
+    columns, rows = layout['grid']
+    width, height = layout['label']
+    x0, y0 = layout['origin']
+    gap_x, gap_y = layout['gap']
+    return [(x0 + column * (width + gap_x), y0 + row * (height + gap_y))
+            for row in range(rows) for column in range(columns)]
+
+
+def runs(text):
+    """Dark modules of the QR code of ``text`` as (row, column, length) runs, and the number of modules per side."""
+    matrix = segno.make_qr(text, error='m').matrix
+    result = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                result.append((y, start, x - start))
+            else:
+                x += 1
+    return result, len(matrix)
+
+
+def fit(name, width, size):
+    """``name`` shortened to about ``width`` mm in a font of ``size`` mm."""
+    chars = max(1, int(width / (size * 0.55)))
+    return name if len(name) <= chars else name[:chars - 1] + '…'
+
+
+def label_parts(layout, x, y, name, uuid):
+    """QR code runs with their module size and position, and the text of one label."""
+    width, height = layout['label']
+    code = height - 2 * PADDING
+    size = min(3.0, height / 6)
+    text_x = x + PADDING + (code + PADDING if uuid else 0)
+    text = fit(name, x + width - PADDING - text_x, size)
+    qr = None
+    if uuid:
+        modules, count = runs(uuid)
+        qr = (modules, code / count, x + PADDING, y + PADDING)
+    return qr, (text_x, y + height / 2 + size / 3, size, text)
+
+
+def _number(value):
+    return ('%.3f' % value).rstrip('0').rstrip('.')
+
+
+def pdf_page(layout, locations):
+    """Compressed PDF content stream of one page."""
+    ops = ['{} 0 0 {} 0 {} cm'.format(_number(PT_PER_MM), _number(-PT_PER_MM),
+                                       _number(layout['page'][1] * PT_PER_MM))]
+    for (x, y), (pk, name, uuid) in zip(positions(layout), locations):
+        qr, (text_x, text_y, size, text) = label_parts(layout, x, y, name, uuid)
+        if qr:
+            modules, module, left, top = qr
+            ops.extend('{} {} {} {} re'.format(_number(left + column * module), _number(top + row * module),
+                                              _number(length * module), _number(module))
+                       for row, column, length in modules)
+            ops.append('f')
+        text = text.replace('…', '...').replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        # The text matrix flips the text back upright
+        ops.append('BT /F1 {} Tf 1 0 0 -1 {} {} Tm ({}) Tj ET'.format(
+            _number(size), _number(text_x), _number(text_y), text))
+    return zlib.compress('\n'.join(ops).encode('cp1252', errors='replace'))
+
+
+def svg_page(layout, locations):
+    """SVG elements of one page, in mm."""
+    elements = []
+    for (x, y), (pk, name, uuid) in zip(positions(layout), locations):
+        qr, (text_x, text_y, size, text) = label_parts(layout, x, y, name, uuid)
+        if qr:
+            modules, module, left, top = qr
+            elements.append('<path d="{}"/>'.format(''.join(
+                'M{} {}h{}v{}h-{}z'.format(_number(left + column * module), _number(top + row * module),
+                                           _number(length * module), _number(module), _number(length * module))
+                for row, column, length in modules)))
+        elements.append('<text x="{}" y="{}" font-size="{}">{}</text>'.format(
+            _number(text_x), _number(text_y), _number(size), escape(text)))
+    return '\n'.join(elements)
+
+
+renderers = {
+    'pdf': pdf_page,
+    'svg': svg_page,
+}
+
+
+def render_page(format, name, locations):
+    """Rendered page, from the cache if this page was rendered before."""
+    layout = LAYOUTS[name]
+    key = 'inventory:labels:' + hashlib.sha256(
+        repr((format, sorted(layout.items()), PADDING, locations)).encode()).hexdigest()
+    page = cache.get(key)
+    if page is None:
+        page = renderers[format](layout, locations)
+        cache.set(key, page, TIMEOUT)
+    return page
+
+
+def pdf(print_list, name):
+    """Generator of the bytes of the PDF label sheet of ``print_list``."""
+    layout = LAYOUTS[name]
+    count = max(1, page_count(print_list, layout))
+    width, height = (_number(side * PT_PER_MM) for side in layout['page'])
+    offsets = []
+    position = 0
+
+    def write(number, body):
+        nonlocal position
+        offsets.append(position)
+        data = '{} 0 obj\n'.format(number).encode() + body + b'\nendobj\n'
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+    yield write(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = ' '.join('{} 0 R'.format(4 + 2 * i) for i in range(count))
+    yield write(2, '<< /Type /Pages /Kids [{}] /Count {} /MediaBox [0 0 {} {}] >>'.format(
+        kids, count, width, height).encode())
+    yield write(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+
+    locations_of_pages = pages(print_list, layout)
+    for i in range(count):
+        content = render_page('pdf', name, next(locations_of_pages, []))
+        yield write(4 + 2 * i, '<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 3 0 R >> >> '
+                               '/Contents {} 0 R >>'.format(5 + 2 * i).encode())
+        yield write(5 + 2 * i, '<< /Length {} /Filter /FlateDecode >>\nstream\n'.format(len(content)).encode()
+                    + content + b'\nendstream')
+
+    xref = ['xref', '0 {}'.format(len(offsets) + 1), '0000000000 65535 f ']
+    xref.extend('{:010d} 00000 n '.format(offset) for offset in offsets)
+    yield ('\n'.join(xref) + '\ntrailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'.format(
+        len(offsets) + 1, position)).encode()
+
+
+def svg(print_list, name):
+    """Generator of the text of the SVG label sheet of ``print_list``."""
+    layout = LAYOUTS[name]
+    count = max(1, page_count(print_list, layout))
+    width, height = layout['page']
+    total = count * height + (count - 1) * PAGE_GAP
+    yield ('<svg xmlns="http://www.w3.org/2000/svg" width="{w}mm" height="{t}mm" viewBox="0 0 {w} {t}" '
+           'font-family="Helvetica, Arial, sans-serif">\n').format(w=_number(width), t=_number(total))
+    locations_of_pages = pages(print_list, layout)
+    for i in range(count):
+        page = render_page('svg', name, next(locations_of_pages, []))
+        yield '<svg y="{}" width="{w}" height="{h}" viewBox="0 0 {w} {h}">\n'.format(
+            _number(i * (height + PAGE_GAP)), w=_number(width), h=_number(height))
+        yield '<rect width="{}" height="{}" fill="#fff" stroke="#ccc" stroke-width="0.2"/>\n'.format(
+            _number(width), _number(height))
+        yield page + '\n</svg>\n'
+    yield '</svg>\n'
+
+
+writers = {
+    'pdf': pdf,
+    'svg': svg,
+}
@@ -0,0 +1,39 @@
+"""
+Lending items.
+
+Every lending is recorded as a Loan, so the history of an item and of a
+borrower is kept. The lent, lent_to and lent_date fields of the item mirror
+its open loan for the item pages; they are written with QuerySet.update(),
+lending does not touch the search index or the counters. bulk_saved
+tells the change log about them.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Item, Loan
+from .signals import bulk_saved
+
+FIELDS = ['lent', 'lent_to', 'lent_date', 'change_date']
+
+
+def lend(item, borrower, due_date=None, user=None):
+    """Lend ``item`` to ``borrower``, closing a loan which is still open. Returns the new loan."""
+    now = timezone.now()
+    with transaction.atomic():
+        Loan.objects.filter(item=item).outstanding().update(returned_date=now)
+        loan = Loan.objects.create(item=item, borrower=borrower, lent_date=now, due_date=due_date, user=user)
+        Item.objects.filter(pk=item.pk).update(lent=True, lent_to=borrower, lent_date=now, change_date=now)
+        bulk_saved.send(sender=Item, queryset=Item.objects.filter(pk=item.pk), fields=FIELDS)
+    item.lent, item.lent_to, item.lent_date = True, borrower, now
+    return loan
+
+
+def give_back(item):
+    """Close the open loan of ``item``."""
+    with transaction.atomic():
+        now = timezone.now()
+        Loan.objects.filter(item=item).outstanding().update(returned_date=now)
+        Item.objects.filter(pk=item.pk).update(lent=False, lent_to="", lent_date=None, change_date=now)
+        bulk_saved.send(sender=Item, queryset=Item.objects.filter(pk=item.pk), fields=FIELDS)
+    item.lent, item.lent_to, item.lent_date = False, "", None
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from inventory import benchmark, concurrency
+
+
+class Command(BaseCommand):
+    help = ("Read and write the database from several threads at once and report the throughput, "
+            "latencies and 'database is locked' errors as JSON. Run it with and without the SQLite "
+            "profile (INVENTORY_DB_SQLITE_PROFILE=False) and compare the reports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=concurrency.THREADS)
+        parser.add_argument('--seconds', type=float, default=concurrency.SECONDS)
+        parser.add_argument('--write-ratio', type=float, default=concurrency.WRITE_RATIO,
+                            help="Share of the operations which write, default %(default)s")
+        parser.add_argument('--output', help="Write the report to this file instead of stdout")
+        parser.add_argument('--compare', help="Report of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        report = concurrency.run(options['threads'], options['seconds'], options['write_ratio'])
+
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        elif not options['compare']:
+            self.stdout.write(text)
+
+        if options['compare']:
+            for line in concurrency.compare(benchmark.load(options['compare']), report):
+                self.stdout.write(line)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import tree
+from inventory.models import Location
+
+
+class Command(BaseCommand):
+    help = ("Time the bulk creation of a location grid against creating the same "
+            "locations one by one. All created locations are rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shelves', type=int, default=100)
+        parser.add_argument('--bins', type=int, default=99,
+                            help="Bins per shelf, the default creates 10000 locations")
+        parser.add_argument('--loop', type=int, default=1000,
+                            help="Number of locations created one by one for comparison")
+
+    def handle(self, *args, **options):
+        levels = [("Shelf {n}", options['shelves']), ("Bin {n}", options['bins'])]
+        with transaction.atomic():
+            root = Location.objects.create(name="Benchmark", description="")
+            parent = Location.objects.create(name="Rack", description="", parent=root)
+            # Something to the right of the rack, so every insert has to shift nodes
+            Location.objects.create(name="Neighbour", description="", parent=root)
+
+            start = time.perf_counter()
+            count = tree.create_grid(parent, levels)
+            elapsed = time.perf_counter() - start
+            self.stdout.write("create_grid: {} locations in {:.2f}s ({:.3f}ms per location)".format(
+                count, elapsed, elapsed * 1000 / count))
+
+            start = time.perf_counter()
+            for i in range(options['loop']):
+                Location.objects.create(name="Bin {}".format(i + 1), description="", parent=parent)
+            elapsed = time.perf_counter() - start
+            self.stdout.write("objects.create: {} locations in {:.2f}s ({:.3f}ms per location)".format(
+                options['loop'], elapsed, elapsed * 1000 / options['loop']))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import search
+from inventory.models import Item, Location, Category
+from inventory.seed import vocabulary
+
+
+class Command(BaseCommand):
+    help = ("Compare the search index with the old icontains search on generated items. "
+            "All generated data is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--words', type=int, default=5000, help="Size of the vocabulary")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('terms', nargs='*', default=['screw', 'cable adapter', 'ttery', 'vexlu', '40063'])
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = vocabulary(rng, options['words'])
+        with transaction.atomic():
+            location = Location.objects.create(name="Benchmark", description="")
+            category = Category.objects.create(name="Benchmark", description="")
+            items = []
+            for i in range(options['items']):
+                name = ' '.join(rng.sample(words, 3))
+                items.append(Item(name=name,
+                                  description=' '.join(rng.sample(words, 8)),
+                                  barcode=rng.randrange(10**12, 10**13),
+                                  location=location,
+                                  category=category))
+            Item.objects.bulk_create(items, batch_size=1000)
+
+            start = time.perf_counter()
+            search.index_queryset(Item.objects.filter(location=location), replace=False)
+            self.stdout.write("Indexed {} items in {:.2f}s".format(options['items'], time.perf_counter() - start))
+
+            for term in options['terms']:
+                old = self.measure(options['repeat'], lambda: (
+                    lambda qs: (qs.count(), list(qs[:25])))(
+                        Item.objects.filter(name__icontains=term).order_by('name')))
+                new = self.measure(options['repeat'], lambda: (
+                    lambda results: (results.count(), results[:25]))(
+                        search.search('item', term)))
+                self.stdout.write("{!r:>16}: icontains {:8.2f}ms  index {:8.2f}ms".format(term, old, new))
+
+            transaction.set_rollback(True)
+
+    def measure(self, repeat, func):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
@@ -0,0 +1,43 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Request every view of the inventory app through the test client and report p50/p95 "
+            "latency and query counts per view as JSON. Generate data with seed_inventory first. "
+            "All changes made by the requests are rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('views', nargs='*', help="URL names of the views to benchmark, default all")
+        parser.add_argument('--repeat', type=int, default=benchmark.REPEAT)
+        parser.add_argument('--user', help="Username to request the views as, default a temporary superuser")
+        parser.add_argument('--output', help="Write the report to this file instead of stdout")
+        parser.add_argument('--compare', help="Report of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['user']:
+                try:
+                    user = User.objects.get(username=options['user'])
+                except User.DoesNotExist:
+                    raise CommandError("Unknown user '{}'".format(options['user']))
+            else:
+                user = User.objects.create_superuser('benchmark-views', '', None)
+            report = benchmark.run(user, options['repeat'], options['views'])
+            transaction.set_rollback(True)
+
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text + '\n')
+        elif not options['compare']:
+            self.stdout.write(text)
+
+        if options['compare']:
+            for line in benchmark.compare(benchmark.load(options['compare']), report):
+                self.stdout.write(line)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import exporter, tree
+from inventory.models import Location, Category, ITEM_STATES
+
+
+class Command(BaseCommand):
+    help = "Export items, locations or categories as CSV or JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('type', choices=sorted(exporter.columns))
+        parser.add_argument('--format', choices=sorted(exporter.writers), default='csv')
+        parser.add_argument('--output', '-o', help="Output file, stdout by default")
+        parser.add_argument('--state', choices=[s for s, name in ITEM_STATES])
+        parser.add_argument('--location',
+                            help="Only export the subtree of this location (pk, path or UUID)")
+        parser.add_argument('--category', help="Only export the subtree of this category (pk or path)")
+        parser.add_argument('--chunk-size', type=int, default=exporter.CHUNK_SIZE)
+
+    def node(self, model, value):
+        if not value:
+            return None
+        node = tree.resolve(model, value)
+        if node is None:
+            raise CommandError("No {} '{}'".format(model._meta.verbose_name, value))
+        return node
+
+    def handle(self, *args, **options):
+        location = self.node(Location, options['location'])
+        category = self.node(Category, options['category'])
+
+        chunks = exporter.export(options['type'], options['format'], options['chunk_size'],
+                                 state=options['state'], location=location, category=category)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
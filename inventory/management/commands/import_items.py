@@ -0,0 +1,54 @@
+import io
+import os
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import importer
+
+
+class Command(BaseCommand):
+    help = ("Import items from a CSV file or a JSON lines file. Columns/keys: "
+            + ", ".join(importer.FIELDS) + ". Locations are given by path or UUID, "
+            "categories by path, e.g. 'Universe/Shelf 1'.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="File to import, '-' reads from stdin")
+        parser.add_argument('--format', choices=sorted(importer.readers),
+                            help="Input format, guessed from the file extension by default")
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE)
+        parser.add_argument('--category', help="Category path for rows without a category")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the rows")
+
+    def handle(self, *args, **options):
+        format = options['format']
+        if format is None:
+            format = os.path.splitext(options['file'])[1].lstrip('.').lower()
+            if format not in importer.readers:
+                raise CommandError("Cannot guess the format of '{}', use --format".format(options['file']))
+
+        items = importer.ItemImporter(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        if options['category']:
+            try:
+                items.default_category = items.resolve_category(options['category'])
+            except ValidationError as e:
+                raise CommandError(e.messages[0])
+
+        def on_error(line, message):
+            self.stderr.write("Line {}: {}".format(line, message))
+
+        # utf-8-sig skips the byte order mark which Excel writes
+        try:
+            if options['file'] == '-':
+                imported, failed = items.run(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline=''),
+                                             format, on_error)
+            else:
+                with open(options['file'], encoding='utf-8-sig', newline='') as stream:
+                    imported, failed = items.run(stream, format, on_error)
+        except UnicodeDecodeError:
+            raise CommandError("'{}' is not UTF-8 encoded, {} item(s) were imported before the error".format(
+                options['file'], items.imported))
+
+        self.stdout.write("{} {} item(s), {} failed".format(
+            "Validated" if options['dry_run'] else "Imported", imported, failed))
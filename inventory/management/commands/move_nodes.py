@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory import tree
+from inventory.models import Location, Category
+
+MODELS = {'location': Location, 'category': Category}
+
+
+class Command(BaseCommand):
+    help = ("Move locations or categories with their subtrees below another one. Nodes are given by "
+            "primary key, path, e.g. 'Universe/Shelf 1', or UUID of a location.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', nargs='*', help="Nodes to move")
+        parser.add_argument('--to', required=True, help="New parent")
+        parser.add_argument('--type', choices=sorted(MODELS), default='location')
+        parser.add_argument('--children-of', action='append', default=[], metavar='NODE',
+                            help="Move all children of this node, can be repeated")
+
+    def handle(self, *args, **options):
+        model = MODELS[options['type']]
+
+        def resolve(value):
+            node = tree.resolve(model, value)
+            if node is None:
+                raise CommandError("Unknown {} '{}'".format(options['type'], value))
+            return node
+
+        nodes = [resolve(value) for value in options['nodes']]
+        for value in options['children_of']:
+            nodes += resolve(value).get_children()
+        if not nodes:
+            raise CommandError("Nothing to move")
+        try:
+            moved = tree.move(nodes, resolve(options['to']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Moved {} {}(s)".format(moved, options['type']))
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory import trash
+from inventory.models import Item, Location, Category
+
+# Items first, so locations and categories are not kept for their trashed items
+MODELS = [('item', Item), ('location', Location), ('category', Category)]
+
+
+class Command(BaseCommand):
+    help = ("Delete trashed items, locations and categories, or archive them with --archive. Rows are "
+            "processed in small batches which commit one by one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=30, metavar='DAYS',
+                            help="Only rows trashed at least this many days ago (default 30)")
+        parser.add_argument('--archive', action='store_true', help="Archive instead of deleting")
+        parser.add_argument('--type', choices=[kind for kind, model in MODELS], action='append',
+                            help="Only this type, can be repeated")
+        parser.add_argument('--batch-size', type=int, default=trash.BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.1, metavar='SECONDS',
+                            help="Sleep after every batch (default 0.1)")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['older_than'])
+        for kind, model in MODELS:
+            if options['type'] and kind not in options['type']:
+                continue
+            if options['archive']:
+                count = trash.archive(model, before, options['batch_size'], options['pause'])
+            else:
+                count = trash.purge(model, before=before, batch_size=options['batch_size'],
+                                    pause=options['pause'])
+            self.stdout.write("{} {} {}(s)".format("Archived" if options['archive'] else "Deleted", count, kind))
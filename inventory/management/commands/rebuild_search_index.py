@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of items, locations and categories from scratch"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts = search.rebuild()
+        for kind, count in counts.items():
+            self.stdout.write("Indexed {} {}(s)".format(count, kind))
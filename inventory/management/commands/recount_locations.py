@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized item counters of all locations"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counters.recount()
+        self.stdout.write("Recounted all locations")
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import seed
+from inventory.models import Item
+
+
+class Command(BaseCommand):
+    help = ("Generate a deep location tree, a category tree and items spread over their leaves "
+            "with a skewed distribution, for benchmarks. The same options and seed always "
+            "generate the same data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--location-depth', type=int, default=4)
+        parser.add_argument('--location-fanout', type=int, default=5,
+                            help="Children per location, the defaults create 780 locations")
+        parser.add_argument('--category-depth', type=int, default=3)
+        parser.add_argument('--category-fanout', type=int, default=5)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help="Zipf exponent of the item distribution over locations and "
+                                 "categories, 0 spreads items evenly")
+        parser.add_argument('--trashed', type=float, default=0.02, help="Share of trashed items")
+        parser.add_argument('--lent', type=float, default=0.05, help="Share of lent items")
+        parser.add_argument('--words', type=int, default=2000, help="Size of the vocabulary")
+        parser.add_argument('--name', default="Seed", help="Name of the generated root location and category")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--capacity', type=int, default=None, help="Capacity of the leaf locations")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        location, category = seed.seed(items=options['items'],
+                                       location_depth=options['location_depth'],
+                                       location_fanout=options['location_fanout'],
+                                       category_depth=options['category_depth'],
+                                       category_fanout=options['category_fanout'],
+                                       skew=options['skew'],
+                                       trashed=options['trashed'],
+                                       lent=options['lent'],
+                                       words=options['words'],
+                                       name=options['name'],
+                                       random_seed=options['seed'],
+                                       capacity=options['capacity'])
+        self.stdout.write("Created {} locations, {} categories and {} items in {:.2f}s".format(
+            location.get_descendant_count() + 1,
+            category.get_descendant_count() + 1,
+            Item.objects.filter(location__tree_id=location.tree_id).count(),
+            time.perf_counter() - start))
@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.urls import Resolver404, resolve
+
+from . import routers
+
+logger = logging.getLogger('inventory.querystats')
+
+SLOWEST = 3
+SQL_LENGTH = 300
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing all queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.slowest.append((duration, sql[:SQL_LENGTH]))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[SLOWEST:]
+
+
+class Stats:
+    """Per URL name aggregates of all recorded requests of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.urls = {}
+
+    def add(self, name, queries, db, render, total):
+        with self.lock:
+            entry = self.urls.setdefault(name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db': 0.0, 'render': 0.0, 'total': 0.0, 'max_total': 0.0,
+            })
+            entry['requests'] += 1
+            entry['queries'] += queries
+            entry['max_queries'] = max(entry['max_queries'], queries)
+            entry['db'] += db
+            entry['render'] += render or 0.0
+            entry['total'] += total
+            entry['max_total'] = max(entry['max_total'], total)
+
+    def summary(self):
+        with self.lock:
+            return sorted(({
+                'name': name,
+                'requests': e['requests'],
+                'avg_queries': e['queries'] / e['requests'],
+                'max_queries': e['max_queries'],
+                'avg_db': e['db'] / e['requests'] * 1000,
+                'avg_render': e['render'] / e['requests'] * 1000,
+                'avg_total': e['total'] / e['requests'] * 1000,
+                'max_total': e['max_total'] * 1000,
+            } for name, e in self.urls.items()), key=lambda e: e['avg_total'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.urls = {}
+
+
+stats = Stats()
+# Stats name of the requests without a view, e.g. 404s
+UNRESOLVED = '<unresolved>'
+
+
+class QueryStatsMiddleware:
+    """
+    Records the number of queries, the database time, the slowest statements
+    and the template render time of every request. The numbers are sent
+    back in a Server-Timing header, logged as one JSON line to the
+    'inventory.querystats' logger and aggregated per URL name for the
+    query stats page.
+
+    Render time is only known for responses rendered after the view returned
+    (TemplateResponse, e.g. all class based views). For views calling
+    render() themselves it is part of the view time.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._render_time = None
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        name = match.view_name if match else None
+        render = request._render_time
+        # Not by path, any client could add entries with random URLs
+        stats.add(name or UNRESOLVED, recorder.count, recorder.duration, render, total)
+
+        timings = ['db;desc="{} queries";dur={:.1f}'.format(recorder.count, recorder.duration * 1000)]
+        if render is not None:
+            timings.append('render;dur={:.1f}'.format(render * 1000))
+        timings.append('total;dur={:.1f}'.format(total * 1000))
+        response['Server-Timing'] = ', '.join(timings)
+
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': name,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'render_ms': round(render * 1000, 2) if render is not None else None,
+            'total_ms': round(total * 1000, 2),
+            'slowest': [{'ms': round(d * 1000, 2), 'sql': sql} for d, sql in recorder.slowest],
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of safe requests to a replica and pins clients to the
+    primary for a while after they wrote something, see inventory/routers.py.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = routers.replica.set(None)
+        wrote = routers.wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if routers.wrote.get():
+                response.set_cookie(routers.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                    httponly=True, samesite='Lax')
+        finally:
+            routers.replica.reset(replica)
+            routers.wrote.reset(wrote)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in ('GET', 'HEAD')
+                and request.resolver_match.view_name in routers.REPLICA_VIEWS
+                and routers.PIN_COOKIE not in request.COOKIES):
+            routers.replica.set(routers.choose())
+
+
+
+class WriteTransactionMiddleware:
+    """
+    Runs the requests which may write (all but GET, HEAD and OPTIONS, and
+    the GET views in write_views) in a transaction, like ATOMIC_REQUESTS
+    does for all requests. With the SQLite profile it begins with BEGIN
+    IMMEDIATE, so concurrent writers queue up for the lock instead of
+    failing, see inventory/sqlite.py. Views decorated with
+    transaction.non_atomic_requests run without it, e.g. the ones which
+    write in batches of their own transactions.
+
+    Must be the last middleware: the transaction wraps the handler, so
+    exceptions of the view pass through process_exception() of all
+    middleware, and the transaction is rolled back even if one of them
+    turns the exception into a response.
+    """
+    # GET views which write, by URL name
+    write_views = {
+        'inventory:itemtrash',
+        'inventory:itemuntrash',
+        'inventory:itemdelete',
+        'inventory:itemreturn',
+        'inventory:locationtrash',
+        'inventory:locationuntrash',
+        'inventory:locationdelete',
+        'inventory:categorytrash',
+        'inventory:categoryuntrash',
+        'inventory:categorydelete',
+        'inventory:print_list_add',
+        'inventory:print_list_remove',
+        'inventory:print_list_clear',
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return self.get_response(request)
+        if (request.method in ('GET', 'HEAD', 'OPTIONS') and match.view_name not in self.write_views
+                or DEFAULT_DB_ALIAS in getattr(match.func, '_non_atomic_requests', ())):
+            return self.get_response(request)
+        with transaction.atomic():
+            request._write_transaction = True
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        # Called first, with the transaction of the request innermost
+        if getattr(request, '_write_transaction', False):
+            transaction.set_rollback(True)
+        return None
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_auto_20200721_1652'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=8, verbose_name='Kind')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object ID')),
+                ('field', models.CharField(choices=[('n', 'name'), ('d', 'description'), ('b', 'barcode')], max_length=1, verbose_name='Field')),
+                ('token', models.CharField(max_length=32, verbose_name='Token')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'token', 'field'], name='inventory_s_kind_2a0fa2_idx'), models.Index(fields=['kind', 'object_id'], name='inventory_s_kind_981df1_idx')],
+            },
+        ),
+    ]
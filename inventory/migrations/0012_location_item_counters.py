@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:41
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_items(apps, schema_editor):
+    Item = apps.get_model('inventory', 'Item')
+    Location = apps.get_model('inventory', 'Location')
+    direct = {row['location']: (row['count'], row['amount'] or 0) for row in
+              Item.objects.filter(state='d').order_by().values('location')
+              .annotate(count=Count('pk'), amount=Sum('amount'))}
+    for location in Location.objects.all():
+        subtree = Item.objects.filter(state='d',
+                                      location__tree_id=location.tree_id,
+                                      location__lft__gte=location.lft,
+                                      location__lft__lte=location.rght).aggregate(
+            count=Count('pk'), amount=Sum('amount'))
+        location.item_count, location.item_amount = direct.get(location.pk, (0, 0))
+        location.subtree_item_count = subtree['count']
+        location.subtree_item_amount = subtree['amount'] or 0
+        location.save(update_fields=['item_count', 'item_amount', 'subtree_item_count', 'subtree_item_amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_searchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='item_amount',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Amount'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='item_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Items'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='subtree_item_amount',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Amount (with sublocations)'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='subtree_item_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Items (with sublocations)'),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_location_item_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='barcode',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='Barcode'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='uuid',
+            field=models.UUIDField(blank=True, db_index=True, null=True, verbose_name='UUID'),
+        ),
+    ]
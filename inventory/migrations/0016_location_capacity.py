@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_item_state_creation_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Total amount of items which fit, empty if unknown', null=True, verbose_name='Capacity'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='free_capacity',
+            field=models.IntegerField(editable=False, null=True, verbose_name='Free capacity'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['free_capacity'], name='inventory_l_free_ca_8b7b58_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['tree_id', 'lft'], name='inventory_location_tree_idc6dc'),
+        ),
+    ]
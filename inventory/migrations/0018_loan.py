@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+import itertools
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_loans(apps, schema_editor):
+    Item = apps.get_model('inventory', 'Item')
+    Loan = apps.get_model('inventory', 'Loan')
+    loans = (Loan(item_id=pk, borrower=lent_to, lent_date=lent_date or change_date)
+             for pk, lent_to, lent_date, change_date in
+             Item.objects.filter(lent=True).values_list('pk', 'lent_to', 'lent_date', 'change_date').iterator())
+    while True:
+        batch = list(itertools.islice(loans, 1000))
+        if not batch:
+            break
+        Loan.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_item_state_change_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Loan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrower', models.CharField(max_length=100, verbose_name='Lent to')),
+                ('lent_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Lent Date')),
+                ('due_date', models.DateField(blank=True, null=True, verbose_name='Due Date')),
+                ('returned_date', models.DateTimeField(blank=True, null=True, verbose_name='Returned Date')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='inventory.item', verbose_name='Item')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Lent by')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['returned_date', 'lent_date'], name='inventory_l_returne_ada17c_idx'), models.Index(fields=['returned_date', 'due_date'], name='inventory_l_returne_6a3997_idx'), models.Index(fields=['borrower', 'lent_date'], name='inventory_l_borrowe_c848e2_idx'), models.Index(fields=['lent_date'], name='inventory_l_lent_da_10d8bb_idx')],
+            },
+        ),
+        migrations.RunPython(open_loans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_loan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=8, verbose_name='Kind')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object ID')),
+                ('action', models.CharField(choices=[('s', 'saved'), ('d', 'deleted')], max_length=1, verbose_name='Action')),
+                ('date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'id'], name='inventory_c_kind_0b09d2_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey
+from mptt.querysets import TreeQuerySet
 from django.utils.translation import gettext as _
 from django.contrib.auth.models import User
 
@@ -11,23 +13,97 @@ ITEM_STATES = (
     ('a', 'archived'),
 )
 
+# Fields of the tree structure, needed by recursetree and get_ancestors()
+TREE_FIELDS = ('parent', 'tree_id', 'lft', 'rght', 'level')
+
+
+class StateQuerySet(models.QuerySet):
+
+    def active(self):
+        return self.filter(state='d')
+
+    def trashed(self):
+        return self.filter(state='t')
+
+
+class LocationQuerySet(StateQuerySet, TreeQuerySet):
+
+    def for_list(self):
+        """Only the fields shown in location lists (location_list_atom.html)."""
+        return self.only('name', 'description', 'free_space', 'state',
+                         'item_count', 'subtree_item_count', *TREE_FIELDS)
+
+    def fitting(self, amount, within=None):
+        """
+        Locations with room for ``amount`` more units, in the subtree of
+        ``within`` if given. The nearest ones come first: the highest
+        levels, then in tree order.
+        """
+        queryset = self.active().filter(free_space=True, free_capacity__gte=amount)
+        if within is not None:
+            queryset = queryset.filter(tree_id=within.tree_id, lft__gte=within.lft, lft__lte=within.rght)
+        return queryset.order_by('tree_id', 'level', 'lft')
+
+
+class CategoryQuerySet(StateQuerySet, TreeQuerySet):
+
+    def for_list(self):
+        """Only the fields shown in category lists (category_list_atom.html)."""
+        return self.only('name', 'state', *TREE_FIELDS)
+
+
+class ItemQuerySet(StateQuerySet):
+
+    def for_list(self):
+        """
+        Only the fields shown in item lists (item_list.html), with the names
+        of the location and category fetched in the same query.
+        """
+        return self.select_related('location', 'category').only(
+            'name', 'description', 'amount', 'barcode', 'state', 'lent', 'creation_date',
+            'location__name', 'category__name')
+
+
 class Location(MPTTModel):
     name = models.CharField(verbose_name=_("Name"), max_length=200)
     creation_date = models.DateTimeField(verbose_name=_("Creation date"), default=timezone.now)
     change_date = models.DateTimeField(verbose_name=_("Change date"), auto_now=True)
     parent =  TreeForeignKey('self', on_delete=models.CASCADE, null=True, related_name='children', verbose_name=_("Parent"))
     free_space = models.BooleanField(verbose_name=_("Free space"), default=True)
-    uuid = models.UUIDField(verbose_name=_("UUID"), null=True, blank=True)
+    uuid = models.UUIDField(verbose_name=_("UUID"), null=True, blank=True, db_index=True)
     description = models.CharField(verbose_name=_("Description"), max_length=1000)
     state = models.CharField(verbose_name=_("State"), max_length=1, choices=ITEM_STATES, default="d")
+    item_count = models.IntegerField(verbose_name=_("Items"), default=0, editable=False)
+    item_amount = models.IntegerField(verbose_name=_("Amount"), default=0, editable=False)
+    subtree_item_count = models.IntegerField(verbose_name=_("Items (with sublocations)"), default=0, editable=False)
+    subtree_item_amount = models.IntegerField(verbose_name=_("Amount (with sublocations)"), default=0, editable=False)
+    capacity = models.PositiveIntegerField(verbose_name=_("Capacity"), null=True, blank=True,
+                                           help_text=_("Total amount of items which fit, empty if unknown"))
+    # capacity - item_amount, kept up to date with the counters
+    free_capacity = models.IntegerField(verbose_name=_("Free capacity"), null=True, editable=False)
+
+    counter_fields = ('item_count', 'item_amount', 'subtree_item_count', 'subtree_item_amount', 'free_capacity')
+
+    objects = TreeManager.from_queryset(LocationQuerySet)()
 
     def __str__(self):
         return self.name
 
+    def _get_user_field_names(self):
+        # django-mptt saves unmoved nodes with these update_fields. The item
+        # counters are maintained by UPDATE queries (see counters.py) and must
+        # not be overwritten with the stale values of a form instance.
+        return [f for f in super()._get_user_field_names() if f not in self.counter_fields]
+
     class Meta:
         permissions = [
             ('trash_location', 'Can trash location')
         ]
+        indexes = [
+            # Free slot finder, see LocationQuerySet.fitting(). Subtrees are
+            # narrowed down by the (tree_id, lft) index of django-mptt.
+            models.Index(fields=['free_capacity']),
+        ]
 
 class LocationPrintList(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -45,6 +121,8 @@ class Category(MPTTModel):
     description = models.CharField(max_length=1000, verbose_name=_("Description"))
     state = models.CharField(max_length=1, choices=ITEM_STATES, default="d", verbose_name=_("State"))
 
+    objects = TreeManager.from_queryset(CategoryQuerySet)()
+
     def __str__(self):
         return self.name
 
@@ -66,12 +144,14 @@ class Item(models.Model):
     amount = models.IntegerField(default=1, validators=[MinValueValidator(0)], verbose_name=_("Amount"))
     description = models.CharField(max_length=1000, verbose_name=_("Description"))
     category = TreeForeignKey(Category, on_delete=models.CASCADE, null=True, verbose_name=_("Category"))
-    barcode = models.BigIntegerField(blank=True, null=True, verbose_name=_("Barcode"))
+    barcode = models.BigIntegerField(blank=True, null=True, db_index=True, verbose_name=_("Barcode"))
     lent = models.BooleanField(default=False, verbose_name=_("lent"))
     lent_to = models.CharField(max_length=100, default="", verbose_name=_("Lent to"))
     lent_date = models.DateTimeField(null=True, verbose_name=_("Lent Date"))
     state = models.CharField(max_length=1, choices=ITEM_STATES, default="d", verbose_name=_("State"))
 
+    objects = ItemQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -80,4 +160,112 @@ class Item(models.Model):
             ('trash_item', 'Can trash item'),
             ('lend_item', 'Can lend item'),
         ]
-    
+        indexes = [
+            # Name ordered pages of the trash, see inventory/pagination.py
+            models.Index(fields=['state', 'name']),
+            # Latest items on the start page
+            models.Index(fields=['state', 'creation_date']),
+            # purge_trash --older-than
+            models.Index(fields=['state', 'change_date']),
+        ]
+
+class LoanQuerySet(models.QuerySet):
+
+    def outstanding(self):
+        return self.filter(returned_date__isnull=True)
+
+    def overdue(self, today=None):
+        return self.outstanding().filter(due_date__lt=today or timezone.localdate())
+
+
+class Loan(models.Model):
+    """
+    One lending of an item. Loans are only ever added and closed by setting
+    the return date, so they are the lending history. The lent, lent_to and
+    lent_date fields of the item are a copy of its open loan.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='loans', verbose_name=_("Item"))
+    borrower = models.CharField(max_length=100, verbose_name=_("Lent to"))
+    lent_date = models.DateTimeField(default=timezone.now, verbose_name=_("Lent Date"))
+    due_date = models.DateField(null=True, blank=True, verbose_name=_("Due Date"))
+    returned_date = models.DateTimeField(null=True, blank=True, verbose_name=_("Returned Date"))
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_("Lent by"))
+
+    objects = LoanQuerySet.as_manager()
+
+    def __str__(self):
+        return "{} - {}".format(self.item_id, self.borrower)
+
+    @property
+    def overdue(self):
+        return self.returned_date is None and self.due_date is not None and self.due_date < timezone.localdate()
+
+    class Meta:
+        indexes = [
+            # Outstanding loans, oldest first
+            models.Index(fields=['returned_date', 'lent_date']),
+            # Overdue loans
+            models.Index(fields=['returned_date', 'due_date']),
+            # History of a borrower and of all loans, latest first
+            models.Index(fields=['borrower', 'lent_date']),
+            models.Index(fields=['lent_date']),
+        ]
+
+
+SEARCH_FIELDS = (
+    ('n', 'name'),
+    ('d', 'description'),
+    ('b', 'barcode'),
+)
+
+class SearchToken(models.Model):
+    kind = models.CharField(max_length=8, verbose_name=_("Kind"))
+    object_id = models.PositiveIntegerField(verbose_name=_("Object ID"))
+    field = models.CharField(max_length=1, choices=SEARCH_FIELDS, verbose_name=_("Field"))
+    token = models.CharField(max_length=32, verbose_name=_("Token"))
+
+    def __str__(self):
+        return self.token
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'token', 'field']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+
+CHANGE_ACTIONS = (
+    ('s', 'saved'),
+    ('d', 'deleted'),
+)
+
+class Change(models.Model):
+    """
+    One entry of the append-only change log read by /changes/. The primary
+    key is the sequence number, so it only ever grows.
+    """
+    kind = models.CharField(max_length=8, verbose_name=_("Kind"))
+    object_id = models.PositiveIntegerField(verbose_name=_("Object ID"))
+    action = models.CharField(max_length=1, choices=CHANGE_ACTIONS, verbose_name=_("Action"))
+    date = models.DateTimeField(default=timezone.now, verbose_name=_("Date"))
+
+    def __str__(self):
+        return "{} {} {}".format(self.pk, self.kind, self.object_id)
+
+    class Meta:
+        indexes = [
+            # Changes of one kind after a sequence number
+            models.Index(fields=['kind', 'id']),
+        ]
+
+
+class CacheVersion(models.Model):
+    """
+    Version of cached data (see cache.py). In the database so that all
+    processes see a change, bumped in the transaction which changes the data.
+    """
+    name = models.CharField(max_length=64, primary_key=True, verbose_name=_("Name"))
+    number = models.BigIntegerField(verbose_name=_("Number"))
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.number)
@@ -0,0 +1,188 @@
+"""
+Keyset (cursor) pagination.
+
+Django's Paginator counts all rows and skips to a page with OFFSET, so
+every page costs a COUNT(*) and deep pages get slower the deeper they are.
+CursorPaginator instead remembers the sort key of the first and last row
+of a page in opaque next/previous tokens and continues with a WHERE on the
+sort key, which an index can answer directly. Instead of an exact count it
+can show an estimate, counted up to ESTIMATE_LIMIT rows.
+
+The ordering must be unique (end with the primary key) and its fields
+must not be null.
+"""
+
+from collections.abc import Sequence
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import QueryDict
+
+SALT = 'inventory.pagination'
+ESTIMATE_LIMIT = 1000
+
+
+def _field(name):
+    return name.lstrip('-')
+
+
+def _reverse(ordering):
+    return [name[1:] if name.startswith('-') else '-' + name for name in ordering]
+
+
+def _value(row, name):
+    if isinstance(row, dict):
+        return row[_field(name)]
+    return getattr(row, _field(name))
+
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def after(ordering, values):
+    """Condition for the rows following a row with ``values`` in ``ordering``."""
+    condition = Q()
+    for i, name in enumerate(ordering):
+        lookup = '__lt' if name.startswith('-') else '__gt'
+        equal = {_field(previous): value for previous, value in zip(ordering[:i], values[:i])}
+        condition |= Q(**equal, **{_field(name) + lookup: values[i]})
+    return condition
+
+
+class CursorPage(Sequence):
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.number = None
+
+    def __repr__(self):
+        return '<Cursor page of {} objects>'.format(len(self.object_list))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_query(self):
+        return self.paginator.query(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        return self.paginator.query(self.previous_cursor)
+
+
+class CursorPaginator:
+    """
+    Paginate ``queryset`` in ``ordering``, e.g. ('name', 'pk') or
+    ('-creation_date', '-pk'). ``resolve`` turns the rows of a page into the
+    objects shown, ``params`` are the GET parameters of the request which the
+    links to other pages keep.
+    """
+    cursors = True
+
+    def __init__(self, queryset, per_page, ordering, resolve=None, params=None, estimate=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.resolve = resolve
+        self.params = params
+        self.estimate = self.estimate_count() if estimate else None
+
+    def estimate_count(self):
+        """The number of rows, or ESTIMATE_LIMIT + 1 if there are more."""
+        return self.queryset.order_by()[:ESTIMATE_LIMIT + 1].count()
+
+    @property
+    def estimate_exceeded(self):
+        return self.estimate is not None and self.estimate > ESTIMATE_LIMIT
+
+    def cursor(self, direction, row):
+        return signing.dumps([direction] + [_encode(_value(row, name)) for name in self.ordering], salt=SALT)
+
+    def decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=SALT)
+        except signing.BadSignature:
+            return None, None
+        if not isinstance(data, list) or len(data) != len(self.ordering) + 1 or data[0] not in ('n', 'p'):
+            return None, None
+        return data[0], data[1:]
+
+    def page(self, cursor=None):
+        """
+        The page following (or preceding) the row of ``cursor``, the first
+        page for missing or invalid cursors.
+        """
+        if self.estimate == 0:
+            return CursorPage([], self)
+        direction, values = self.decode(cursor) if cursor else (None, None)
+        ordering = self.ordering if direction != 'p' else _reverse(self.ordering)
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(after(ordering, values))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or direction == 'p':
+                next_cursor = self.cursor('n', rows[-1])
+            if direction == 'n' or (direction == 'p' and more):
+                previous_cursor = self.cursor('p', rows[0])
+        object_list = self.resolve(rows) if self.resolve else rows
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+    def query(self, cursor):
+        """Query string of the link to the page of ``cursor``."""
+        params = self.params.copy() if self.params is not None else QueryDict(mutable=True)
+        params.pop('page', None)
+        params.pop('cursor', None)
+        if cursor:
+            params['cursor'] = cursor
+        return params.urlencode()
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin paginating with CursorPaginator in ``cursor_ordering``
+    unless the CURSOR_PAGINATION setting is off.
+    """
+    cursor_ordering = ('name', 'pk')
+    estimate_count = True
+
+    def get_cursor_source(self, queryset):
+        """The queryset to paginate, its ordering and the function resolving the rows of a page."""
+        return queryset, self.cursor_ordering, None
+
+    def paginate_queryset(self, queryset, page_size):
+        if not settings.CURSOR_PAGINATION:
+            if hasattr(queryset, 'order_by'):
+                queryset = queryset.order_by(*self.cursor_ordering)
+            return super().paginate_queryset(queryset, page_size)
+        queryset, ordering, resolve = self.get_cursor_source(queryset)
+        paginator = CursorPaginator(queryset, page_size, ordering, resolve=resolve,
+                                    params=self.request.GET, estimate=self.estimate_count)
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,55 @@
+"""
+Set-based changes of the print list.
+
+Locations are added with one bulk insert into the through table of
+LocationPrintList.locations, whole subtrees selected with one range
+condition on the tree (see tree.subtrees()). Locations which are already
+on the list are skipped by the database (ignore_conflicts on the unique
+pair of list and location), so adding is one query for the locations and
+one insert per BATCH_SIZE of them, however many are already there.
+"""
+
+from .models import Location, LocationPrintList
+from . import trash, tree
+
+BATCH_SIZE = 500
+
+Entry = LocationPrintList.locations.through
+
+
+def for_user(user):
+    """The print list of ``user``, created if there is none yet."""
+    print_list, created = LocationPrintList.objects.get_or_create(user=user)
+    return print_list
+
+
+def locations(pks, subtree=False):
+    """The locations ``pks`` which are not trashed, with their sublocations if ``subtree``."""
+    if subtree:
+        queryset = Location.objects.filter(tree.subtrees(trash.selected_nodes(Location, pks)))
+    else:
+        queryset = Location.objects.filter(pk__in=pks)
+    return queryset.active()
+
+
+def add(print_list, pks, subtree=False):
+    """
+    Add the locations ``pks`` (with their sublocations if ``subtree``) to
+    ``print_list``, in tree order after the ones already on it.
+    """
+    batch = []
+    for pk in locations(pks, subtree).order_by('tree_id', 'lft').values_list('pk', flat=True).iterator():
+        batch.append(Entry(locationprintlist_id=print_list.pk, location_id=pk))
+        if len(batch) == BATCH_SIZE:
+            Entry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Entry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def remove(print_list, pks, subtree=False):
+    """Remove the locations ``pks`` (with their sublocations if ``subtree``) from ``print_list``."""
+    if subtree:
+        entries = Entry.objects.filter(tree.subtrees(trash.selected_nodes(Location, pks), 'location__'))
+    else:
+        entries = Entry.objects.filter(location__in=pks)
+    return entries.filter(locationprintlist=print_list).delete()[0]
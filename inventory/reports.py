@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.db import connection
+
+from .cache import versioned_key
+from .models import Item, Category
+
+ROLLUP_TIMEOUT = 60 * 60
+
+
+def category_rollup(category):
+    """
+    Item count and total amount of every category in the subtree of
+    ``category``, each including all of its subcategories. Computed with one
+    query joining the categories with their descendants on the lft/rght
+    range, cached until an item or a category changes.
+    """
+    return cache.get_or_set(versioned_key('categories', 'rollup', category.pk),
+                            lambda: _category_rollup(category),
+                            ROLLUP_TIMEOUT)
+
+
+def _category_rollup(category):
+    sql = """
+        SELECT a.id, a.name, a.level, a.parent_id, COUNT(i.id), COALESCE(SUM(i.amount), 0)
+        FROM {category} a
+        INNER JOIN {category} d
+            ON d.tree_id = a.tree_id AND d.lft BETWEEN a.lft AND a.rght
+        LEFT JOIN {item} i
+            ON i.category_id = d.id AND i.state = 'd'
+        WHERE a.tree_id = %s AND a.lft BETWEEN %s AND %s AND a.state = 'd'
+        GROUP BY a.id, a.name, a.level, a.parent_id, a.lft
+        ORDER BY a.lft
+    """.format(category=connection.ops.quote_name(Category._meta.db_table),
+               item=connection.ops.quote_name(Item._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [category.tree_id, category.lft, category.rght])
+        return [{
+            'id': pk,
+            'name': name,
+            'level': level - category.level,
+            'parent': parent if pk != category.pk else None,
+            'items': count,
+            'amount': amount,
+        } for pk, name, level, parent, count, amount in cursor.fetchall()]
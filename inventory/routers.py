@@ -0,0 +1,80 @@
+"""
+Read replicas.
+
+If replicas are configured (DATABASE_REPLICAS, see settings.py),
+ReplicaMiddleware lets GET and HEAD requests of the views in REPLICA_VIEWS
+read from a random replica. Everything else uses the primary ('default'):
+writes, reads inside a transaction, reads after the request wrote
+something, and all requests of a client for REPLICA_PIN_SECONDS after one
+of its requests wrote something (read-your-writes), which is remembered in
+the PIN_COOKIE cookie. Django also asks for the write database to check
+unique fields of forms, so a failed form submission pins the client too.
+Migrations only run on the primary.
+
+Streaming responses (the export) read after the middleware returned, so
+they always read from the primary. Replicas may lag behind, so fragments
+rendered from a replica are not stored (see cache.py) and pages read from
+one get no ETag (see conditional.py): the fragment cache and the clients
+only keep what was read from the primary.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'inventory_primary'
+
+# Views which only read, by URL name
+REPLICA_VIEWS = {
+    'inventory:index',
+    'inventory:search',
+    'inventory:locations',
+    'inventory:categories',
+    'inventory:location',
+    'inventory:category',
+    'inventory:categoryrollup',
+    'inventory:categoryrollupjson',
+    'inventory:item',
+    'inventory:itembarcode',
+    'inventory:locationchildren',
+    'inventory:locationfind',
+    'inventory:locationfinduuid',
+    'inventory:locationbarcode',
+    'inventory:locationfindfreeslot',
+    'inventory:lent',
+    'inventory:trash',
+}
+
+# Replica the current request reads from, None for the primary
+replica = ContextVar('inventory_replica', default=None)
+# Whether the current request wrote something
+wrote = ContextVar('inventory_wrote', default=False)
+
+
+def choose():
+    """A random replica, None if there is none."""
+    return random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Read the own writes for the rest of the request
+        replica.set(None)
+        wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
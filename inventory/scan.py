@@ -0,0 +1,88 @@
+"""
+Batch resolution of scanned barcodes and location UUIDs.
+
+A scan session sends all scanned codes at once. Every type of code is
+resolved with one indexed IN query (per chunk of CHUNK_SIZE codes), instead
+of one request and one query per code.
+"""
+
+from uuid import UUID
+
+from django.urls import reverse
+
+from .models import Item, Location
+
+CHUNK_SIZE = 500
+
+
+def chunks(values):
+    values = list(values)
+    for i in range(0, len(values), CHUNK_SIZE):
+        yield values[i:i+CHUNK_SIZE]
+
+
+# Range of Item.barcode (BigIntegerField)
+BARCODE_MIN = -2 ** 63
+BARCODE_MAX = 2 ** 63 - 1
+
+
+def parse_barcode(value):
+    try:
+        code = int(str(value).strip())
+    except ValueError:
+        return None
+    # Larger numbers cannot be looked up, no item carries them
+    return code if BARCODE_MIN <= code <= BARCODE_MAX else None
+
+
+def parse_uuid(value):
+    try:
+        return UUID(str(value).strip())
+    except ValueError:
+        return None
+
+
+def resolve_barcodes(values):
+    """Map every scanned barcode to the list of items carrying it."""
+    result = {str(v): [] for v in values}
+    codes = {}
+    for value in values:
+        code = parse_barcode(value)
+        if code is not None:
+            codes.setdefault(code, []).append(str(value))
+    for chunk in chunks(codes):
+        items = (Item.objects.filter(barcode__in=chunk, state='d')
+                 .select_related('location')
+                 .only('name', 'amount', 'barcode', 'location__name')
+                 .order_by('pk'))
+        for item in items:
+            for value in codes[item.barcode]:
+                result[value].append({
+                    'id': item.pk,
+                    'name': item.name,
+                    'amount': item.amount,
+                    'location': item.location_id,
+                    'location_name': item.location.name if item.location_id else None,
+                    'url': reverse('inventory:item', args=(item.pk,)),
+                })
+    return result
+
+
+def resolve_locations(values):
+    """Map every scanned UUID to its location, or None if it is unknown."""
+    result = {str(v): None for v in values}
+    uuids = {}
+    for value in values:
+        uuid = parse_uuid(value)
+        if uuid is not None:
+            uuids.setdefault(uuid, []).append(str(value))
+    for chunk in chunks(uuids):
+        for location in Location.objects.filter(uuid__in=chunk).only('name', 'uuid', 'state'):
+            for value in uuids[location.uuid]:
+                result[value] = {
+                    'id': location.pk,
+                    'name': location.name,
+                    'state': location.state,
+                    'url': reverse('inventory:location', args=(location.pk,)),
+                }
+    return result
@@ -0,0 +1,185 @@
+"""
+Token index behind the search page.
+
+Every word of a name or barcode is stored together with all of its
+suffixes, every word of a description is stored as is. A query word then
+matches through an index range scan on the token column: it has to be a
+prefix of some stored token, which means a substring of a name or barcode
+word (like the old ``icontains`` lookup) or the beginning of a description
+word. Objects are indexed under their search type ('item', 'location' or
+'category'), so a query only touches the index rows of one type.
+"""
+
+import re
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Item, Location, Category, SearchToken
+
+
+NAME = 'n'
+DESCRIPTION = 'd'
+BARCODE = 'b'
+
+TOKEN_LENGTH = 32
+BATCH_SIZE = 1000
+
+searchable = {
+    'item': Item,
+    'location': Location,
+    'category': Category,
+}
+
+word_re = re.compile(r'\w+')
+
+
+def words(text):
+    return {w[:TOKEN_LENGTH] for w in word_re.findall(str(text).lower()) if len(w) >= 2}
+
+
+def suffixes(text):
+    return {w[i:i+TOKEN_LENGTH] for w in word_re.findall(str(text).lower()) for i in range(len(w) - 1)}
+
+
+def kind_of(obj):
+    for kind, model in searchable.items():
+        if isinstance(obj, model):
+            return kind
+    raise ValueError("Cannot index {}".format(obj.__class__.__name__))
+
+
+def tokens_for(kind, obj):
+    tokens = [SearchToken(kind=kind, object_id=obj.pk, field=NAME, token=t)
+              for t in suffixes(obj.name)]
+    tokens += [SearchToken(kind=kind, object_id=obj.pk, field=DESCRIPTION, token=t)
+               for t in words(obj.description)]
+    if getattr(obj, 'barcode', None) is not None:
+        tokens += [SearchToken(kind=kind, object_id=obj.pk, field=BARCODE, token=t)
+                   for t in suffixes(obj.barcode)]
+    return tokens
+
+
+def index_object(obj):
+    kind = kind_of(obj)
+    SearchToken.objects.filter(kind=kind, object_id=obj.pk).delete()
+    SearchToken.objects.bulk_create(tokens_for(kind, obj), batch_size=BATCH_SIZE)
+
+
+def unindex_object(obj):
+    SearchToken.objects.filter(kind=kind_of(obj), object_id=obj.pk).delete()
+
+
+def index_queryset(queryset, replace=True):
+    """
+    Index all objects of a queryset in batches, without loading the whole
+    queryset into memory. Returns the number of indexed objects.
+    """
+    kind = kind_of(queryset.model())
+    fields = ['pk', 'name', 'description']
+    if queryset.model is Item:
+        fields.append('barcode')
+    count = 0
+    batch = []
+    for obj in queryset.only(*fields).iterator(chunk_size=BATCH_SIZE):
+        batch.append(obj)
+        if len(batch) == BATCH_SIZE:
+            count += _index_batch(kind, batch, replace)
+            batch = []
+    count += _index_batch(kind, batch, replace)
+    return count
+
+
+def _index_batch(kind, objects, replace):
+    if not objects:
+        return 0
+    if replace:
+        SearchToken.objects.filter(kind=kind, object_id__in=[o.pk for o in objects]).delete()
+    tokens = []
+    for obj in objects:
+        tokens += tokens_for(kind, obj)
+    SearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+    return len(objects)
+
+
+def rebuild():
+    """Drop the whole index and build it again from the database."""
+    SearchToken.objects.all().delete()
+    return {kind: index_queryset(model.objects.all(), replace=False)
+            for kind, model in searchable.items()}
+
+
+def prefix(word):
+    """Range lookup for tokens starting with ``word``, usable by an index."""
+    return Q(token__gte=word, token__lt=word[:-1] + chr(ord(word[-1]) + 1))
+
+
+def matches(kind, term):
+    """
+    Object ids matching every word of ``term`` together with their score,
+    best matches first. Words found in the name count more than words found
+    in the barcode, which count more than words found in the description.
+    """
+    terms = sorted(words(term))
+    if not terms:
+        return SearchToken.objects.none().values('object_id')
+
+    # Objects containing every word, each word resolved by its own range scan
+    candidates = SearchToken.objects.filter(prefix(terms[0]), kind=kind)
+    for w in terms[1:]:
+        candidates = candidates.filter(object_id__in=SearchToken.objects.filter(prefix(w), kind=kind).values('object_id'))
+
+    condition = Q()
+    for w in terms:
+        condition |= prefix(w)
+
+    def hits(field):
+        return Count(Case(*[When(prefix(w), then=Value(i)) for i, w in enumerate(terms)],
+                          output_field=IntegerField()),
+                     distinct=True,
+                     filter=Q(field=field))
+
+    return (SearchToken.objects
+            .filter(kind=kind, object_id__in=candidates.values('object_id'))
+            .filter(condition)
+            .values('object_id')
+            .annotate(name_hits=hits(NAME),
+                      barcode_hits=hits(BARCODE),
+                      description_hits=hits(DESCRIPTION))
+            .annotate(score=F('name_hits') * 4 + F('barcode_hits') * 2 + F('description_hits'))
+            .order_by('-score', 'object_id'))
+
+
+class SearchResults:
+    """
+    Ranked, lazily evaluated search results which can be handed to a
+    Paginator like a queryset. Only the objects of the requested slice are
+    fetched from the database.
+    """
+
+    def __init__(self, kind, term):
+        self.model = searchable[kind]
+        self.matches = matches(kind, term)
+
+    def count(self):
+        return self.matches.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key+1][0]
+        return self.resolve(self.matches[key])
+
+    def resolve(self, matches):
+        """The objects of ``matches`` (rows of self.matches) in their order."""
+        ids = [m['object_id'] for m in matches]
+        objects = self.model.objects.for_list().in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def search(kind, term):
+    return SearchResults(kind, term)
@@ -0,0 +1,114 @@
+"""
+Synthetic inventory data for benchmarks.
+
+Generates a deep location tree, a category tree and items spread over
+their leaves. Items are distributed with a Zipf-like skew, so a few
+locations and categories hold most of the items like in a real storage,
+and everything is derived from a seed, so runs with the same options
+produce the same data.
+"""
+
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import tree
+from .models import Item, Location, Category, Loan
+from .signals import bulk_saved
+
+BATCH_SIZE = 1000
+
+WORDS = ['screw', 'cable', 'adapter', 'resistor', 'capacitor', 'hammer', 'drill',
+         'battery', 'charger', 'sensor', 'switch', 'relay', 'motor', 'bracket',
+         'washer', 'nut', 'bolt', 'spring', 'hinge', 'fuse', 'plug', 'socket']
+SYLLABLES = ['ka', 'ro', 'mi', 'tel', 'son', 'da', 'vex', 'lu', 'pra', 'gen', 'ti', 'bor']
+
+LOCATION_LEVELS = ["Building {n}", "Room {n}", "Rack {n}", "Shelf {n}", "Box {n}", "Compartment {n}"]
+CATEGORY_LEVELS = ["Group {n}", "Class {n}", "Type {n}", "Kind {n}", "Variant {n}"]
+
+
+def vocabulary(rng, size):
+    """The fixed WORDS plus random made up words, ``size`` words in total."""
+    words = set(WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for i in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def levels(names, depth, fanout):
+    """create_grid() levels with ``fanout`` children per node, ``depth`` levels deep."""
+    return [(names[i % len(names)], fanout) for i in range(depth)]
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights of rank 1 / rank ** skew for ``count`` ranks, 0 is uniform."""
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def leaf_pks(root):
+    """Primary keys of the leaves below ``root``, ``root`` itself if it has no children."""
+    return list(root.get_descendants(include_self=True).filter(rght=F('lft') + 1).values_list('pk', flat=True))
+
+
+def seed(items=10000, location_depth=4, location_fanout=5, category_depth=3, category_fanout=5,
+         skew=1.0, trashed=0.02, lent=0.05, words=2000, name="Seed", random_seed=0, capacity=None):
+    """
+    Create a location tree and a category tree named ``name`` and
+    ``items`` items in their leaves. The leaf locations get a ``capacity``
+    if given. Returns the root location and the root category.
+    """
+    rng = random.Random(random_seed)
+    vocabulary_words = vocabulary(rng, words)
+
+    with transaction.atomic():
+        location = Location.objects.create(name=name, description="Generated by seed_inventory")
+        tree.create_grid(location, levels(LOCATION_LEVELS, location_depth, location_fanout), capacity=capacity)
+        category = Category.objects.create(name=name, description="Generated by seed_inventory")
+        tree.create_grid(category, levels(CATEGORY_LEVELS, category_depth, category_fanout))
+        # create_grid() moved the right edges of the roots
+        location.refresh_from_db()
+        category.refresh_from_db()
+
+        # Shuffle the leaves, so the popular ones are spread over the tree
+        locations = leaf_pks(location)
+        categories = leaf_pks(category)
+        rng.shuffle(locations)
+        rng.shuffle(categories)
+        location_weights = zipf_weights(len(locations), skew)
+        category_weights = zipf_weights(len(categories), skew)
+
+        now = timezone.now()
+        batch = []
+        for i in range(items):
+            item = Item(name=' '.join(rng.sample(vocabulary_words, rng.randint(1, 3))),
+                        description=' '.join(rng.sample(vocabulary_words, rng.randint(0, 12))),
+                        amount=rng.choice((1, 1, 1, 2, 5, 10, 50, 100)),
+                        location_id=rng.choices(locations, cum_weights=location_weights)[0],
+                        category_id=rng.choices(categories, cum_weights=category_weights)[0],
+                        creation_date=now - timedelta(minutes=rng.randrange(60 * 24 * 365 * 3)))
+            if rng.random() < 0.5:
+                item.barcode = rng.randrange(10**12, 10**13)
+            if rng.random() < trashed:
+                item.state = 't'
+            elif rng.random() < lent:
+                item.lent = True
+                item.lent_to = rng.choice(vocabulary_words).title()
+                item.lent_date = now - timedelta(days=rng.randrange(365))
+            batch.append(item)
+            if len(batch) == BATCH_SIZE:
+                Item.objects.bulk_create(batch)
+                batch = []
+        Item.objects.bulk_create(batch)
+
+        bulk_saved.send(sender=Item, queryset=Item.objects.filter(location__tree_id=location.tree_id),
+                        created=True)
+        lent_items = Item.objects.filter(location__tree_id=location.tree_id, lent=True)
+        Loan.objects.bulk_create((Loan(item_id=pk, borrower=lent_to, lent_date=lent_date,
+                                       due_date=(lent_date + timedelta(days=30)).date())
+                                  for pk, lent_to, lent_date in lent_items.values_list('pk', 'lent_to', 'lent_date')),
+                                 batch_size=BATCH_SIZE)
+    return location, category
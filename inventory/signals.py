@@ -0,0 +1,144 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Item, Location, Category
+from . import cache, changelog, counters, search
+
+# Sent by set-based operations which bypass the model signals (bulk_create,
+# QuerySet.update), with the saved objects as ``queryset``. ``created`` is
+# True if all of them were just inserted, ``fields`` are the updated fields
+# if only some were. ``tree_ids`` are further trees of locations or
+# categories the operation changed, e.g. the ones nodes were moved out of.
+# ``counts`` are the changes of the item counters as rows of
+# counters.item_rows(), if the sender knows them; otherwise a change of
+# counted item fields recounts the trees of the items.
+bulk_saved = Signal()
+
+# Fields of items and locations which change the counters, and of all
+# objects which change the search index
+COUNTED_FIELDS = {
+    Item: {'location', 'state', 'amount'},
+    Location: {'parent'},
+}
+INDEXED_FIELDS = {'name', 'description', 'barcode'}
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+def update_search_index(sender, instance, **kwargs):
+    search.index_object(instance)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Category)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.unindex_object(instance)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+def log_save(sender, instance, **kwargs):
+    changelog.record(search.kind_of(instance), [instance.pk])
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Category)
+def log_delete(sender, instance, **kwargs):
+    changelog.record(search.kind_of(instance), [instance.pk], changelog.DELETED)
+
+
+@receiver(pre_save, sender=Item)
+def remember_item_contribution(sender, instance, **kwargs):
+    old = None
+    if instance.pk is not None:
+        old = Item.objects.filter(pk=instance.pk).values('location_id', 'state', 'amount').first()
+    instance._counted = counters.contribution(**old) if old else None
+
+
+@receiver(post_save, sender=Item)
+def update_item_counters(sender, instance, **kwargs):
+    counters.apply(getattr(instance, '_counted', None),
+                   counters.contribution(instance.location_id, instance.state, instance.amount))
+    instance._counted = counters.contribution(instance.location_id, instance.state, instance.amount)
+
+
+@receiver(post_delete, sender=Item)
+def remove_item_from_counters(sender, instance, **kwargs):
+    counters.apply(counters.contribution(instance.location_id, instance.state, instance.amount), None)
+
+
+@receiver(pre_save, sender=Location)
+@receiver(pre_save, sender=Category)
+def remember_old_tree(sender, instance, **kwargs):
+    old = None
+    if instance.pk is not None:
+        fields = ['parent_id', 'tree_id'] + (['capacity'] if sender is Location else [])
+        old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._old_tree = old
+
+
+@receiver(post_save, sender=Location)
+def update_free_capacity(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_tree', None)
+    if instance.capacity != (old['capacity'] if old else None):
+        Location.objects.filter(pk=instance.pk).update(free_capacity=F('capacity') - F('item_amount'))
+
+
+@receiver(post_save, sender=Location)
+def recount_moved_location(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_tree', None)
+    if old is not None and old['parent_id'] != instance.parent_id:
+        counters.recount({old['tree_id'], instance.tree_id})
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Category)
+def invalidate_category_reports(sender, **kwargs):
+    cache.bump('categories')
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Category)
+def invalidate_tree_fragments(sender, instance, **kwargs):
+    # Item changes invalidate the location trees through the counters
+    old = getattr(instance, '_old_tree', None)
+    cache.bump_trees(sender, [instance.tree_id, old['tree_id'] if old else None])
+    if sender is Location:
+        cache.bump('locations')
+
+
+def changes(fields, names):
+    return fields is None or bool(set(fields) & names)
+
+
+@receiver(bulk_saved)
+def update_after_bulk_save(sender, queryset, created=False, fields=None, tree_ids=(), counts=None, **kwargs):
+    def trees():
+        return set(queryset.order_by().values_list('tree_id', flat=True).distinct()) | set(tree_ids)
+
+    if created or changes(fields, INDEXED_FIELDS):
+        search.index_queryset(queryset, replace=not created)
+    changelog.record_queryset(queryset)
+    if sender is Item and created:
+        counters.add_items(queryset)
+    elif sender is Item and counts is not None:
+        counters.add_rows(counts)
+    elif sender is Item and changes(fields, COUNTED_FIELDS[Item]):
+        counters.recount(queryset.order_by().values_list('location__tree_id', flat=True).distinct())
+    elif sender is Location and not created and changes(fields, COUNTED_FIELDS[Location]):
+        counters.recount(trees())
+    if sender in (Location, Category):
+        cache.bump_trees(sender, trees())
+    if sender is Location:
+        cache.bump('locations')
+    if sender in (Item, Category):
+        cache.bump('categories')
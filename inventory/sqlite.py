@@ -0,0 +1,26 @@
+"""
+SQLite profile.
+
+SQLite allows one writer at a time. In its default rollback journal mode
+the writer also blocks all readers, and a transaction which starts reading
+and then wants to write fails at once with "database is locked" if another
+one got the write lock in between. The profile (see settings.py) avoids
+both: the write-ahead log lets readers work next to the writer, write
+transactions take the lock when they begin (BEGIN IMMEDIATE, Django's
+transaction_mode option) and wait up to busy_timeout for it, and
+connections stay open between requests so the PRAGMAs are set once per
+connection, not once per request.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def set_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
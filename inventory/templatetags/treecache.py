@@ -0,0 +1,34 @@
+from django import template
+
+from inventory import cache
+
+register = template.Library()
+
+
+class TreeCacheNode(template.Node):
+
+    def __init__(self, nodelist, node, name):
+        self.nodelist = nodelist
+        self.node = node
+        self.name = name
+
+    def render(self, context):
+        return cache.fragment(self.node.resolve(context), self.name.resolve(context),
+                              lambda: self.nodelist.render(context), context.get('request'))
+
+
+@register.tag(name='treecache')
+def do_treecache(parser, token):
+    """
+    Cache the enclosed fragment until the tree of ``node`` changes:
+
+        {% treecache location "sublocations" %} ... {% endtreecache %}
+
+    The fragment must only depend on the tree, not on the user.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError("'{}' takes a node and a fragment name".format(bits[0]))
+    nodelist = parser.parse(('endtreecache',))
+    parser.delete_first_token()
+    return TreeCacheNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
@@ -1,3 +1,1630 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import barcodes, benchmark, changelog, conditional, counters, exporter, importer, labels, lending, pagination, printlist, reports, routers, scan, search, seed, sqlite, trash, tree
+from .cache import fragment, stats as cache_stats, tree_name, version as cache_version
+from .middleware import UNRESOLVED, ReplicaMiddleware, WriteTransactionMiddleware, stats as query_stats
+from .models import Change, Item, Location, Category, Loan, LocationPrintList
+from .testutils import QueryBudgetMixin, budgets
+
+
+class InventoryTestCase(TestCase):
+    fixtures = ['datasetup']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.universe = Location.objects.get(pk=1)
+        self.everything = Category.objects.get(pk=1)
+
+    def create_item(self, name, **kwargs):
+        kwargs.setdefault('location', self.universe)
+        kwargs.setdefault('category', self.everything)
+        kwargs.setdefault('description', "")
+        return Item.objects.create(name=name, **kwargs)
+
+
+class SearchTests(InventoryTestCase):
+
+    def test_substring_of_name(self):
+        battery = self.create_item("AA Battery")
+        self.create_item("Cable")
+        self.assertEqual(list(search.search('item', 'atter')), [battery])
+
+    def test_all_words_must_match(self):
+        red = self.create_item("Red cable")
+        self.create_item("Blue cable")
+        self.assertEqual(list(search.search('item', 'cable red')), [red])
+
+    def test_description_and_barcode(self):
+        described = self.create_item("Box", description="Contains spare fuses")
+        coded = self.create_item("Bag", barcode=4006381333931)
+        self.assertEqual(list(search.search('item', 'spare')), [described])
+        self.assertEqual(list(search.search('item', '6381')), [coded])
+
+    def test_name_ranks_before_description(self):
+        described = self.create_item("Box", description="Drill bits")
+        named = self.create_item("Drill")
+        self.assertEqual(list(search.search('item', 'drill')), [named, described])
+
+    def test_index_follows_changes(self):
+        item = self.create_item("Hammer")
+        item.name = "Wrench"
+        item.save()
+        self.assertEqual(list(search.search('item', 'hammer')), [])
+        self.assertEqual(list(search.search('item', 'wrench')), [item])
+        item.delete()
+        self.assertEqual(list(search.search('item', 'wrench')), [])
+
+    def test_rebuild(self):
+        item = self.create_item("Hammer")
+        Item.objects.filter(pk=item.pk).update(name="Wrench")
+        search.rebuild()
+        self.assertEqual(search.search('item', 'wrench').count(), 1)
+        self.assertEqual(search.search('item', 'hammer').count(), 0)
+
+    def test_search_view(self):
+        location = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        response = self.client.get(reverse('inventory:search'), {'q': 'shel', 'type': 'location'})
+        self.assertEqual(list(response.context['page_obj']), [location])
+
+
+class LocationCounterTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        self.bin = Location.objects.create(name="Bin", description="", parent=self.shelf)
+        self.other = Location.objects.create(name="Other", description="", parent=self.universe)
+
+    def counts(self, location):
+        location.refresh_from_db()
+        return (location.item_count, location.item_amount,
+                location.subtree_item_count, location.subtree_item_amount)
+
+    def test_create_move_trash_delete(self):
+        item = self.create_item("Screws", location=self.bin, amount=5)
+        self.assertEqual(self.counts(self.bin), (1, 5, 1, 5))
+        self.assertEqual(self.counts(self.shelf), (0, 0, 1, 5))
+        self.assertEqual(self.counts(self.universe), (1, 1, 2, 6))
+
+        item.location = self.other
+        item.save()
+        self.assertEqual(self.counts(self.shelf), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.other), (1, 5, 1, 5))
+
+        item.state = 't'
+        item.save()
+        self.assertEqual(self.counts(self.other), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.universe), (1, 1, 1, 1))
+
+        item.state = 'd'
+        item.save()
+        item.delete()
+        self.assertEqual(self.counts(self.other), (0, 0, 0, 0))
+
+    def test_bulk_trash_adds_deltas(self):
+        screws = self.create_item("Screws", location=self.bin, amount=5)
+        nails = self.create_item("Nails", location=self.other, amount=2)
+        with mock.patch.object(counters, '_recount_tree') as recount_tree:
+            trash.trash_items([screws.pk, nails.pk])
+            self.assertEqual(self.counts(self.bin), (0, 0, 0, 0))
+            self.assertEqual(self.counts(self.universe), (1, 1, 1, 1))
+            trash.untrash_items([screws.pk])
+            self.assertEqual(self.counts(self.shelf), (0, 0, 1, 5))
+        recount_tree.assert_not_called()
+        # Items in many locations recount their trees
+        with mock.patch.object(counters, 'RECOUNT_THRESHOLD', 0):
+            trash.untrash_items([nails.pk])
+        self.assertEqual(self.counts(self.other), (1, 2, 1, 2))
+        self.assertEqual(self.counts(self.universe), (1, 1, 3, 8))
+
+    def test_moving_location_recounts(self):
+        self.create_item("Screws", location=self.bin, amount=5)
+        self.bin.parent = self.other
+        self.bin.save()
+        self.assertEqual(self.counts(self.shelf), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.other), (0, 0, 1, 5))
+
+    def test_editing_location_keeps_counters(self):
+        stale = Location.objects.get(pk=self.bin.pk)
+        self.create_item("Screws", location=self.bin, amount=5)
+        stale.name = "Big bin"
+        stale.save()
+        self.assertEqual(self.counts(self.bin), (1, 5, 1, 5))
+
+    def test_recount(self):
+        self.create_item("Screws", location=self.bin, amount=5)
+        Location.objects.update(item_count=0, item_amount=0, subtree_item_count=0, subtree_item_amount=0)
+        counters.recount()
+        self.assertEqual(self.counts(self.bin), (1, 5, 1, 5))
+        self.assertEqual(self.counts(self.universe), (1, 1, 2, 6))
+        self.assertEqual(counters.subtree_totals(self.shelf), (1, 5))
+
+    def test_location_list_does_not_query_per_node(self):
+        for i in range(5):
+            Location.objects.create(name="Box {}".format(i), description="", parent=self.bin)
+        with self.assertNumQueries(4):
+            self.client.get(reverse('inventory:locations'))
+
+
+class CategoryRollupTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.electronics = Category.objects.create(name="Electronics", description="", parent=self.everything)
+        self.cables = Category.objects.create(name="Cables", description="", parent=self.electronics)
+
+    def test_rollup_includes_subcategories(self):
+        self.create_item("HDMI", category=self.cables, amount=3)
+        self.create_item("Radio", category=self.electronics)
+        self.create_item("Broken", category=self.cables, state='t')
+        rollup = {row['id']: (row['items'], row['amount']) for row in reports.category_rollup(self.electronics)}
+        self.assertEqual(rollup, {self.electronics.pk: (2, 4), self.cables.pk: (1, 3)})
+
+    def test_rollup_cache_is_invalidated(self):
+        reports.category_rollup(self.electronics)
+        self.create_item("HDMI", category=self.cables, amount=3)
+        # The version and the rollup
+        with self.assertNumQueries(2):
+            rollup = reports.category_rollup(self.electronics)
+        with self.assertNumQueries(1):
+            reports.category_rollup(self.electronics)
+        self.assertEqual(rollup[0]['amount'], 3)
+
+    def test_rollup_views(self):
+        response = self.client.get(reverse('inventory:categoryrollupjson', args=(self.everything.pk,)))
+        self.assertEqual([row['name'] for row in response.json()['categories']],
+                         ["Everything", "Electronics", "Cables"])
+        response = self.client.get(reverse('inventory:categoryrollup', args=(self.electronics.pk,)))
+        self.assertContains(response, "Cables")
+
+
+class LocationGridTests(InventoryTestCase):
+
+    def tree_fields(self):
+        return list(Location.objects.order_by('pk').values_list('pk', 'parent_id', 'tree_id', 'lft', 'rght', 'level'))
+
+    def test_grid_matches_mptt(self):
+        rack = Location.objects.create(name="Rack", description="", parent=self.universe)
+        Location.objects.create(name="Neighbour", description="", parent=self.universe)
+        Location.objects.create(name="Old shelf", description="", parent=rack)
+        self.assertEqual(tree.create_grid(rack, [("Shelf {n}", 3), ("Bin {n}", 4)], "Row {n}"), 15)
+
+        created = self.tree_fields()
+        Location.objects.rebuild()
+        self.assertEqual(created, self.tree_fields())
+
+        shelf = Location.objects.get(name="Shelf 2")
+        self.assertEqual(shelf.description, "Row 2")
+        self.assertEqual([c.name for c in shelf.get_children()], ["Bin 1", "Bin 2", "Bin 3", "Bin 4"])
+        self.assertEqual(list(search.search('location', 'bin')[:1])[0].name, "Bin 1")
+
+    def test_new_multiple_view(self):
+        response = self.client.post(reverse('inventory:locationnewmulti', args=(1,)), {
+            'name': 'Shelf', 'description': 'Row', 'parent': 1, 'amount': 2, 'sub_name': 'Bin {n}', 'sub_amount': 3,
+        })
+        self.assertRedirects(response, reverse('inventory:location', args=(1,)), fetch_redirect_response=False)
+        self.assertEqual(Location.objects.get(pk=1).get_descendant_count(), 8)
+        self.assertEqual(Location.objects.get(name="Shelf 1").get_children().count(), 3)
+
+
+class ItemImportTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe,
+                                             uuid='8a5ab1d3-b3f2-4ff3-9a4c-3f2b3c3c9a10')
+        self.cables = Category.objects.create(name="Cables", description="", parent=self.everything)
+
+    def test_csv(self):
+        data = io.StringIO(
+            "name,description,amount,location,category,barcode\n"
+            "HDMI,2m,3,Universe/Shelf,Everything/Cables,\n"
+            "USB,1m,x,Universe/Shelf,Everything/Cables,\n"
+            "VGA,old,1,Universe/Nowhere,Everything,\n"
+            "DVI,old,2,8a5ab1d3-b3f2-4ff3-9a4c-3f2b3c3c9a10,everything/cables,4006381333931\n")
+        errors = []
+        items = importer.ItemImporter(chunk_size=1)
+        self.assertEqual(items.run(data, 'csv', lambda line, message: errors.append(line)), (2, 2))
+        self.assertEqual(errors, [3, 4])
+        self.assertEqual(list(Item.objects.filter(location=self.shelf, category=self.cables)
+                              .order_by('name').values_list('name', 'amount', 'barcode')),
+                         [("DVI", 2, 4006381333931), ("HDMI", 3, None)])
+        self.shelf.refresh_from_db()
+        self.assertEqual(self.shelf.item_amount, 5)
+        self.assertEqual(search.search('item', 'hdmi').count(), 1)
+
+    def test_jsonl(self):
+        data = io.StringIO('{"name": "HDMI", "description": "2m", "location": "Universe/Shelf", "category": "Everything"}\n'
+                           '\n'
+                           'not json\n')
+        errors = []
+        items = importer.ItemImporter()
+        self.assertEqual(items.run(data, 'jsonl', lambda line, message: errors.append(line)), (1, 1))
+        self.assertEqual(errors, [3])
+
+    def test_upload_view(self):
+        upload = SimpleUploadedFile("items.csv", b"name,description,location,category\nHDMI,2m,Universe/Shelf,Everything\n")
+        response = self.client.post(reverse('inventory:itemimport'),
+                                    {'file': upload, 'format': 'csv', 'chunk_size': 100})
+        self.assertEqual(response.context['result'], (1, 0))
+        self.assertTrue(Item.objects.filter(name="HDMI", location=self.shelf).exists())
+
+    def test_upload_with_byte_order_mark(self):
+        upload = SimpleUploadedFile("items.csv", "\ufeffname,description,location,category\nHDMI,2m,Universe/Shelf,Everything\n"
+                                    .encode('utf-8'))
+        response = self.client.post(reverse('inventory:itemimport'),
+                                    {'file': upload, 'format': 'csv', 'chunk_size': 100})
+        self.assertEqual(response.context['result'], (1, 0))
+
+    def test_upload_not_utf8(self):
+        upload = SimpleUploadedFile("items.csv", "name,description,location,category\nGrüße,2m,Universe/Shelf,Everything\n"
+                                    .encode('latin-1'))
+        response = self.client.post(reverse('inventory:itemimport'),
+                                    {'file': upload, 'format': 'csv', 'chunk_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('file'))
+        self.assertFalse(Item.objects.filter(location=self.shelf).exists())
+
+    def test_command_reads_stdin_like_a_file(self):
+        data = b'name,description,location,category\r\nHDMI,"2m\r\nblack",Universe/Shelf,Everything\r\n'
+        with mock.patch('sys.stdin', io.TextIOWrapper(io.BytesIO(data))):
+            call_command('import_items', '-', format='csv', stdout=io.StringIO())
+        self.assertEqual(Item.objects.get(name="HDMI").description, "2m\r\nblack")
+
+    def test_created_items_without_returned_pks(self):
+        stamp = timezone.now()
+        last = Item.objects.order_by('-pk').values_list('pk', flat=True).first()
+        chunk = [Item(name="HDMI", description="", location=self.shelf, category=self.cables, creation_date=stamp),
+                 Item(name="USB", description="", location=self.shelf, category=self.cables, creation_date=stamp,
+                      barcode=4006381333931)]
+        for item in chunk:
+            item.save()
+        # Another import at the same time
+        other = self.create_item("VGA", location=self.shelf)
+        Item.objects.filter(pk=other.pk).update(creation_date=stamp)
+        self.assertEqual(sorted(importer.created_items(chunk, stamp, last).values_list('name', flat=True)),
+                         ["HDMI", "USB"])
+
+
+class ExportTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        self.other = Location.objects.create(name="Other", description="", parent=self.universe)
+        self.create_item("HDMI", location=self.shelf, amount=3, description="2m")
+        self.create_item("VGA", location=self.other)
+        self.create_item("DVI", location=self.shelf, state='t')
+
+    def test_items_with_paths(self):
+        rows = list(exporter.rows('item', exporter.queryset('item', state='d', location=self.shelf), chunk_size=1))
+        self.assertEqual([(r['name'], r['location'], r['category']) for r in rows],
+                         [("HDMI", "Universe/Shelf", "Everything")])
+
+    def test_batches(self):
+        rows = list(exporter.rows('item', exporter.queryset('item'), chunk_size=2))
+        self.assertEqual(len(rows), 4)
+        rows = list(exporter.rows('location', exporter.queryset('location', location=self.shelf)))
+        self.assertEqual([r['path'] for r in rows], ["Universe/Shelf"])
+
+    def test_export_can_be_imported(self):
+        data = ''.join(exporter.export('item', 'csv', state='d', location=self.shelf))
+        Item.objects.all().delete()
+        items = importer.ItemImporter()
+        self.assertEqual(items.run(io.StringIO(data), 'csv'), (1, 0))
+        self.assertEqual(Item.objects.get().location, self.shelf)
+
+    def test_subtree_paths(self):
+        self.assertEqual(tree.paths(Location, self.shelf), {self.universe.pk: "Universe", self.shelf.pk: "Universe/Shelf"})
+        with self.assertNumQueries(3):
+            rows = list(exporter.rows('item', exporter.queryset('item', location=self.shelf), location=self.shelf))
+        self.assertEqual({r['location'] for r in rows}, {"Universe/Shelf"})
+
+    def test_command_takes_a_path(self):
+        output = io.StringIO()
+        call_command('export_inventory', 'item', '--format', 'jsonl', '--state', 'd', '--location', 'universe/shelf',
+                     stdout=output)
+        self.assertEqual([json.loads(line)['name'] for line in output.getvalue().splitlines()], ["HDMI"])
+        with self.assertRaises(CommandError):
+            call_command('export_inventory', 'item', '--location', 'Universe/Nowhere', stdout=output)
+
+    def test_view(self):
+        response = self.client.get(reverse('inventory:export'),
+                                   {'type': 'item', 'format': 'jsonl', 'location': self.shelf.pk})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['name'] for line in lines), ["DVI", "HDMI"])
+
+    def test_view_with_path(self):
+        response = self.client.get(reverse('inventory:export'),
+                                   {'type': 'item', 'format': 'jsonl', 'state': 'd', 'location': 'universe/shelf/'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines], ["HDMI"])
+        response = self.client.get(reverse('inventory:export'),
+                                   {'type': 'item', 'format': 'jsonl', 'location': 'Universe/Nowhere'})
+        self.assertTrue(response.context['form'].has_error('location'))
+
+    def test_form_does_not_list_nodes(self):
+        response = self.client.get(reverse('inventory:export'), {'location': self.shelf.pk})
+        self.assertNotContains(response, '<option value="{}"'.format(self.other.pk))
+        self.assertContains(response, 'value="{}"'.format(self.shelf.pk))
+
+
+class ScanTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe,
+                                             uuid='8a5ab1d3-b3f2-4ff3-9a4c-3f2b3c3c9a10')
+        self.item = self.create_item("HDMI", location=self.shelf, barcode=4006381333931)
+
+    def test_barcode_redirect(self):
+        response = self.client.get(reverse('inventory:itembarcode', args=(4006381333931,)))
+        self.assertRedirects(response, reverse('inventory:item', args=(self.item.pk,)))
+        response = self.client.get(reverse('inventory:itembarcode', args=(1234,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_resolve(self):
+        barcodes = ['4006381333931', '1234', 'junk']
+        locations = ['8a5ab1d3-b3f2-4ff3-9a4c-3f2b3c3c9a10', '00000000-0000-0000-0000-000000000000']
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('inventory:scan'),
+                                        json.dumps({'barcodes': barcodes, 'locations': locations}),
+                                        content_type='application/json')
+        data = response.json()
+        self.assertEqual([i['id'] for i in data['barcodes']['4006381333931']], [self.item.pk])
+        self.assertEqual(data['barcodes']['1234'], [])
+        self.assertEqual(data['barcodes']['junk'], [])
+        self.assertEqual(data['locations']['8a5ab1d3-b3f2-4ff3-9a4c-3f2b3c3c9a10']['id'], self.shelf.pk)
+        self.assertIsNone(data['locations']['00000000-0000-0000-0000-000000000000'])
+
+    def test_barcode_out_of_range(self):
+        response = self.client.post(reverse('inventory:scan'), {'barcode': ['99999999999999999999999', str(-2 ** 63)]})
+        self.assertEqual(response.json()['barcodes'], {'99999999999999999999999': [], str(-2 ** 63): []})
+        self.assertEqual(scan.parse_barcode(2 ** 63 - 1), 2 ** 63 - 1)
+        self.assertIsNone(scan.parse_barcode(2 ** 63))
+        response = self.client.get(reverse('inventory:itembarcode', args=(99999999999999999999999,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryBudgetTests(QueryBudgetMixin, InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        self.tools = Category.objects.create(name="Tools", description="", parent=self.everything)
+        for i in range(5):
+            box = Location.objects.create(name="Box {}".format(i), description="", parent=self.shelf)
+            self.create_item("Hammer {}".format(i), location=box, category=self.tools)
+        self.item = Item.objects.filter(name="Hammer 0").get()
+        LocationPrintList.objects.create(user=self.user).locations.add(self.shelf)
+
+    def test_list_views(self):
+        for name in ('inventory:index', 'inventory:locations', 'inventory:categories',
+                     'inventory:trash', 'inventory:profile', 'inventory:print_list',
+                     'inventory:export', 'inventory:itemimport'):
+            self.assertWithinBudget(name, reverse(name))
+
+    def test_detail_views(self):
+        self.assertWithinBudget('inventory:location', reverse('inventory:location', args=[self.shelf.pk]))
+        self.assertWithinBudget('inventory:category', reverse('inventory:category', args=[self.tools.pk]))
+        self.assertWithinBudget('inventory:categoryrollup',
+                                reverse('inventory:categoryrollup', args=[self.tools.pk]))
+        self.assertWithinBudget('inventory:item', reverse('inventory:item', args=[self.item.pk]))
+
+    def test_search(self):
+        self.assertWithinBudget('inventory:search', reverse('inventory:search') + '?q=hammer&type=item')
+
+
+@override_settings(MIDDLEWARE=['inventory.middleware.QueryStatsMiddleware'] + settings.MIDDLEWARE)
+class QueryStatsMiddlewareTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        query_stats.reset()
+
+    def test_server_timing_and_stats(self):
+        with self.assertLogs('inventory.querystats', 'INFO') as logs:
+            response = self.client.get(reverse('inventory:locations'))
+        self.assertIn('db;desc="', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'inventory:locations')
+        self.assertGreater(line['queries'], 0)
+
+        entry = query_stats.summary()[0]
+        self.assertEqual(entry['name'], 'inventory:locations')
+        self.assertEqual(entry['requests'], 1)
+        self.assertEqual(entry['max_queries'], line['queries'])
+
+    def test_unresolved_requests_share_one_entry(self):
+        with self.assertLogs('inventory.querystats', 'INFO'):
+            for n in range(3):
+                self.client.get('/nowhere/{}/'.format(n))
+        self.assertEqual([(entry['name'], entry['requests']) for entry in query_stats.summary()],
+                         [(UNRESOLVED, 3)])
+
+    def test_stats_page(self):
+        with self.assertLogs('inventory.querystats', 'INFO'):
+            self.client.get(reverse('inventory:index'))
+            response = self.client.get(reverse('inventory:stats_queries'))
+        self.assertContains(response, 'inventory:index')
+        with self.assertLogs('inventory.querystats', 'INFO'):
+            self.client.post(reverse('inventory:stats_queries'))
+        self.assertNotIn('inventory:index', [entry['name'] for entry in query_stats.summary()])
+
+
+class SeedTests(InventoryTestCase):
+
+    def test_seed(self):
+        location, category = seed.seed(items=200, location_depth=2, location_fanout=3,
+                                       category_depth=2, category_fanout=2, words=50)
+        self.assertEqual(location.get_descendant_count(), 12)
+        self.assertEqual(category.get_descendant_count(), 6)
+        self.assertEqual(list(category.get_children().values_list('name', flat=True)), ["Group 1", "Group 2"])
+        items = Item.objects.filter(location__tree_id=location.tree_id)
+        self.assertEqual(items.count(), 200)
+        self.assertFalse(items.exclude(location__level=2).exists())
+
+        location.refresh_from_db()
+        self.assertEqual(location.subtree_item_count, items.filter(state='d').count())
+        word = items.first().name.split()[0]
+        self.assertGreater(search.search('item', word).count(), 0)
+
+    def test_skew(self):
+        location, category = seed.seed(items=500, location_depth=1, location_fanout=10,
+                                       category_depth=1, category_fanout=1, skew=2, trashed=0)
+        counts = sorted(location.get_children().values_list('item_count', flat=True))
+        self.assertGreater(counts[-1], 250)
+
+
+class BenchmarkTests(InventoryTestCase):
+
+    def test_run(self):
+        report = benchmark.run(self.user, repeat=2, names=['locations', 'location', 'itemtrash', 'scan'])
+        self.assertEqual(set(report['views']), {'locations', 'location', 'itemtrash', 'scan'})
+        self.assertEqual(report['views']['locations']['status'], 200)
+        self.assertEqual(report['views']['scan']['status'], 405)
+        self.assertGreater(report['views']['location']['queries'], 0)
+        self.assertLessEqual(report['views']['location']['p50_ms'], report['views']['location']['p95_ms'])
+        # Changes made by the requests are rolled back
+        self.assertEqual(report['views']['itemtrash']['status'], 302)
+        self.assertFalse(Item.objects.filter(state='t').exists())
+
+    def test_routes(self):
+        requested, skipped = benchmark.routes(benchmark.samples())
+        paths = {name: path for name, path, query in requested}
+        self.assertEqual(paths['location'], reverse('inventory:location', args=[1]))
+        self.assertIn('locationfinduuid', skipped)
+
+
+class FragmentCacheTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        cache_stats.reset()
+
+    def get_location(self):
+        return self.client.get(reverse('inventory:location', args=[self.universe.pk]))
+
+    def test_hit_and_invalidation(self):
+        with CaptureQueriesContext(connection) as miss:
+            self.assertContains(self.get_location(), "Shelf")
+        self.assertEqual(cache_stats.summary()[-1], {'name': 'sublocations', 'hits': 0, 'misses': 1, 'ratio': 0})
+        with CaptureQueriesContext(connection) as hit:
+            self.assertContains(self.get_location(), "Shelf")
+        self.assertEqual(cache_stats.summary()[-1]['hits'], 1)
+        self.assertLess(len(hit), len(miss))
+
+        self.shelf.name = "Rack"
+        self.shelf.save()
+        self.assertContains(self.get_location(), "Rack")
+        self.assertEqual(cache_stats.summary()[-1]['misses'], 2)
+
+    def test_changes_of_other_processes_invalidate(self):
+        Location.objects.create(name="Bin", description="", parent=Location.objects.create(name="Elsewhere",
+                                                                                            description=""))
+        self.assertNotContains(self.get_location(), "Bin")
+        # A management command, in a process with a cache of its own
+        with mock.patch('inventory.cache.cache', LocMemCache('other', {})):
+            call_command('move_nodes', 'Elsewhere/Bin', '--to', 'Universe/Shelf', stdout=io.StringIO())
+        self.assertContains(self.get_location(), "Bin")
+
+    def test_items_invalidate_counters(self):
+        self.assertContains(self.get_location(), '<td>0</td>', html=True)
+        self.create_item("Screws", location=self.shelf, amount=5)
+        self.assertContains(self.get_location(), '<td>1</td>', html=True)
+
+    def test_other_trees_stay_cached(self):
+        self.get_location()
+        Location.objects.create(name="Elsewhere", description="")
+        self.get_location()
+        self.assertEqual(cache_stats.summary()[-1]['hits'], 1)
+
+    def test_category_fragments(self):
+        url = reverse('inventory:category', args=[self.everything.pk])
+        self.client.get(url)
+        Category.objects.create(name="Tools", description="", parent=self.everything)
+        self.assertContains(self.client.get(url), "Tools")
+        # With checkboxes for users who may trash categories
+        self.assertEqual(cache_stats.summary()[-1], {'name': 'subcategories-bulk', 'hits': 0, 'misses': 2, 'ratio': 0})
+
+    def test_refused_trash_caches_full_fragments(self):
+        Location.objects.create(name="Bin", description="", parent=self.shelf)
+        response = self.client.get(reverse('inventory:locationtrash', args=[self.shelf.pk]))
+        self.assertContains(response, "Cannot trash location with sublocations.")
+        self.assertContains(response, "Bin")
+        self.assertContains(self.client.get(reverse('inventory:location', args=[self.shelf.pk])), "Bin")
+
+        tools = Category.objects.create(name="Tools", description="", parent=self.everything)
+        Category.objects.create(name="Hammers", description="", parent=tools)
+        self.client.get(reverse('inventory:categorytrash', args=[tools.pk]))
+        self.assertContains(self.client.get(reverse('inventory:category', args=[tools.pk])), "Hammers")
+
+    def test_bulk_insert_invalidates(self):
+        self.get_location()
+        tree.create_grid(self.shelf, [("Bin {n}", 3)])
+        self.assertContains(self.get_location(), "Bin 3")
+
+
+class LocationTreeTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        tree.create_grid(self.universe, [("Room {n}", 2), ("Shelf {n}", 2), ("Box {n}", 2), ("Bin {n}", 2)])
+        self.room = Location.objects.get(name="Room 1")
+
+    def test_detail_renders_limited_depth(self):
+        response = self.client.get(reverse('inventory:location', args=[self.universe.pk]))
+        self.assertEqual({node.level for node in response.context['location_list']}, {1, 2})
+        self.assertContains(response, 'data-children="{}"'.format(
+            reverse('inventory:locationchildren', args=[Location.objects.filter(name="Shelf 1").first().pk])))
+        self.assertNotContains(response, "Box 1")
+
+    def test_children(self):
+        shelf = self.room.get_children().first()
+        self.create_item("Screws", location=shelf.get_children().first(), amount=5)
+        Location.objects.filter(pk=self.room.get_children().last().pk).update(state='t')
+        with self.assertNumQueries(5):
+            data = self.client.get(reverse('inventory:locationchildren', args=[self.room.pk])).json()
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get(reverse('inventory:locationchildren', args=[self.room.pk])).json(), data)
+        self.assertEqual(data['id'], self.room.pk)
+        self.assertEqual(len(data['children']), 1)
+        child = data['children'][0]
+        self.assertEqual((child['name'], child['level'], child['child_count'], child['is_leaf']),
+                         ("Shelf 1", 2, 2, False))
+        self.assertEqual(child['subtree_item_count'], 1)
+        self.assertEqual(child['url'], reverse('inventory:location', args=[shelf.pk]))
+
+        leaves = self.client.get(child['children_url']).json()['children'][0]
+        leaves = self.client.get(leaves['children_url']).json()['children']
+        self.assertTrue(all(leaf['is_leaf'] for leaf in leaves))
+
+
+class CursorPaginationTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Equal names, so the primary key has to break ties
+        self.items = [self.create_item(name) for name in ["Bolt", "Nut", "Bolt", "Washer", "Nut", "Anchor", "Bolt"]]
+
+    def walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_and_back(self):
+        queryset = Item.objects.exclude(pk=1)
+        paginator = pagination.CursorPaginator(queryset, 3, ('name', 'pk'))
+        pages = self.walk(paginator)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([item for page in pages for item in page], list(queryset.order_by('name', 'pk')))
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        back = paginator.page(back.previous_cursor)
+        self.assertEqual(list(back), list(pages[0]))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_descending_dates(self):
+        now = timezone.now()
+        for i, item in enumerate(self.items):
+            Item.objects.filter(pk=item.pk).update(creation_date=now - timedelta(days=i % 3))
+        queryset = Item.objects.exclude(pk=1)
+        pages = self.walk(pagination.CursorPaginator(queryset, 2, ('-creation_date', '-pk')))
+        self.assertEqual([item for page in pages for item in page],
+                         list(queryset.order_by('-creation_date', '-pk')))
+
+    def test_invalid_cursor_is_first_page(self):
+        paginator = pagination.CursorPaginator(Item.objects.all(), 3, ('name', 'pk'))
+        self.assertEqual(list(paginator.page('garbage')), list(paginator.page()))
+
+    def test_trash_links_keep_type(self):
+        for i in range(20):
+            self.create_item("Spring {}".format(i))
+        Item.objects.update(state='t')
+        response = self.client.get(reverse('inventory:trash'), {'type': 'item'})
+        page = response.context['page_obj']
+        self.assertEqual(response.context['paginator'].estimate, 28)
+        self.assertEqual([item.name for item in page][:3], ["Anchor", "Bolt", "Bolt"])
+        self.assertIn('type=item', page.next_query)
+        self.assertContains(response, "28 entries")
+        response = self.client.get(reverse('inventory:trash') + '?' + page.next_query)
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertTrue(response.context['page_obj'].has_previous())
+
+    def test_search_pages_follow_ranking(self):
+        for i in range(30):
+            self.create_item("Drill {}".format(i), description="drill" if i % 2 else "")
+        first = self.client.get(reverse('inventory:search'), {'q': 'drill', 'type': 'item'}).context['page_obj']
+        self.assertEqual(len(first), 25)
+        second = self.client.get(reverse('inventory:search') + '?' + first.next_query).context['page_obj']
+        self.assertEqual(len(second), 5)
+        names = [item.name for item in list(first) + list(second)]
+        self.assertEqual(len(set(names)), 30)
+        self.assertEqual(list(search.search('item', 'drill')), list(first) + list(second))
+
+    @override_settings(CURSOR_PAGINATION=False)
+    def test_page_numbers(self):
+        response = self.client.get(reverse('inventory:location', args=[self.universe.pk]), {'page': 1})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertContains(response, '?page=1')
+
+
+class ListQueryTests(QueryBudgetMixin, InventoryTestCase):
+    """The number of queries of the list views must not depend on the number of rows shown."""
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        self.tools = Category.objects.create(name="Tools", description="", parent=self.everything)
+        self.add_rows(2)
+
+    def add_rows(self, n, state='d'):
+        for i in range(n):
+            box = Location.objects.create(name="Box", description="", parent=self.shelf, state=state)
+            Category.objects.create(name="Hammers", description="", parent=self.tools, state=state)
+            self.create_item("Hammer", location=self.shelf, category=self.tools, state=state)
+            self.create_item("Hammer", location=box, category=self.tools, state=state)
+        cache.clear()
+
+    def test_views(self):
+        for name, args, query in [('inventory:index', [], {}),
+                                  ('inventory:locations', [], {}),
+                                  ('inventory:categories', [], {}),
+                                  ('inventory:location', [self.shelf.pk], {}),
+                                  ('inventory:category', [self.tools.pk], {}),
+                                  ('inventory:search', [], {'q': 'hammer', 'type': 'item'}),
+                                  ('inventory:locationfindfreeslot', [], {})]:
+            with self.subTest(name):
+                self.assertQueriesIndependentOf(lambda: self.add_rows(3), name, reverse(name, args=args), data=query)
+
+    def test_trash(self):
+        self.add_rows(2, state='t')
+        for kind in ('item', 'location', 'category'):
+            with self.subTest(kind):
+                self.assertQueriesIndependentOf(lambda: self.add_rows(3, state='t'), 'inventory:trash',
+                                                reverse('inventory:trash'), data={'type': kind})
+
+    def test_item(self):
+        item = Item.objects.filter(name="Hammer").first()
+        with self.assertNumQueries(budgets['inventory:item']):
+            response = self.client.get(reverse('inventory:item', args=[item.pk]))
+        self.assertContains(response, "Tools")
+
+
+class LocationCapacityTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe, capacity=100)
+        self.small = Location.objects.create(name="Small bin", description="", parent=self.shelf, capacity=5)
+        self.big = Location.objects.create(name="Big bin", description="", parent=self.shelf, capacity=50)
+        self.full = Location.objects.create(name="Full bin", description="", parent=self.shelf,
+                                            capacity=50, free_space=False)
+
+    def free(self, location):
+        location.refresh_from_db()
+        return location.free_capacity
+
+    def test_items_use_capacity(self):
+        self.assertEqual(self.free(self.big), 50)
+        item = self.create_item("Screws", location=self.big, amount=20)
+        self.assertEqual(self.free(self.big), 30)
+        item.location = self.small
+        item.save()
+        self.assertEqual(self.free(self.big), 50)
+        self.assertEqual(self.free(self.small), -15)
+        item.state = 't'
+        item.save()
+        self.assertEqual(self.free(self.small), 5)
+        self.assertIsNone(self.free(self.universe))
+
+    def test_editing_capacity(self):
+        self.create_item("Screws", location=self.big, amount=20)
+        big = Location.objects.get(pk=self.big.pk)
+        big.capacity = 30
+        big.save()
+        self.assertEqual(self.free(self.big), 10)
+        big.capacity = None
+        big.save()
+        self.assertIsNone(self.free(self.big))
+
+    def test_recount(self):
+        self.create_item("Screws", location=self.big, amount=20)
+        Location.objects.update(free_capacity=None)
+        counters.recount()
+        self.assertEqual(self.free(self.big), 30)
+        self.assertEqual(self.free(self.shelf), 100)
+
+    def test_fitting(self):
+        self.create_item("Screws", location=self.shelf, amount=90)
+        self.shelf.refresh_from_db()
+        self.assertEqual(list(Location.objects.fitting(11, within=self.shelf)), [self.big])
+        self.assertEqual(list(Location.objects.fitting(5, within=self.shelf)), [self.shelf, self.small, self.big])
+        self.assertEqual(list(Location.objects.fitting(1, within=self.small)), [self.small])
+        self.assertEqual(list(Location.objects.fitting(60)), [])
+
+    def test_find_free_slot(self):
+        response = self.client.get(reverse('inventory:locationfindfreeslot'),
+                                   {'amount': 10, 'location': self.shelf.pk})
+        self.assertEqual(list(response.context['location_list']), [self.shelf, self.big])
+        self.assertContains(response, "Big bin")
+        self.assertNotContains(response, "Small bin")
+        response = self.client.get(reverse('inventory:locationfindfreeslot'))
+        self.assertContains(response, "Full bin", count=0)
+        self.assertContains(response, "Small bin")
+
+    def test_new_location_with_capacity(self):
+        self.client.post(reverse('inventory:locationnew', args=[self.shelf.pk]),
+                         {'name': "Drawer", 'description': "Top", 'parent': self.shelf.pk,
+                          'free_space': 'on', 'capacity': 12})
+        self.assertEqual(Location.objects.get(name="Drawer").free_capacity, 12)
+
+    def test_new_grid_with_capacity(self):
+        self.client.post(reverse('inventory:locationnewmulti', args=[self.shelf.pk]),
+                         {'name': "Tray", 'description': "Tray", 'parent': self.shelf.pk, 'capacity': 8,
+                          'amount': 2, 'sub_name': "Slot", 'sub_amount': 3})
+        self.assertEqual(Location.objects.get(name="Tray 1").capacity, None)
+        self.assertEqual(list(Location.objects.filter(name__startswith="Slot").values_list('capacity', 'free_capacity')),
+                         [(8, 8)] * 6)
+
+
+class BulkTrashTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rack = self.create_rack("Rack", 2)
+        self.bin = self.rack.get_children()[0]
+
+    def create_rack(self, name, bins):
+        rack = Location.objects.create(name=name, description="", parent=self.universe)
+        tree.create_grid(rack, [("Bin {n}", bins)])
+        rack.refresh_from_db()
+        for bin in rack.get_children():
+            self.create_item("Screws", location=bin, amount=5)
+        return rack
+
+    def test_trash_subtree(self):
+        self.assertEqual(trash.trash_subtrees(Location, [self.rack.pk, self.bin.pk]), 3)
+        self.assertEqual(Location.objects.trashed().count(), 3)
+        self.assertEqual(Item.objects.trashed().count(), 2)
+        self.universe.refresh_from_db()
+        self.assertEqual(self.universe.subtree_item_count, 1)
+
+        self.assertEqual(trash.untrash_subtrees(Location, [self.bin.pk]), 2)
+        self.assertEqual(set(Location.objects.active().filter(tree_id=self.rack.tree_id)),
+                         {self.universe, self.rack, self.bin})
+        self.assertEqual(list(Item.objects.active().filter(location=self.bin).values_list('state', flat=True)), ['d'])
+        self.universe.refresh_from_db()
+        self.assertEqual(self.universe.subtree_item_count, 2)
+
+    def test_trash_subtree_queries_do_not_depend_on_size(self):
+        big = self.create_rack("Big rack", 20)
+        with CaptureQueriesContext(connection) as small_queries:
+            trash.trash_subtrees(Location, [self.rack.pk])
+        with CaptureQueriesContext(connection) as big_queries:
+            trash.trash_subtrees(Location, [big.pk])
+        self.assertEqual(len(small_queries), len(big_queries))
+
+    def test_roots_are_protected(self):
+        self.assertEqual(trash.trash_subtrees(Location, [self.universe.pk]), 0)
+        self.assertEqual(trash.trash_subtrees(Category, [self.everything.pk]), 0)
+
+    def test_purge_items(self):
+        trash.trash_items(Item.objects.filter(location__parent=self.rack).values_list('pk', flat=True))
+        self.assertEqual(trash.purge(Item, batch_size=1), 2)
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_purge_keeps_locations_with_active_content(self):
+        other = self.rack.get_children()[1]
+        trash.trash_subtrees(Location, [self.rack.pk])
+        trash.untrash_items(Item.objects.filter(location=other).values_list('pk', flat=True))
+        self.assertEqual(trash.purge(Location, batch_size=1), 1)
+        self.assertFalse(Location.objects.filter(pk=self.bin.pk).exists())
+        self.assertTrue(Location.objects.filter(pk=other.pk).exists())
+        # The gaps left by the deleted nodes are closed
+        self.rack.refresh_from_db()
+        self.assertEqual(self.rack.get_descendant_count(), 1)
+        self.universe.refresh_from_db()
+        self.assertEqual(self.universe.get_descendant_count(), 2)
+
+    def test_purge_batches_are_bounded(self):
+        big = self.create_rack("Big rack", 6)
+        trash.trash_subtrees(Location, [big.pk])
+        original = trash.batches
+        deleted = []
+
+        def batches(queryset, fields, batch_size, pause):
+            for rows in original(queryset, fields, batch_size, pause):
+                before = Location.objects.count() + Item.objects.count()
+                yield rows
+                deleted.append((len(rows), before - Location.objects.count() - Item.objects.count()))
+
+        with mock.patch('inventory.trash.batches', batches):
+            self.assertEqual(trash.purge(Location, pks=[big.pk], batch_size=4), 7)
+        # The items, the bins, the rack: no batch deleted more than its own rows
+        self.assertEqual(deleted, [(4, 4), (2, 2), (4, 4), (2, 2), (1, 1)])
+        self.universe.refresh_from_db()
+        self.assertEqual(self.universe.get_descendant_count(), 3)
+
+    def test_purge_closes_gaps(self):
+        racks = [self.create_rack("Rack {}".format(n), 3) for n in range(4)]
+        tree.create_grid(racks[2].get_children()[0], [("Box {n}", 2)])
+        trash.trash_subtrees(Location, [racks[0].pk, racks[2].pk, self.bin.pk])
+        self.assertEqual(trash.purge(Location, batch_size=2), 4 + 6 + 1)
+        positions = list(Location.objects.order_by('pk').values_list('pk', 'lft', 'rght', 'level'))
+        Location.objects.partial_rebuild(self.universe.tree_id)
+        self.assertEqual(list(Location.objects.order_by('pk').values_list('pk', 'lft', 'rght', 'level')), positions)
+        self.universe.refresh_from_db()
+        self.assertEqual(self.universe.get_descendant_count(), 2 + 4 + 4)
+
+    def test_archive_sets_change_date(self):
+        trash.trash_subtrees(Location, [self.rack.pk])
+        before = timezone.now()
+        self.assertEqual(trash.archive(Item), 2)
+        self.assertTrue(all(date >= before for date in Item.objects.filter(state='a')
+                            .values_list('change_date', flat=True)))
+
+    def test_view(self):
+        items = list(Item.objects.filter(location__parent=self.rack).values_list('pk', flat=True))
+        response = self.client.post(reverse('inventory:trashbulk'),
+                                    {'type': 'item', 'action': 'trash', 'selected': items})
+        self.assertRedirects(response, reverse('inventory:trash') + '?type=item')
+        self.assertEqual(Item.objects.trashed().count(), 2)
+        response = self.client.get(reverse('inventory:trash'), {'type': 'item'})
+        self.assertContains(response, 'name="selected" value', count=2)
+
+        self.client.post(reverse('inventory:trashbulk'), {'type': 'item', 'action': 'delete', 'selected': items})
+        self.assertEqual(Item.objects.count(), 1)
+
+        response = self.client.post(reverse('inventory:trashbulk'),
+                                    {'type': 'location', 'action': 'trash', 'selected': [self.rack.pk],
+                                     'next': reverse('inventory:location', args=[self.universe.pk])})
+        self.assertRedirects(response, reverse('inventory:location', args=[self.universe.pk]))
+        self.assertEqual(Location.objects.trashed().count(), 3)
+
+    def test_lists_are_selectable(self):
+        tools = Category.objects.create(name="Tools", description="", parent=self.everything)
+        pages = [
+            (reverse('inventory:location', args=[self.universe.pk]), ['item', 'location']),
+            (reverse('inventory:location', args=[self.rack.pk]), ['location']),
+            (reverse('inventory:category', args=[self.everything.pk]), ['item', 'category']),
+            (reverse('inventory:locations'), ['location']),
+            (reverse('inventory:categories'), ['category']),
+            (reverse('inventory:index'), ['item', 'location', 'category']),
+        ]
+        for url, kinds in pages:
+            response = self.client.get(url)
+            for kind in kinds:
+                self.assertContains(response, '<form id="bulk-{}"'.format(kind), count=1)
+                self.assertContains(response, 'form="bulk-{}"'.format(kind))
+            self.assertContains(response, 'Trash selected', count=len(kinds))
+        self.assertContains(self.client.get(reverse('inventory:category', args=[self.everything.pk])),
+                            'name="selected" value="{}" form="bulk-category"'.format(tools.pk))
+
+        # What the form on the location page posts
+        response = self.client.post(reverse('inventory:trashbulk'), {
+            'type': 'location', 'next': reverse('inventory:location', args=[self.universe.pk]),
+            'action': 'trash', 'selected': [self.rack.pk]})
+        self.assertRedirects(response, reverse('inventory:location', args=[self.universe.pk]))
+        self.assertEqual(Location.objects.trashed().count(), 3)
+
+    def test_lists_without_trash_permission(self):
+        user = User.objects.create_user('viewer')
+        user.user_permissions.set(Permission.objects.filter(codename__in=[
+            'view_item', 'view_location', 'view_category']))
+        self.client.force_login(user)
+        response = self.client.get(reverse('inventory:location', args=[self.universe.pk]))
+        self.assertContains(response, 'form="bulk-location"')
+        self.assertNotContains(response, 'Trash selected')
+        response = self.client.get(reverse('inventory:category', args=[self.everything.pk]))
+        self.assertNotContains(response, 'form="bulk-category"')
+
+    def test_view_permissions(self):
+        self.client.force_login(User.objects.create_user('user'))
+        response = self.client.post(reverse('inventory:trashbulk'),
+                                    {'type': 'location', 'action': 'trash', 'selected': [self.rack.pk]})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Location.objects.trashed().count(), 0)
+
+
+class PurgeTrashCommandTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="", parent=self.universe)
+        self.old = self.create_item("Old", location=self.shelf, state='t')
+        self.new = self.create_item("New", location=self.shelf, state='t')
+        trash.trash_subtrees(Location, [self.shelf.pk])
+        long_ago = timezone.now() - timedelta(days=40)
+        Item.objects.filter(pk=self.old.pk).update(change_date=long_ago)
+        Location.objects.filter(pk=self.shelf.pk).update(change_date=long_ago)
+
+    def test_purge(self):
+        out = io.StringIO()
+        call_command('purge_trash', '--older-than', '30', '--pause', '0', '--batch-size', '1', stdout=out)
+        self.assertIn("Deleted 1 item(s)", out.getvalue())
+        self.assertEqual(list(Item.objects.trashed()), [self.new])
+        # The shelf still holds a trashed item which is not old enough
+        self.assertIn("Deleted 0 location(s)", out.getvalue())
+
+        call_command('purge_trash', '--older-than', '0', '--pause', '0', stdout=io.StringIO())
+        self.assertFalse(Location.objects.filter(pk=self.shelf.pk).exists())
+        self.universe.refresh_from_db()
+        self.assertTrue(self.universe.is_leaf_node())
+
+    def test_archive(self):
+        call_command('purge_trash', '--archive', '--type', 'item', '--older-than', '30', '--pause', '0',
+                     stdout=io.StringIO())
+        self.assertEqual(Item.objects.get(pk=self.old.pk).state, 'a')
+        self.assertEqual(Item.objects.get(pk=self.new.pk).state, 't')
+        self.assertEqual(Location.objects.get(pk=self.shelf.pk).state, 't')
+
+
+class MoveTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = Location.objects.create(name="Old shelf", description="", parent=self.universe)
+        tree.create_grid(self.old, [("Box {n}", 5), ("Bin {n}", 2)])
+        self.new = Location.objects.create(name="New shelf", description="", parent=self.universe)
+        self.old.refresh_from_db()
+        self.boxes = list(self.old.get_children())
+        self.create_item("Screws", location=self.boxes[0].get_children()[0], amount=5)
+
+    def assertValidTree(self, model, tree_id):
+        expected = {node.pk: (node.lft, node.rght, node.level) for node in model.objects.filter(tree_id=tree_id)}
+        model.objects.partial_rebuild(tree_id)
+        self.assertEqual({node.pk: (node.lft, node.rght, node.level)
+                          for node in model.objects.filter(tree_id=tree_id)}, expected)
+
+    def test_move(self):
+        Location.objects.create(name="Existing", description="", parent=self.new)
+        self.assertEqual(tree.move(self.boxes[:3] + [self.boxes[0].get_children()[1]], self.new), 3)
+        self.new.refresh_from_db()
+        self.assertEqual([node.name for node in self.new.get_children()], ["Existing", "Box 1", "Box 2", "Box 3"])
+        self.assertEqual(self.new.get_descendant_count(), 10)
+        self.assertEqual(self.new.subtree_item_count, 1)
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.subtree_item_count, 0)
+        self.assertValidTree(Location, self.universe.tree_id)
+
+    def test_move_between_trees(self):
+        root = Location.objects.create(name="Other building", description="")
+        tree.create_grid(root, [("Room {n}", 2)])
+        root.refresh_from_db()
+        tree.move([root, self.boxes[4]], self.new)
+        self.assertEqual(set(Location.objects.filter(tree_id=root.tree_id)), set())
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.get_descendant_count(), 6)
+        self.assertValidTree(Location, self.universe.tree_id)
+
+    def test_cycles_are_refused(self):
+        with self.assertRaises(ValueError):
+            tree.move([self.old], self.boxes[0])
+        self.assertEqual(Location.objects.get(pk=self.old.pk).parent, self.universe)
+
+    def test_ordered_tree(self):
+        tools = Category.objects.create(name="Tools", description="", parent=self.everything)
+        for name in ("Saws", "Hammers", "Drills"):
+            Category.objects.create(name=name, description="", parent=self.everything)
+        Category.objects.create(name="Clamps", description="", parent=tools)
+        tools.refresh_from_db()
+        tree.move(Category.objects.filter(name__in=["Saws", "Drills"]), tools)
+        tools.refresh_from_db()
+        self.assertEqual([node.name for node in tools.get_children()], ["Clamps", "Drills", "Saws"])
+        self.assertValidTree(Category, tools.tree_id)
+
+    def test_queries_do_not_depend_on_size(self):
+        with CaptureQueriesContext(connection) as small:
+            tree.move(self.boxes[1:2], self.new)
+        with CaptureQueriesContext(connection) as big:
+            tree.move(self.boxes[2:], self.new)
+        self.assertEqual(len(small), len(big))
+
+    def test_view(self):
+        response = self.client.get(reverse('inventory:locationmove', args=[self.old.pk]))
+        self.assertContains(response, "Box 5")
+        response = self.client.post(reverse('inventory:locationmove', args=[self.old.pk]),
+                                    {'nodes': [box.pk for box in self.boxes], 'target': self.new.pk})
+        self.assertRedirects(response, reverse('inventory:location', args=[self.new.pk]))
+        self.assertEqual(Location.objects.filter(parent=self.new).count(), 5)
+        response = self.client.post(reverse('inventory:locationmove', args=[self.universe.pk]),
+                                    {'nodes': [self.new.pk], 'target': self.boxes[0].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "own subtree")
+
+    def test_only_moved_nodes_are_logged(self):
+        cursor = changelog.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            tree.move(self.boxes[1:3], self.new)
+        self.assertEqual(sorted(Change.objects.filter(pk__gt=cursor).values_list('object_id', flat=True)),
+                         sorted(box.pk for box in self.boxes[1:3]))
+
+    def test_move_out_of_a_tree_updates_it(self):
+        root = Location.objects.create(name="Other building", description="")
+        tree.create_grid(root, [("Room {n}", 2)])
+        root.refresh_from_db()
+        room = root.get_children()[0]
+        self.create_item("Chair", location=room)
+        version = cache_version(tree_name(Location, root.tree_id))
+        tree.move([room], self.new)
+        self.assertGreater(cache_version(tree_name(Location, root.tree_id)), version)
+        root.refresh_from_db()
+        self.assertEqual(root.subtree_item_count, 0)
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.subtree_item_count, 1)
+
+    def test_view_takes_a_path(self):
+        response = self.client.get(reverse('inventory:locationmove', args=[self.old.pk]))
+        self.assertNotContains(response, '<option')
+        response = self.client.post(reverse('inventory:locationmove', args=[self.old.pk]),
+                                    {'nodes': [self.boxes[0].pk], 'target': 'universe/new shelf'})
+        self.assertRedirects(response, reverse('inventory:location', args=[self.new.pk]))
+        response = self.client.post(reverse('inventory:locationmove', args=[self.old.pk]),
+                                    {'nodes': [self.boxes[1].pk], 'target': 'Universe/Nowhere'})
+        self.assertTrue(response.context['form'].has_error('target'))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('move_nodes', '--children-of', 'Universe/Old shelf', '--to', str(self.new.pk), stdout=out)
+        self.assertIn("Moved 5 location(s)", out.getvalue())
+        self.assertEqual(Location.objects.filter(parent=self.new).count(), 5)
+        # Like the view, by UUID too
+        uuid = uuid4()
+        Location.objects.filter(pk=self.old.pk).update(uuid=uuid)
+        call_command('move_nodes', str(self.boxes[0].pk), '--to', str(uuid), stdout=out)
+        self.assertEqual(list(self.old.get_children()), [self.boxes[0]])
+        with self.assertRaises(CommandError):
+            call_command('move_nodes', 'universe/new shelf/nowhere', '--to', str(self.old.pk), stdout=out)
+
+
+class LendingTests(QueryBudgetMixin, InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.drill = self.create_item("Drill")
+        self.saw = self.create_item("Saw")
+
+    def test_lend_and_return(self):
+        response = self.client.post(reverse('inventory:itemlend', args=[self.drill.pk]),
+                                    {'borrower': "Alice", 'due_date': '2020-01-01'})
+        self.assertRedirects(response, reverse('inventory:item', args=[self.drill.pk]))
+        self.drill.refresh_from_db()
+        self.assertTrue(self.drill.lent)
+        self.assertEqual(self.drill.lent_to, "Alice")
+        self.assertEqual(list(Loan.objects.overdue().values_list('borrower', flat=True)), ["Alice"])
+
+        self.client.get(reverse('inventory:itemreturn', args=[self.drill.pk]))
+        self.drill.refresh_from_db()
+        self.assertFalse(self.drill.lent)
+        self.assertEqual(Loan.objects.outstanding().count(), 0)
+        self.assertIsNotNone(Loan.objects.get().returned_date)
+
+        lending.lend(self.drill, "Bob")
+        response = self.client.get(reverse('inventory:item', args=[self.drill.pk]))
+        self.assertContains(response, "Alice")
+        self.assertContains(response, "Bob")
+
+    def test_returning_an_item_which_is_not_lent(self):
+        response = self.client.get(reverse('inventory:itemreturn', args=[self.saw.pk]))
+        self.assertRedirects(response, reverse('inventory:item', args=[self.saw.pk]))
+
+    def test_lending_again_closes_the_open_loan(self):
+        lending.lend(self.drill, "Alice")
+        lending.lend(self.drill, "Bob")
+        self.assertEqual(list(Loan.objects.outstanding().values_list('borrower', flat=True)), ["Bob"])
+
+    def test_dashboard(self):
+        lending.lend(self.drill, "Alice", due_date=timezone.localdate() - timedelta(days=1))
+        lending.lend(self.saw, "Bob", due_date=timezone.localdate() + timedelta(days=1))
+        lending.give_back(self.saw)
+        lending.lend(self.saw, "Carol")
+        for status, borrower, expected in [('outstanding', '', ["Drill", "Saw"]),
+                                           ('overdue', '', ["Drill"]),
+                                           ('all', '', ["Saw", "Saw", "Drill"]),
+                                           ('all', 'Bob', ["Saw"])]:
+            with self.subTest(status=status, borrower=borrower):
+                response = self.client.get(reverse('inventory:lent'), {'status': status, 'borrower': borrower})
+                self.assertEqual([loan.item.name for loan in response.context['page_obj']], expected)
+
+    def test_dashboard_queries(self):
+        def lend_more():
+            for i in range(3):
+                lending.lend(self.create_item("Hammer"), "Alice")
+        lend_more()
+        self.assertQueriesIndependentOf(lend_more, 'inventory:lent', reverse('inventory:lent'))
+        self.assertQueriesIndependentOf(lend_more, 'inventory:item', reverse('inventory:item', args=[self.drill.pk]))
+
+
+@override_settings(CHANGES_DELAY=0)
+class ChangeLogTests(InventoryTestCase):
+
+    def changes(self, since, **params):
+        response = self.client.get(reverse('inventory:changes'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def committed(self):
+        # Changes are logged when the transaction commits
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_saves_and_deletes_since_cursor(self):
+        cursor = self.client.get(reverse('inventory:changes')).json()['cursor']
+        with self.committed():
+            drill = self.create_item("Drill")
+            saw = self.create_item("Saw").pk
+            Item.objects.get(pk=saw).delete()
+        data = self.changes(cursor)
+        self.assertFalse(data['more'])
+        self.assertEqual([item['name'] for item in data['changes']['item']['saved']], ["Drill"])
+        self.assertEqual(data['changes']['item']['deleted'], [saw])
+        self.assertEqual(data['changes']['location'], {'saved': [], 'deleted': []})
+
+        drill.name = "Hammer drill"
+        with self.committed():
+            drill.save()
+        data = self.changes(data['cursor'])
+        self.assertEqual([item['name'] for item in data['changes']['item']['saved']], ["Hammer drill"])
+        self.assertEqual(self.changes(data['cursor'])['changes']['item']['saved'], [])
+
+    def test_set_based_operations_are_logged(self):
+        shelf = Location.objects.create(name="Shelf", description="Shelf", parent=self.universe)
+        drill = self.create_item("Drill", location=shelf)
+        cursor = changelog.current()
+        with self.committed():
+            trash.trash_subtrees(Location, [shelf.pk])
+        data = self.changes(cursor)
+        self.assertEqual([(item['id'], item['state']) for item in data['changes']['item']['saved']],
+                         [(drill.pk, 't')])
+        self.assertEqual([location['id'] for location in data['changes']['location']['saved']], [shelf.pk])
+
+        cursor = data['cursor']
+        with self.committed():
+            trash.purge(Location, pks=[shelf.pk])
+        data = self.changes(cursor)
+        self.assertEqual(data['changes']['item']['deleted'], [drill.pk])
+        self.assertEqual(data['changes']['location']['deleted'], [shelf.pk])
+
+    def test_batches_and_types(self):
+        cursor = changelog.current()
+        with self.committed():
+            for name in ("A", "B", "C"):
+                self.create_item(name)
+            Category.objects.create(name="Tools", description="Tools", parent=self.everything)
+        data = self.changes(cursor, limit=2)
+        self.assertTrue(data['more'])
+        self.assertEqual([item['name'] for item in data['changes']['item']['saved']], ["A", "B"])
+        data = self.changes(data['cursor'], type='category')
+        self.assertEqual(list(data['changes']), ['category'])
+        self.assertEqual([category['name'] for category in data['changes']['category']['saved']], ["Tools"])
+
+    def test_delay(self):
+        cursor = changelog.current()
+        with self.committed():
+            self.create_item("Drill")
+        with self.settings(CHANGES_DELAY=60):
+            data = self.changes(cursor)
+        self.assertEqual(data['cursor'], cursor)
+        self.assertEqual(data['changes']['item']['saved'], [])
+
+    def test_logged_at_commit(self):
+        cursor = changelog.current()
+        with self.committed():
+            with transaction.atomic():
+                self.create_item("Drill")
+                # Nothing is logged before the commit
+                self.assertEqual(changelog.current(), cursor)
+        self.assertEqual(Change.objects.filter(pk__gt=cursor).count(), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('inventory:changes'), {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="Shelf", parent=self.universe,
+                                             uuid='6f2b1f9e-0c57-4b8e-9a4c-7d3e2c1b0a99')
+        self.drill = self.create_item("Drill", location=self.shelf)
+
+    def get(self, url):
+        # The first response sets the CSRF cookie, which is part of the ETag
+        self.client.get(url)
+        return self.client.get(url)
+
+    def assertNotModifiedUntil(self, url, change, queries=4):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        # Session, user, the object and the cache versions (none for items)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        etag = response['ETag']
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_item(self):
+        url = reverse('inventory:item', args=[self.drill.pk])
+        self.assertNotModifiedUntil(url, lambda: lending.lend(self.drill, "Alice"), queries=3)
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_item_shows_location_name(self):
+        def rename():
+            self.shelf.name = "Top shelf"
+            self.shelf.save()
+        self.assertNotModifiedUntil(reverse('inventory:item', args=[self.drill.pk]), rename, queries=3)
+
+    def test_location(self):
+        def rename():
+            self.drill.name = "Hammer drill"
+            self.drill.save()
+        self.assertNotModifiedUntil(reverse('inventory:location', args=[self.shelf.pk]), rename)
+
+    def test_item_without_location_and_category(self):
+        Item.objects.filter(pk=self.drill.pk).update(location=None, category=None)
+        url = reverse('inventory:item', args=[self.drill.pk])
+        self.assertNotModifiedUntil(url, lambda: lending.lend(self.drill, "Alice"), queries=3)
+
+    def test_changes_of_other_processes(self):
+        url = reverse('inventory:location', args=[self.universe.pk])
+        etag = self.get(url)['ETag']
+        Location.objects.create(name="Bin", description="", parent=Location.objects.create(name="Elsewhere",
+                                                                                            description=""))
+        # A management command, in a process with a cache of its own
+        with mock.patch('inventory.cache.cache', LocMemCache('other', {})):
+            call_command('move_nodes', 'Elsewhere/Bin', '--to', 'Universe/Shelf', stdout=io.StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Bin")
+
+    def test_location_other_tree(self):
+        url = reverse('inventory:location', args=[self.shelf.pk])
+        etag = self.get(url)['ETag']
+        Location.objects.create(name="Other", description="Other tree")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(url + '?cursor=x', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_location_find_uuid(self):
+        url = reverse('inventory:locationfinduuid', args=[self.shelf.uuid])
+        self.assertNotModifiedUntil(url, lambda: Location.objects.create(name="Bin", description="Bin",
+                                                                         parent=self.shelf))
+
+    def test_category(self):
+        def rename():
+            self.shelf.name = "Top shelf"
+            self.shelf.save()
+        self.assertNotModifiedUntil(reverse('inventory:category', args=[self.everything.pk]), rename)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        # Where reads go while the view runs, and optionally write
+        response = HttpResponse(self.router.db_for_read(Item))
+        if request.method == 'POST':
+            self.router.db_for_write(Item)
+        return response
+
+    def request(self, method, path, **kwargs):
+        request = getattr(self.factory, method)(path, **kwargs)
+        request.resolver_match = resolve(path)
+        return request
+
+    def call(self, request):
+        # Like the handler: process_view runs inside __call__
+        def get_response(request):
+            middleware.process_view(request, self.view, (), {})
+            return self.view(request)
+        middleware = ReplicaMiddleware(get_response)
+        return middleware(request)
+
+    def test_reads_of_safe_views_go_to_the_replica(self):
+        response = self.call(self.request('get', reverse('inventory:locations')))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertIsNone(routers.replica.get())
+
+    def test_other_views_read_from_the_primary(self):
+        response = self.call(self.request('get', reverse('inventory:locationnew', args=[1])))
+        self.assertEqual(response.content, b'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.call(self.request('post', reverse('inventory:trashbulk')))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        request = self.request('get', reverse('inventory:locations'))
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        self.assertEqual(self.call(request).content, b'default')
+
+    def test_change_feed_reads_from_the_primary(self):
+        response = self.call(self.request('get', reverse('inventory:changes')))
+        self.assertEqual(response.content, b'default')
+
+    @mock.patch('inventory.cache.version', return_value=1)
+    def test_replica_reads_are_not_cached(self, version):
+        cache.clear()
+        node = Location(pk=1, tree_id=1)
+        request = self.request('get', reverse('inventory:location', args=[1]))
+        token = routers.replica.set('replica')
+        try:
+            self.assertEqual(fragment(node, 'test', lambda: 'replica'), 'replica')
+            response = conditional.respond(request, HttpResponse, etag='"1"')
+            self.assertNotIn('ETag', response.headers)
+        finally:
+            routers.replica.reset(token)
+        self.assertEqual(fragment(node, 'test', lambda: 'default'), 'default')
+        self.assertEqual(fragment(node, 'test', lambda: 'other'), 'default')
+        response = conditional.respond(request, HttpResponse, etag='"1"')
+        self.assertEqual(response.headers['ETag'], '"1"')
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        token = routers.replica.set('replica')
+        try:
+            self.assertEqual(self.router.db_for_read(Item), 'replica')
+            self.assertEqual(self.router.db_for_write(Item), 'default')
+            self.assertEqual(self.router.db_for_read(Item), 'default')
+        finally:
+            routers.replica.reset(token)
+
+    def test_no_migrations_on_replicas(self):
+        self.assertTrue(self.router.allow_migrate('default', 'inventory'))
+        self.assertFalse(self.router.allow_migrate('replica', 'inventory'))
+
+
+class SQLiteProfileTests(InventoryTestCase):
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234})
+    def test_pragmas(self):
+        sqlite.set_pragmas(sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
+
+    def request(self, method, path, handled=False):
+        """
+        Run a view which trashes an item and fails behind the middleware,
+        like the handler does, and return the state of the item. With
+        ``handled``, another middleware turns the exception into a response.
+        """
+        drill = self.create_item("Drill")
+
+        def handler(request):
+            try:
+                trash.trash_items([drill.pk])
+                raise ValueError
+            except ValueError as e:
+                middleware.process_exception(request, e)
+                if not handled:
+                    raise
+                return HttpResponse(status=500)
+
+        middleware = WriteTransactionMiddleware(handler)
+        request = getattr(RequestFactory(), method)(path)
+        if handled:
+            self.assertEqual(middleware(request).status_code, 500)
+        else:
+            with self.assertRaises(ValueError):
+                middleware(request)
+        return Item.objects.get(pk=drill.pk).state
+
+    def test_write_views_run_in_a_transaction(self):
+        self.assertEqual(self.request('post', reverse('inventory:locationnew', args=[1])), 'd')
+        self.assertEqual(self.request('post', reverse('inventory:locationnew', args=[1]), handled=True), 'd')
+        self.assertEqual(self.request('get', reverse('inventory:itemtrash', args=[1])), 'd')
+
+    def test_read_views_run_without_a_transaction(self):
+        self.assertEqual(self.request('get', reverse('inventory:location', args=[1])), 't')
+
+    def test_batch_views_run_without_a_transaction(self):
+        # Their batches take the lock one at a time
+        self.assertEqual(self.request('post', reverse('inventory:itemimport')), 't')
+        self.assertEqual(self.request('post', reverse('inventory:trashbulk')), 't')
+
+
+class BarcodeTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.shelf = Location.objects.create(name="Shelf", description="Shelf", parent=self.universe,
+                                             uuid='6f2b1f9e-0c57-4b8e-9a4c-7d3e2c1b0a99')
+
+    def test_image(self):
+        url = reverse('inventory:locationbarcode', args=[self.shelf.uuid])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<svg'))
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_by_content(self):
+        first = barcodes.inline([str(self.shelf.uuid)])
+        with mock.patch.object(barcodes.segno, 'make_qr') as make_qr:
+            self.assertEqual(barcodes.inline([str(self.shelf.uuid)]), first)
+        make_qr.assert_not_called()
+
+    def test_print_list_inlines_the_codes(self):
+        bins = [Location.objects.create(name="Bin {}".format(n), description="Bin", parent=self.shelf,
+                                        uuid=uuid4()) for n in range(3)]
+        LocationPrintList.objects.create(user=self.user).locations.add(self.shelf, *bins)
+        response = self.client.get(reverse('inventory:print_list'))
+        self.assertContains(response, '<svg', count=4)
+        self.assertNotContains(response, '<img')
+        self.assertNotContains(response, 'metafloor')
+
+
+class LabelSheetTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.print_list = LocationPrintList.objects.create(user=self.user)
+        self.bins = [Location.objects.create(name="Bin {}".format(n), description="Bin", parent=self.universe,
+                                             uuid=uuid4()) for n in range(30)]
+        self.print_list.locations.add(*self.bins)
+
+    def sheet(self, format, layout='a4-3x8'):
+        response = self.client.get(reverse('inventory:print_list_labels'), {'format': format, 'layout': layout})
+        self.assertEqual(response['Content-Type'], labels.content_types[format])
+        return b''.join(response.streaming_content)
+
+    def test_pdf(self):
+        data = self.sheet('pdf')
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertIn(b'/Count 2', data)
+        self.assertTrue(data.endswith(b'%%EOF\n'))
+        # Every object is where the cross-reference table says
+        xref = data[data.rindex(b'startxref') + 10:].split()[0]
+        offsets = data[int(xref):].split(b'\n')[3:3 + 7]
+        for number, entry in enumerate(offsets, 1):
+            self.assertTrue(data[int(entry.split()[0]):].startswith('{} 0 obj'.format(number).encode()))
+
+    def test_svg(self):
+        from xml.dom.minidom import parseString
+        document = parseString(self.sheet('svg', 'a4-5x13'))
+        self.assertEqual(len(document.getElementsByTagName('text')), 30)
+
+    def test_only_changed_pages_are_rendered_again(self):
+        self.sheet('pdf')
+        self.print_list.locations.add(Location.objects.create(name="Bin 30", description="Bin",
+                                                              parent=self.universe, uuid=uuid4()))
+        with mock.patch.dict(labels.renderers, {'pdf': mock.Mock(wraps=labels.pdf_page)}):
+            self.sheet('pdf')
+            rendered = labels.renderers['pdf'].call_args_list
+        self.assertEqual([len(call.args[1]) for call in rendered], [7])
+
+    def test_order_of_adding(self):
+        self.print_list.locations.add(Location.objects.create(name="A first", description="Bin",
+                                                              parent=self.universe))
+        pages = list(labels.pages(self.print_list, labels.LAYOUTS['a4-3x8']))
+        self.assertEqual([len(page) for page in pages], [24, 7])
+        self.assertEqual(pages[-1][-1][1], "A first")
+
+
+class PrintListTests(QueryBudgetMixin, InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rack = Location.objects.create(name="Rack", description="Rack", parent=self.universe)
+        tree.create_grid(self.rack, [("Shelf {n}", 3), ("Bin {n}", 4)])
+        self.rack.refresh_from_db()
+        self.print_list = printlist.for_user(self.user)
+
+    def names(self):
+        return list(printlist.Entry.objects.filter(locationprintlist=self.print_list)
+                    .order_by('id').values_list('location__name', flat=True))
+
+    def bulk(self, action, *pks):
+        return self.client.post(reverse('inventory:print_list_bulk'), {'action': action, 'selected': pks})
+
+    def test_add_subtree_in_one_insert(self):
+        shelf = Location.objects.get(parent=self.rack, name="Shelf 1")
+        with self.assertNumQueries(3):
+            printlist.add(self.print_list, [self.rack.pk, shelf.pk], subtree=True)
+        self.assertEqual(len(self.names()), 1 + 3 + 12)
+        self.assertEqual(self.names()[:3], ["Rack", "Shelf 1", "Bin 1"])
+
+    def test_duplicates_are_skipped(self):
+        shelf = Location.objects.get(parent=self.rack, name="Shelf 2")
+        printlist.add(self.print_list, [shelf.pk])
+        response = self.bulk('add_subtree', self.rack.pk)
+        self.assertRedirects(response, reverse('inventory:print_list'))
+        self.assertEqual(len(self.names()), 16)
+        self.assertEqual(self.names()[0], "Shelf 2")
+
+    def test_trashed_locations_are_not_added(self):
+        shelf = Location.objects.get(parent=self.rack, name="Shelf 3")
+        trash.trash_subtrees(Location, [shelf.pk])
+        self.bulk('add_subtree', self.rack.pk)
+        self.assertEqual(len(self.names()), 1 + 2 + 8)
+
+    def test_add_and_remove_selected(self):
+        shelves = list(Location.objects.filter(parent=self.rack).order_by('name').values_list('pk', flat=True))
+        self.bulk('add', *shelves)
+        self.assertEqual(self.names(), ["Shelf 1", "Shelf 2", "Shelf 3"])
+        self.bulk('remove', shelves[0], shelves[2])
+        self.assertEqual(self.names(), ["Shelf 2"])
+
+    def test_add_from_the_location_page(self):
+        url = reverse('inventory:location', args=[self.rack.pk])
+        response = self.client.get(url)
+        self.assertContains(response, '<form id="bulk-location"')
+        self.assertContains(response, 'formaction="{}"'.format(reverse('inventory:print_list_bulk')), count=2)
+        shelves = list(Location.objects.filter(parent=self.rack).order_by('name').values_list('pk', flat=True))
+        for pk in shelves:
+            self.assertContains(response, '<input type="checkbox" name="selected" value="{}" form="bulk-location">'.format(pk))
+        # What the form sends with either button
+        form = {'type': 'location', 'next': url, 'selected': shelves[:2]}
+        response = self.client.post(reverse('inventory:print_list_bulk'), dict(form, action='add'))
+        self.assertRedirects(response, url)
+        self.assertEqual(self.names(), ["Shelf 1", "Shelf 2"])
+        response = self.client.post(reverse('inventory:print_list_bulk'), dict(form, action='add_subtree'))
+        self.assertRedirects(response, url)
+        self.assertEqual(len(self.names()), 2 + 8)
+
+    def test_single_add_creates_the_list(self):
+        self.print_list.delete()
+        self.client.get(reverse('inventory:print_list_add', args=[self.rack.pk]))
+        self.assertEqual(list(LocationPrintList.objects.get(user=self.user).locations.all()), [self.rack])
+
+    def test_print_list_is_paginated(self):
+        printlist.add(self.print_list, [self.rack.pk], subtree=True)
+        with mock.patch('inventory.views.PRINT_LIST_PAGE', 10):
+            response = self.assertWithinBudget('inventory:print_list', reverse('inventory:print_list'))
+            self.assertEqual(len(response.context['list']), 10)
+            response = self.client.get(reverse('inventory:print_list') + '?' + response.context['page_obj'].next_query)
+        self.assertEqual([location.name for location in response.context['list']][-1], "Bin 4")
+        self.assertEqual(len(response.context['list']), 6)
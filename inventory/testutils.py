@@ -0,0 +1,65 @@
+"""
+Query budgets of the inventory views.
+
+Every budget is the number of queries a GET request of the view may make
+with a filled page, including the session and user lookups of the logged
+in user. It must not depend on the number of rows shown, see
+assertQueriesIndependentOf(). Tests fail when a change makes a view exceed its budget,
+so query regressions show up in review instead of in production.
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+budgets = {
+    'inventory:index': 5,
+    'inventory:locations': 4,
+    'inventory:location': 7,
+    'inventory:categories': 4,
+    'inventory:category': 7,
+    'inventory:categoryrollup': 6,
+    'inventory:item': 4,
+    'inventory:search': 5,
+    'inventory:trash': 4,
+    'inventory:profile': 2,
+    'inventory:print_list': 4,
+    'inventory:export': 4,
+    'inventory:itemimport': 2,
+    'inventory:locationfindfreeslot': 4,
+    'inventory:lent': 4,
+}
+
+
+class QueryBudgetMixin:
+    """TestCase mixin checking requests against the query budgets above."""
+
+    def assertWithinBudget(self, name, path, budget=None, **kwargs):
+        """GET ``path`` and fail if it needs more queries than the budget of ``name``."""
+        if budget is None:
+            budget = budgets[name]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            "{} made {} queries, the budget is {}:\n{}".format(
+                name, len(queries), budget,
+                '\n'.join(query['sql'] for query in queries.captured_queries)))
+        return response
+
+    def assertQueriesIndependentOf(self, grow, name, path, **kwargs):
+        """
+        GET ``path`` before and after ``grow()`` added rows to the lists
+        shown and fail if the number of queries changed, i.e. if the view
+        queries per row.
+        """
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(path, **kwargs)
+        grow()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(path, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(before), len(after), "{} queries per row:\n{}".format(
+            name, '\n'.join(query['sql'] for query in after.captured_queries)))
+        self.assertWithinBudget(name, path, **kwargs)
+        return response
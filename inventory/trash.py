@@ -0,0 +1,234 @@
+"""
+Set-based trash operations.
+
+The trash views change one object per request and save it through the
+model. The operations here change the state of many rows at once: trashing
+location subtrees is one UPDATE for the locations (WHERE tree_id = ... AND
+lft BETWEEN ...) and one for the items stored in them, in one transaction.
+Counters, search index and caches are updated once per operation through
+the bulk_saved signal.
+
+Purging deletes trashed rows in batches of BATCH_SIZE, every batch in its
+own transaction, so emptying a big trash never locks the tables for long.
+Subtrees are deleted bottom up, so a batch never cascades into more rows.
+An optional pause between the batches leaves room for other writers.
+Locations and categories are deleted without closing the gaps they leave
+in their trees row by row, the gap of a whole subtree is closed with two
+range UPDATEs when its root is deleted.
+Archiving moves trashed rows to the archived state in the same batches.
+"""
+
+import time
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import Item, Location, TREE_FIELDS
+from .signals import bulk_saved
+from . import cache, changelog, counters, search, tree
+
+BATCH_SIZE = 500
+# The roots 'Universe' and 'Everything' cannot be trashed
+PROTECTED = 1
+
+
+def selected_nodes(model, pks):
+    """The nodes ``pks``, without the ones in the subtree of another one."""
+    nodes = []
+    for node in model.objects.filter(pk__in=pks).order_by('tree_id', 'lft').only(*TREE_FIELDS):
+        if nodes and nodes[-1].tree_id == node.tree_id and node.lft < nodes[-1].rght:
+            continue
+        nodes.append(node)
+    return nodes
+
+
+def _set_item_state(queryset, state):
+    with transaction.atomic():
+        changing = queryset.exclude(state=state)
+        # Only items entering or leaving the default state are counted, read
+        # before they change
+        if state == 'd':
+            counts = counters.item_rows(changing)
+        else:
+            counts = counters.item_rows(changing.filter(state='d'), -1)
+        changed = changing.update(state=state, change_date=timezone.now())
+        if changed:
+            bulk_saved.send(sender=Item, queryset=queryset, fields=['state'], counts=counts)
+    return changed
+
+
+def trash_items(pks):
+    """Trash the items ``pks``. Returns the number of trashed items."""
+    return _set_item_state(Item.objects.filter(pk__in=pks), 't')
+
+
+def untrash_items(pks):
+    """Restore the items ``pks``. Returns the number of restored items."""
+    return _set_item_state(Item.objects.filter(pk__in=pks), 'd')
+
+
+def _set_subtree_state(model, nodes, state, condition):
+    if not nodes:
+        return 0
+    with transaction.atomic():
+        queryset = model.objects.filter(condition)
+        changed = queryset.exclude(state=state).update(state=state, change_date=timezone.now())
+        if model is Location:
+            _set_item_state(Item.objects.filter(tree.subtrees(nodes, 'location__')), state)
+        if changed:
+            bulk_saved.send(sender=model, queryset=queryset, fields=['state'])
+    return changed
+
+
+def trash_subtrees(model, pks):
+    """
+    Trash the locations or categories ``pks`` with their whole subtrees and,
+    for locations, all items stored in them. Returns the number of trashed
+    nodes.
+    """
+    nodes = [node for node in selected_nodes(model, pks) if node.pk != PROTECTED]
+    return _set_subtree_state(model, nodes, 't', tree.subtrees(nodes))
+
+
+def untrash_subtrees(model, pks):
+    """
+    Restore the locations or categories ``pks`` with their whole subtrees
+    and, for locations, all items stored in them. Trashed ancestors are
+    restored too, so the nodes can be reached again. Returns the number of
+    restored nodes.
+    """
+    nodes = selected_nodes(model, pks)
+    return _set_subtree_state(model, nodes, 'd', tree.subtrees(nodes) | tree.ancestors(nodes))
+
+
+def purgeable(model, before=None):
+    """
+    The trashed objects of ``model`` which can be deleted without deleting
+    anything else: locations and categories are kept while a sublocation,
+    subcategory or item below them is not purgeable itself. ``before`` only
+    selects the objects trashed (last changed) before that time.
+    """
+    purged = Q(state='t')
+    if before is not None:
+        purged &= Q(change_date__lt=before)
+    queryset = model.objects.filter(purged)
+    if model is Item:
+        return queryset
+    prefix = 'location__' if model is Location else 'category__'
+    kept_nodes = model.objects.exclude(purged).filter(tree_id=OuterRef('tree_id'),
+                                                      lft__gt=OuterRef('lft'), lft__lt=OuterRef('rght'))
+    kept_items = Item.objects.exclude(purged).filter(**{
+        prefix + 'tree_id': OuterRef('tree_id'),
+        prefix + 'lft__gte': OuterRef('lft'),
+        prefix + 'lft__lte': OuterRef('rght'),
+    })
+    return queryset.exclude(Exists(kept_nodes)).exclude(Exists(kept_items))
+
+
+def batches(queryset, fields, batch_size, pause):
+    """
+    Yield the first ``batch_size`` rows of ``queryset`` as dicts of
+    ``fields`` inside a transaction until there are none left. The caller
+    must remove the rows of a batch from ``queryset``.
+    """
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.values(*fields)[:batch_size])
+            if not rows:
+                return
+            yield rows
+        if pause:
+            time.sleep(pause)
+
+
+def within(selection, prefix='', strict=False):
+    """
+    Condition for the rows in the subtrees of the nodes of the queryset
+    ``selection``, through the field ``prefix`` (e.g. 'location__' for items).
+    With ``strict`` only for the rows below the nodes, not the nodes
+    themselves.
+    """
+    lft, rght = ('lft__lt', 'rght__gt') if strict else ('lft__lte', 'rght__gte')
+    return Exists(selection.filter(**{'tree_id': OuterRef(prefix + 'tree_id'),
+                                      lft: OuterRef(prefix + 'lft'), rght: OuterRef(prefix + 'rght')}))
+
+
+def close_gap(model, tree_id, lft, rght):
+    """Move the nodes right of the deleted subtree ``lft``..``rght`` to the left, over its gap."""
+    width = rght - lft + 1
+    model.objects.filter(tree_id=tree_id, lft__gt=rght).update(lft=F('lft') - width)
+    model.objects.filter(tree_id=tree_id, rght__gt=rght).update(rght=F('rght') - width)
+
+
+def delete_batches(model, queryset, fields, batch_size, pause):
+    """
+    Delete the rows of ``queryset`` in batches, see batches(). Returns the
+    number of deleted rows of ``model`` and the trees they were in.
+    """
+    deleted = 0
+    tree_ids = set()
+    for rows in batches(queryset, fields, batch_size, pause):
+        tree_ids.update(row['tree_id'] for row in rows if 'tree_id' in row)
+        total, per_model = model.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        deleted += per_model.get(model._meta.label, 0)
+    return deleted, tree_ids
+
+
+def purge(model, pks=None, before=None, batch_size=BATCH_SIZE, pause=0):
+    """
+    Delete the purgeable objects of ``model`` (only the ones of ``pks`` if
+    given) in batches of ``batch_size``, sleeping ``pause`` seconds after
+    every batch. Returns the number of deleted objects of ``model``,
+    including the trashed descendants of deleted locations and categories.
+
+    Subtrees are deleted bottom up: the items stored in them first, then
+    the deepest nodes before their parents. So every batch deletes its own
+    rows only, never a whole subtree with its items through the cascade.
+    The gap a subtree leaves in its tree is closed when its root is
+    deleted, with two range UPDATEs of the nodes right of it.
+    """
+    queryset = purgeable(model, before)
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    if model is Item:
+        return delete_batches(model, queryset.order_by('pk'), ('pk',), batch_size, pause)[0]
+
+    prefix = 'location__' if model is Location else 'category__'
+    delete_batches(Item, Item.objects.filter(within(queryset, prefix)).order_by('pk'), ('pk',), batch_size, pause)
+    below = model.objects.filter(within(queryset, strict=True)).order_by('-level', 'tree_id', 'lft')
+    deleted, tree_ids = delete_batches(model, below, ('pk', 'tree_id'), batch_size, pause)
+
+    # The gaps inside the subtrees are closed with the subtrees: every batch
+    # of subtree roots is deleted and its gaps closed in one transaction,
+    # from right to left so the positions of the remaining roots stay valid.
+    roots = (queryset.exclude(within(queryset, strict=True)).select_for_update()
+             .order_by('tree_id', '-lft'))
+    for rows in batches(roots, ('pk', 'tree_id', 'lft', 'rght'), batch_size, pause):
+        total, per_model = model.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        deleted += per_model.get(model._meta.label, 0)
+        for row in rows:
+            close_gap(model, row['tree_id'], row['lft'], row['rght'])
+            tree_ids.add(row['tree_id'])
+
+    if tree_ids:
+        cache.bump_trees(model, tree_ids)
+    return deleted
+
+
+def archive(model, before=None, batch_size=BATCH_SIZE, pause=0):
+    """
+    Move the trashed objects of ``model`` to the archived state in batches,
+    like purge(). Returns the number of archived objects. Neither trashed
+    nor archived objects are counted or listed, so only the change log is
+    told.
+    """
+    queryset = model.objects.trashed()
+    if before is not None:
+        queryset = queryset.filter(change_date__lt=before)
+    archived = 0
+    for rows in batches(queryset.order_by('pk'), ('pk',), batch_size, pause):
+        pks = [row['pk'] for row in rows]
+        archived += model.objects.filter(pk__in=pks).update(state='a', change_date=timezone.now())
+        changelog.record(search.kind_of(model()), pks)
+    return archived
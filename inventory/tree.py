@@ -0,0 +1,258 @@
+"""
+Set-based operations on the location and category trees.
+
+django-mptt keeps lft/rght consistent by shifting large parts of the tree
+on every single insert or move. The operations here change many nodes at
+once and do the renumbering only once per operation.
+"""
+
+from uuid import UUID
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .signals import bulk_saved
+
+BATCH_SIZE = 1000
+PATH_SEPARATOR = '/'
+
+
+def paths(model, node=None):
+    """
+    Map the pk of every node of ``model``, or only of the subtree of
+    ``node`` (and its ancestors), to its path, e.g. 'Universe/Shelf 1/Bin 3'.
+    """
+    result = {}
+    nodes = model.objects.all()
+    if node is not None:
+        nodes = nodes.filter(ancestors([node]) | subtrees([node]))
+    for pk, name, parent_id in nodes.order_by('tree_id', 'lft').values_list('pk', 'name', 'parent_id'):
+        result[pk] = name if parent_id is None else result[parent_id] + PATH_SEPARATOR + name
+    return result
+
+
+def resolve(model, value):
+    """
+    The node of ``model`` given by primary key, path (e.g. 'Universe/Shelf 1',
+    case insensitive) or, for locations, UUID. None if there is none. Paths
+    are followed from the root, one query per level.
+    """
+    value = str(value).strip().strip(PATH_SEPARATOR)
+    if value.isdigit():
+        return model.objects.filter(pk=value).first()
+    if hasattr(model, 'uuid'):
+        try:
+            return model.objects.filter(uuid=UUID(value)).first()
+        except ValueError:
+            pass
+    node = None
+    for name in value.split(PATH_SEPARATOR):
+        node = model.objects.filter(parent=node, name__iexact=name.strip()).order_by('pk').first()
+        if node is None:
+            return None
+    return node
+
+
+def subtrees(nodes, prefix=''):
+    """
+    Condition for the nodes in the subtrees of ``nodes``, through the field
+    ``prefix`` (e.g. 'location__' for items).
+    """
+    condition = Q(pk__in=[])
+    for node in nodes:
+        condition |= Q(**{
+            prefix + 'tree_id': node.tree_id,
+            prefix + 'lft__gte': node.lft,
+            prefix + 'lft__lte': node.rght,
+        })
+    return condition
+
+
+def ancestors(nodes):
+    """Condition for the ancestors of ``nodes``."""
+    condition = Q(pk__in=[])
+    for node in nodes:
+        condition |= Q(tree_id=node.tree_id, lft__lt=node.lft, rght__gt=node.rght)
+    return condition
+
+
+def children(node, *fields):
+    """
+    The children of ``node`` which are not trashed, as dicts of ``fields``
+    plus the number of their own children which are not trashed
+    (``child_count``). One query, however big the subtrees are.
+    """
+    return list(node._meta.model.objects.filter(parent=node, state='d').order_by('lft').values(*fields)
+                .annotate(child_count=Count('children', filter=Q(children__state='d'))))
+
+
+def numbered(pattern, n):
+    """'Shelf {n}' -> 'Shelf 3', patterns without {n} get the number appended."""
+    if '{n}' in pattern:
+        return pattern.replace('{n}', str(n))
+    return "{} {}".format(pattern, n) if pattern else str(n)
+
+
+def grid_size(levels):
+    """Number of locations created by create_grid() for ``levels``."""
+    total = 0
+    product = 1
+    for name, amount in levels:
+        product *= amount
+        total += product
+    return total
+
+
+def create_grid(parent, levels, description="", capacity=None):
+    """
+    Create nested numbered locations below ``parent``. ``levels`` is a list
+    of (name pattern, amount) from the outermost to the innermost level, e.g.
+    [("Shelf {n}", 10), ("Bin {n}", 20)] creates 10 shelves with 20 bins
+    each. The new locations are appended as last children of ``parent``.
+    The locations of the innermost level get ``capacity`` if given.
+
+    All locations are inserted in one transaction with one bulk insert per
+    level. Their lft/rght values are computed up front, so the rest of the
+    tree is shifted once instead of once per location.
+
+    ``parent`` may also be a category, the new nodes are then of the same
+    model. Trees ordered by name (order_insertion_by) are rebuilt once at
+    the end to put the new nodes into place.
+    """
+    size = grid_size(levels)
+    if size == 0:
+        return 0
+
+    model = parent._meta.model
+    with transaction.atomic():
+        # Lock the parent and read its current position in the tree
+        parent = model.objects.select_for_update().get(pk=parent.pk)
+        tree_id = parent.tree_id
+        start = parent.rght
+
+        # Make room for all new nodes between the parent's last child and
+        # its right edge
+        model.objects.filter(tree_id=tree_id, lft__gt=start).update(lft=F('lft') + 2 * size)
+        model.objects.filter(tree_id=tree_id, rght__gte=start).update(rght=F('rght') + 2 * size)
+
+        # Number of nodes in the subtree of one location on each level
+        subtree = [1] * len(levels)
+        for depth in range(len(levels) - 2, -1, -1):
+            subtree[depth] = 1 + levels[depth + 1][1] * subtree[depth + 1]
+
+        slots = [(start, parent.pk)]  # (first free lft, parent pk)
+        for depth, (name, amount) in enumerate(levels):
+            nodes = []
+            extra = {}
+            if capacity is not None and depth + 1 == len(levels):
+                extra = {'capacity': capacity, 'free_capacity': capacity}
+            for lft, parent_id in slots:
+                for n in range(1, amount + 1):
+                    nodes.append(model(name=numbered(name, n),
+                                       description=numbered(description, n) if description else "",
+                                       parent_id=parent_id,
+                                       tree_id=tree_id,
+                                       level=parent.level + 1 + depth,
+                                       lft=lft,
+                                       rght=lft + 2 * subtree[depth] - 1,
+                                       **extra))
+                    lft += 2 * subtree[depth]
+            model.objects.bulk_create(nodes, batch_size=BATCH_SIZE)
+
+            if depth + 1 < len(levels):
+                # Not every database returns primary keys from bulk inserts,
+                # look them up by their position in the tree instead
+                pks = dict(model.objects.filter(tree_id=tree_id,
+                                                level=parent.level + 1 + depth,
+                                                lft__gte=start,
+                                                lft__lt=start + 2 * size).values_list('lft', 'pk'))
+                slots = [(node.lft + 1, pks[node.lft]) for node in nodes]
+
+        bulk_saved.send(sender=model,
+                        queryset=model.objects.filter(tree_id=tree_id, lft__gte=start, lft__lt=start + 2 * size),
+                        created=True)
+        if model._mptt_meta.order_insertion_by:
+            model.objects.partial_rebuild(tree_id)
+    return size
+
+
+def move(nodes, target):
+    """
+    Move ``nodes`` with their subtrees below ``target``. They become its
+    last children, or are put into name order in trees ordered by name
+    (order_insertion_by). Nodes in the subtree of another one of ``nodes``
+    move along with it. Raises ValueError if ``target`` is in the subtree
+    of one of the nodes. Returns the number of moved subtrees.
+
+    All parents are changed with one UPDATE, then every affected tree is
+    renumbered in one pass in Python and only the nodes whose position
+    changed are written back, all in one transaction.
+    """
+    model = target._meta.model
+    with transaction.atomic():
+        target = model.objects.select_for_update().get(pk=target.pk)
+        moved = []
+        for node in model.objects.filter(pk__in=[node.pk for node in nodes]).order_by('tree_id', 'lft'):
+            if node.tree_id == target.tree_id and node.lft <= target.lft <= node.rght:
+                raise ValueError("Cannot move '{}' into its own subtree".format(node))
+            if moved and moved[-1].tree_id == node.tree_id and node.lft < moved[-1].rght:
+                continue
+            moved.append(node)
+        moved = [node for node in moved if node.parent_id != target.pk]
+        if not moved:
+            return 0
+
+        tree_ids = {target.tree_id} | {node.tree_id for node in moved}
+        pks = [node.pk for node in moved]
+        model.objects.filter(pk__in=pks).update(parent=target, change_date=timezone.now())
+        renumber(model, tree_ids, last=set(pks))
+        # Only the moved nodes changed their parent, the change log gets
+        # them alone; counters and caches are updated for all the trees
+        bulk_saved.send(sender=model, queryset=model.objects.filter(pk__in=pks), fields=['parent'],
+                        tree_ids=tree_ids)
+    return len(moved)
+
+
+def renumber(model, tree_ids, last=()):
+    """
+    Recompute lft, rght, level and tree_id of all nodes of the trees
+    ``tree_ids`` from their parents and save the changed ones. Siblings
+    keep their order, except for the nodes ``last``, which come after
+    their siblings, and trees ordered by name, which are sorted.
+    """
+    order = model._mptt_meta.order_insertion_by
+    fields = ['parent', 'tree_id', 'lft', 'rght', 'level']
+    nodes = list(model.objects.filter(tree_id__in=tree_ids).order_by('tree_id', 'lft').only(*fields, *order))
+
+    children = {}
+    for node in nodes:
+        children.setdefault(node.parent_id, []).append(node)
+    if order:
+        key = lambda node: [getattr(node, name) for name in order]
+    else:
+        key = lambda node: node.pk in last
+    for siblings in children.values():
+        # Stable, so the other nodes stay in tree order
+        siblings.sort(key=key)
+
+    changed = []
+    for root in children.get(None, []):
+        tree_id = root.tree_id
+        counter = 1
+        # (node, level, lft once entered) in depth first order
+        stack = [(root, 0, None)]
+        while stack:
+            node, level, lft = stack.pop()
+            if lft is None:
+                stack.append((node, level, counter))
+                counter += 1
+                stack.extend((child, level + 1, None) for child in reversed(children.get(node.pk, [])))
+            else:
+                position = (tree_id, lft, counter, level)
+                if (node.tree_id, node.lft, node.rght, node.level) != position:
+                    node.tree_id, node.lft, node.rght, node.level = position
+                    changed.append(node)
+                counter += 1
+    model.objects.bulk_update(changed, ['tree_id', 'lft', 'rght', 'level'], batch_size=BATCH_SIZE)
+    return len(changed)
@@ -14,9 +14,12 @@ urlpatterns = [
     path('location/<int:pk>/trash/', views.location_trash, name='locationtrash'),
     path('location/<int:pk>/untrash/', views.location_untrash, name='locationuntrash'),
     path('location/<int:pk>/delete/', views.location_delete, name='locationdelete'),
+    path('location/<int:pk>/move/', views.location_move, name='locationmove'),
     path('location/<int:pk>/uuid/', views.location_edit_uuid, name='locationedituuid'),
+    path('location/<int:pk>/children/', views.location_children, name='locationchildren'),
     path('location/find/', views.location_find, name='locationfind'),
     path('location/find/<uuid:id>/', views.location_find_uuid, name='locationfinduuid'),
+    path('location/barcode/<uuid:id>.svg', views.location_barcode, name='locationbarcode'),
     path('location/<int:pk>/newitem/', views.item_new, name='locationnewitem'),
     path('location/findfreeslot/', views.LocationFindFreeSlot.as_view(), name='locationfindfreeslot'),
     path('categories/', views.CategoriesView.as_view(), name='categories'),
@@ -26,20 +29,33 @@ urlpatterns = [
     path('category/<int:pk>/trash/', views.category_trash, name='categorytrash'),
     path('category/<int:pk>/untrash/', views.category_untrash, name='categoryuntrash'),
     path('category/<int:pk>/delete/', views.category_delete, name='categorydelete'),
+    path('category/<int:pk>/move/', views.category_move, name='categorymove'),
+    path('category/<int:pk>/rollup/', views.category_rollup, name='categoryrollup'),
+    path('category/<int:pk>/rollup/json/', views.category_rollup_json, name='categoryrollupjson'),
     path('item/<int:pk>/', views.ItemView.as_view(), name='item'),
+    path('item/import/', views.item_import, name='itemimport'),
+    path('item/barcode/<int:code>/', views.item_barcode, name='itembarcode'),
+    path('scan/', views.scan_resolve, name='scan'),
     path('item/<int:pk>/trash/', views.item_trash, name='itemtrash'),
     path('item/<int:pk>/untrash/', views.item_untrash, name='itemuntrash'),
     path('item/<int:pk>/delete/', views.item_delete, name='itemdelete'),
     path('item/<int:pk>/edit/', views.item_edit, name='itemedit'),
     path('item/<int:pk>/lend/', views.item_lend, name='itemlend'),
-    path('item/<int:pk>/returno/)', views.item_return, name='itemreturn'),
+    path('item/<int:pk>/return/', views.item_return, name='itemreturn'),
+    path('lent/', views.LoanView.as_view(), name='lent'),
     path('search/', views.SearchItem.as_view(), name='search'),
     path('accounts/login/', auth_views.LoginView.as_view(template_name='inventory/landing.html'), name='login'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('accounts/profile/', views.AccountsProfile.as_view(), name='profile'),
     path('accounts/print_list/', views.print_list, name='print_list'),
+    path('accounts/print_list/labels/', views.print_list_labels, name='print_list_labels'),
     path('accounts/print_list/clear/', views.print_list_clear, name='print_list_clear'),
     path('accounts/print_list/add/<int:pk>', views.print_list_add, name='print_list_add'),
     path('accounts/print_list/remove/<int:pk>', views.print_list_remove, name='print_list_remove'),
+    path('accounts/print_list/bulk/', views.print_list_bulk, name='print_list_bulk'),
     path('trash/', views.TrashView.as_view(), name='trash'),
+    path('trash/bulk/', views.trash_bulk, name='trashbulk'),
+    path('export/', views.export, name='export'),
+    path('changes/', views.changes, name='changes'),
+    path('stats/queries/', views.stats_queries, name='stats_queries'),
 ]
@@ -1,32 +1,57 @@
+import io
+import json
 import logging
 from django.utils.datastructures import MultiValueDictKeyError
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.views import generic
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils.translation import gettext as _
-from django.contrib.auth.decorators import permission_required
+from django.conf import settings
+from django.db import transaction
+from django.contrib.auth.decorators import permission_required, user_passes_test
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 from uuid import UUID
 
-from .models import Item, Location, Category, LocationPrintList
-from .forms import LocationEditForm, ItemEditForm, ItemLendForm, CategoryEditForm, LocationUuidEditForm
+from .middleware import stats as query_stats
+from .pagination import CursorPaginationMixin, CursorPaginator
+from .models import Item, Location, Category, Loan, LocationPrintList, TREE_FIELDS
+from .forms import LocationEditForm, ItemEditForm, ItemLendForm, CategoryEditForm, LocationUuidEditForm, ItemImportForm, ExportForm, FreeSlotForm, LabelSheetForm, MoveForm
+from . import barcodes, cache, changelog, conditional, exporter, importer, labels, lending, printlist, reports, scan, search, trash, tree
 
 logger = logging.getLogger(__name__)
 
 types = ['item', 'category', 'location']
 
+MAX_NEW_LOCATIONS = 10000
+MAX_IMPORT_ERRORS = 100
+MAX_SCANS = 5000
+# Levels of sublocations rendered with a location, deeper ones are loaded on demand
+LOCATION_TREE_DEPTH = 2
+LOCATION_CHILD_FIELDS = ('id', 'name', 'description', 'level', 'free_space', 'item_count', 'subtree_item_count')
+# Loans shown on the item page
+ITEM_LOANS = 10
+LOAN_STATUSES = ['outstanding', 'overdue', 'all']
+PRINT_LIST_PAGE = 96
+# Barcode images never change, browsers may keep them for a year
+BARCODE_MAX_AGE = 365 * 24 * 60 * 60
+
 @permission_required('inventory.view_item')
 @permission_required('inventory.view_location')
 @permission_required('inventory.view_category')
 def index(request):
-    latest_items = Item.objects.order_by('-creation_date')[:5]
-    categories = Category.objects.order_by('-creation_date')[:5]
-    locations = Location.objects.order_by('-creation_date')[:5]
+    latest_items = Item.objects.active().for_list().defer('description').order_by('-creation_date')[:5]
+    categories = Category.objects.active().only('name', 'creation_date').order_by('-creation_date')[:5]
+    locations = Location.objects.active().only('name', 'creation_date').order_by('-creation_date')[:5]
     return render(request, 'inventory/index.html', {
         'title': 'Home',
         'latest_items': latest_items,
@@ -35,7 +60,7 @@ def index(request):
         'nav_item': _("Home"),
     })
 
-class SearchItem(PermissionRequiredMixin, generic.ListView):
+class SearchItem(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = ('inventory.view_item', 'inventory.view_location','inventory.view_category')
     paginate_by = 25
     template_name = 'inventory/search.html'
@@ -55,18 +80,16 @@ class SearchItem(PermissionRequiredMixin, generic.ListView):
     def get_queryset(self):
         search_term = self.request.GET['q']
         search_type = self.request.GET['type']
-        if len(search_term) < 3:
-            return []
+        if len(search_term) < 3 or search_type not in types:
+            return Item.objects.none()
         else:
-            if search_type == 'item':
-                results = Item.objects.filter(name__icontains=search_term).order_by('name')
-            elif search_type == 'location':
-                results = Location.objects.filter(name__icontains=search_term).order_by('name')
-            elif search_type == 'category':
-                results = Category.objects.filter(name__icontains=search_term).order_by('name')
-            else:
-                results = []
-            return results
+            return search.search(search_type, search_term)
+
+    def get_cursor_source(self, queryset):
+        if isinstance(queryset, search.SearchResults):
+            # Ranked by score, continue after the score and id of the last match
+            return queryset.matches, ('-score', 'object_id'), queryset.resolve
+        return super().get_cursor_source(queryset)
 
 class LocationsView(PermissionRequiredMixin, generic.ListView):
     permission_required = ('inventory.view_location')
@@ -79,7 +102,7 @@ class LocationsView(PermissionRequiredMixin, generic.ListView):
         return context
 
     def get_queryset(self):
-        return Location.objects.filter(state__exact='d')
+        return Location.objects.active().for_list()
     
 
 class CategoriesView(PermissionRequiredMixin, generic.ListView):
@@ -92,7 +115,10 @@ class CategoriesView(PermissionRequiredMixin, generic.ListView):
         context['title'] = _("Categories")
         return context
 
-class LocationView(PermissionRequiredMixin, generic.ListView):
+    def get_queryset(self):
+        return Category.objects.active().for_list()
+
+class LocationView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = ('inventory.view_item', 'inventory.view_location','inventory.view_category')
     model = Item
     template_name = 'inventory/location_detail.html'
@@ -100,16 +126,31 @@ class LocationView(PermissionRequiredMixin, generic.ListView):
 
     def get(self, request, *args, **kwargs):
         location = Location.objects.get(pk=kwargs['pk'])
-        self.object_list = Item.objects.filter(location__exact=location, state__exact='d').order_by('name')
+        # Items change the version of the categories, not of their location tree
+        etag = conditional.etag(request, location.pk,
+                                *cache.versions([cache.tree_name(Location, location.tree_id), 'categories'], request))
+        return conditional.respond(request, lambda: self.render(location), etag=etag)
+
+    def render(self, location):
+        self.object_list = Item.objects.active().for_list().filter(location=location)
 
         context = self.get_context_data()
-        context['location'] = location
-        context['location_list'] = location.get_descendants().filter(state__exact='d')
+        context.update(location_tree(location))
         context['title'] = _("Location")
         return self.render_to_response(context)
 
+
+def location_tree(location):
+    """Context of the sublocations of ``location``, LOCATION_TREE_DEPTH levels deep."""
+    max_level = location.level + LOCATION_TREE_DEPTH
+    return {
+        'location': location,
+        'location_list': location.get_descendants().active().for_list().filter(level__lte=max_level),
+        'max_level': max_level,
+    }
+
     
-class CategoryView(PermissionRequiredMixin, generic.ListView):
+class CategoryView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = ('inventory.view_item', 'inventory.view_location', 'inventory.view_category')
     model = Item
     template_name = 'inventory/category_detail.html'
@@ -117,22 +158,82 @@ class CategoryView(PermissionRequiredMixin, generic.ListView):
 
     def get(self, request, *args, **kwargs):
         category = Category.objects.get(pk=kwargs['pk'])
-        self.object_list = Item.objects.filter(category__exact=category, state__exact='d')
+        # Items and categories change the version of the categories, the
+        # items show the names of their locations. The version of the tree
+        # is read along for the fragments.
+        etag = conditional.etag(request, category.pk, *cache.versions(
+            ['categories', 'locations', cache.tree_name(Category, category.tree_id)], request))
+        return conditional.respond(request, lambda: self.render(category), etag=etag)
+
+    def render(self, category):
+        self.object_list = Item.objects.active().for_list().filter(category=category)
 
         context = self.get_context_data()
-        context['category'] = category
-        context['subcategories'] = category.get_descendants().filter(state__exact='d')
+        context.update(category_tree(category))
         context['title'] = _("Category")
         return self.render_to_response(context)
 
 
+def category_tree(category):
+    """Context of the subcategories of ``category``."""
+    return {
+        'category': category,
+        'subcategories': category.get_descendants().active().for_list(),
+    }
+
+
 class ItemView(PermissionRequiredMixin, generic.DetailView):
     permission_required = ('inventory.view_item')
-    model = Item
+    queryset = Item.objects.select_related('location', 'category')
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # Lending changes the change date of the item too. Items may have no
+        # location or category.
+        item = self.object
+        dates = [item.change_date] + [node.change_date for node in (item.location, item.category) if node is not None]
+        etag = conditional.etag(request, item.location_id, item.category_id, *dates)
+        return conditional.respond(request, lambda: self.render_to_response(self.get_context_data(object=item)),
+                                   etag=etag, last_modified=max(dates))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = _("Item")
+        context['loan_list'] = self.object.loans.order_by('-lent_date', '-pk')[:ITEM_LOANS]
+        return context
+
+
+class LoanView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
+    """Outstanding, overdue or all loans, optionally of one borrower."""
+    permission_required = ('inventory.view_item')
+    paginate_by = 25
+    template_name = 'inventory/loans.html'
+
+    def get_queryset(self):
+        self.status = self.request.GET.get('status')
+        if self.status not in LOAN_STATUSES:
+            self.status = LOAN_STATUSES[0]
+        self.borrower = self.request.GET.get('borrower', '').strip()
+
+        queryset = Loan.objects.select_related('item').only(
+            'item', 'item__name', 'borrower', 'lent_date', 'due_date', 'returned_date')
+        if self.status == 'outstanding':
+            queryset = queryset.outstanding()
+            self.cursor_ordering = ('lent_date', 'pk')
+        elif self.status == 'overdue':
+            queryset = queryset.overdue()
+            self.cursor_ordering = ('due_date', 'pk')
+        else:
+            self.cursor_ordering = ('-lent_date', '-pk')
+        if self.borrower:
+            queryset = queryset.filter(borrower=self.borrower)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = _("Lent items")
+        context['status'] = self.status
+        context['borrower'] = self.borrower
         return context
 
 @permission_required('inventory.edit_location')
@@ -163,22 +264,104 @@ def location_find(request):
     })
 
 
-class LocationFindFreeSlot(PermissionRequiredMixin, generic.ListView):
+class LocationFindFreeSlot(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = ('inventory.view_item', 'inventory.view_location', 'inventory.view_category')
     model = Location
     paginate_by = 25
+    cursor_ordering = ('tree_id', 'lft')
     template_name = 'inventory/location_findfreeslot.html'
 
     def get_queryset(self):
-        locations = Location.objects.filter(free_space__exact=True)
-        return locations
+        self.form = FreeSlotForm(self.request.GET)
+        self.fitting = self.form.is_valid() and self.form.cleaned_data['amount']
+        if self.fitting:
+            # Flat list of the locations which fit the amount, nearest first
+            self.cursor_ordering = ('tree_id', 'level', 'lft')
+            return Location.objects.fitting(self.form.cleaned_data['amount'],
+                                            within=self.form.cleaned_data['location']) \
+                .select_related('parent').only('name', 'capacity', 'free_capacity', 'parent__name', *TREE_FIELDS)
+        return Location.objects.active().for_list().filter(free_space=True)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['form'] = self.form
+        context['fitting'] = self.fitting
+        return context
 
 @permission_required('inventory.view_location')
 def location_find_uuid(request, id):
     location = get_object_or_404(Location, uuid=id)
-    return render(request, 'inventory/location_detail.html', {
-        'title': _("Find location"),
-        'location': location,
+
+    def response():
+        context = location_tree(location)
+        context['title'] = _("Find location")
+        return render(request, 'inventory/location_detail.html', context)
+
+    etag = conditional.etag(request, location.pk, cache.version(cache.tree_name(Location, location.tree_id), request))
+    return conditional.respond(request, response, etag=etag)
+
+@permission_required('inventory.view_location')
+def location_barcode(request, id):
+    text = str(id)
+    etag = barcodes.etag(text)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(barcodes.svg(text), content_type='image/svg+xml')
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=BARCODE_MAX_AGE, immutable=True)
+    return response
+
+@permission_required('inventory.view_location')
+def location_children(request, pk):
+    location = get_object_or_404(Location, pk=pk)
+
+    def children():
+        return {
+            'id': location.pk,
+            'children': [dict(child,
+                              url=reverse('inventory:location', args=(child['id'],)),
+                              children_url=reverse('inventory:locationchildren', args=(child['id'],)),
+                              is_leaf=child['child_count'] == 0)
+                         for child in tree.children(location, *LOCATION_CHILD_FIELDS)],
+        }
+
+    return JsonResponse(cache.fragment(location, 'children', children, request))
+
+@permission_required('inventory.view_item')
+def item_barcode(request, code):
+    if scan.parse_barcode(code) is None:
+        raise Http404(_("No item with this barcode"))
+    items = Item.objects.filter(barcode=code, state__exact='d').order_by('name')[:2]
+    if len(items) == 0:
+        raise Http404(_("No item with this barcode"))
+    elif len(items) == 1:
+        return HttpResponseRedirect(reverse('inventory:item', args=(items[0].pk,)))
+    return HttpResponseRedirect("{}?q={}&type=item".format(reverse('inventory:search'), code))
+
+# Scanners post without a CSRF token, the endpoint only reads data
+# Only reads
+@transaction.non_atomic_requests
+@csrf_exempt
+@require_POST
+@permission_required('inventory.view_item')
+@permission_required('inventory.view_location')
+def scan_resolve(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body)
+            barcodes = [str(b) for b in data.get('barcodes', [])]
+            locations = [str(l) for l in data.get('locations', [])]
+        except (ValueError, AttributeError, TypeError):
+            return JsonResponse({'error': _("Invalid JSON")}, status=400)
+    else:
+        barcodes = request.POST.getlist('barcode')
+        locations = request.POST.getlist('location')
+    if len(barcodes) + len(locations) > MAX_SCANS:
+        return JsonResponse({'error': _("Too many codes")}, status=400)
+
+    return JsonResponse({
+        'barcodes': scan.resolve_barcodes(barcodes),
+        'locations': scan.resolve_locations(locations),
     })
 
 @permission_required('inventory.view_location')
@@ -204,6 +387,83 @@ def item_new(request, pk):
         'location': location,
     })
 
+# Every chunk is imported in a transaction of its own
+@transaction.non_atomic_requests
+@permission_required('inventory.view_location')
+@permission_required('inventory.view_category')
+@permission_required('inventory.add_item')
+def item_import(request):
+    errors = []
+    result = None
+    if request.method == 'POST':
+        form = ItemImportForm(request.POST, request.FILES)
+
+        if form.is_valid():
+            def on_error(line, message):
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append((line, message))
+
+            items = importer.ItemImporter(chunk_size=form.cleaned_data['chunk_size'])
+            # utf-8-sig skips the byte order mark which Excel writes
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = items.run(stream, form.cleaned_data['format'], on_error)
+            except UnicodeDecodeError:
+                form.add_error('file', _("The file is not UTF-8 encoded."))
+                # Chunks before the error were imported
+                result = (items.imported, items.failed) if items.imported else None
+    else:
+        form = ItemImportForm()
+
+    return render(request, 'inventory/item_import.html', {
+        'title': _("Import items"),
+        'form': form,
+        'result': result,
+        'errors': errors,
+    })
+
+@permission_required('inventory.view_item')
+@permission_required('inventory.view_location')
+@permission_required('inventory.view_category')
+def export(request):
+    if 'format' not in request.GET:
+        return render(request, 'inventory/export.html', {
+            'title': _("Export"),
+            # Location and category pages link here with their pk
+            'form': ExportForm(initial=request.GET.dict()),
+        })
+
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return render(request, 'inventory/export.html', {
+            'title': _("Export"),
+            'form': form,
+        })
+    kind = form.cleaned_data['type']
+    format = form.cleaned_data['format']
+    response = StreamingHttpResponse(exporter.export(kind, format,
+                                                     state=form.cleaned_data['state'],
+                                                     location=form.cleaned_data['location'],
+                                                     category=form.cleaned_data['category']),
+                                     content_type=exporter.content_types[format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(kind, format)
+    return response
+
+@permission_required('inventory.view_item')
+@permission_required('inventory.view_location')
+@permission_required('inventory.view_category')
+def changes(request):
+    if 'since' not in request.GET:
+        return JsonResponse({'cursor': changelog.current()})
+    try:
+        since = int(request.GET['since'])
+        limit = min(int(request.GET.get('limit', changelog.BATCH_SIZE)), changelog.BATCH_SIZE)
+    except ValueError:
+        return JsonResponse({'error': _("Invalid cursor")}, status=400)
+    if since < 0 or limit < 1:
+        return JsonResponse({'error': _("Invalid cursor")}, status=400)
+    return JsonResponse(changelog.delta(since, request.GET.getlist('type') or None, limit))
+
 @permission_required('inventory.view_item')
 @permission_required('inventory.view_item')
 def item_edit(request, pk):
@@ -257,17 +517,14 @@ def item_lend(request, pk):
     instance = get_object_or_404(Item, pk=pk)
 
     if request.method == 'POST':
-        form = ItemLendForm(request.POST or None, instance=instance)
+        form = ItemLendForm(request.POST or None)
 
         if form.is_valid():
-            instance = form.save(commit=False)
-            instance.lent = True
-            instance.lent_date = timezone.now()
-            instance.save()
+            lending.lend(instance, form.cleaned_data['borrower'], form.cleaned_data['due_date'], request.user)
             return HttpResponseRedirect(reverse('inventory:item', args=(instance.pk,)))
 
     else:
-        form = ItemLendForm(instance=instance)
+        form = ItemLendForm()
 
     return render(request, 'inventory/item_lend.html', {
         'title': _("Lend item"),
@@ -286,15 +543,9 @@ def redirect_next(request, item, message):
 @permission_required('inventory.lend_item')
 def item_return(request, pk):
     instance = get_object_or_404(Item, pk=pk)
-    if instance.lent == False:
-        return HttpResponseRedirect(reverse('inventory:item', args=(item.pk,)))
-        #redirect_next(request, pk, "")
-    else:
-        instance.lent = False
-        instance.lent_to = ""
-        instance.lent_date = timezone.now()
-        instance.save()
-        return HttpResponseRedirect(reverse('inventory:item', args=(instance.pk,)))
+    if instance.lent:
+        lending.give_back(instance)
+    return HttpResponseRedirect(reverse('inventory:item', args=(instance.pk,)))
 
 @permission_required('inventory.delete_location')
 def location_delete(request, pk):
@@ -310,19 +561,17 @@ def location_trash(request, pk):
         raise Http404(_("Cannot trash 'Universe'"))
     location = get_object_or_404(Location, pk=pk)
     if location.children.count() != 0:
-        error_message = _("Cannot trash location with sublocations.")
-        return render(request, 'inventory/location_detail.html', {
-            'title': _("Trash location"),
-            'error_message': error_message,
-            'location': location,
-        })
+        # The page caches the sublocations, they must be in the context
+        context = location_tree(location)
+        context['title'] = _("Trash location")
+        context['error_message'] = _("Cannot trash location with sublocations.")
+        return render(request, 'inventory/location_detail.html', context)
     elif location.item_set.count() != 0:
-        error_message = _("Cannot trash non-empty location.")
-        return render(request, 'inventory/location_detail.html', {
-            'title': _("Trash location"),
-            'error_message': error_message,
-            'location': location,
-        })
+        # The page caches the sublocations, they must be in the context
+        context = location_tree(location)
+        context['title'] = _("Trash location")
+        context['error_message'] = _("Cannot trash non-empty location.")
+        return render(request, 'inventory/location_detail.html', context)
 
     parent = location.parent
     location.state = 't'
@@ -354,12 +603,11 @@ def category_trash(request, pk):
         raise Http404(_("Cannot trash 'Everything'"))
     category = get_object_or_404(Category, pk=pk)
     if category.children.count() != 0:
-        error_message = _("Cannot be trashd because subcategories exist.")
-        return render(request, 'inventory/category_detail.html', {
-            'title': _("Trash category"),
-            'error_message': error_message,
-            'category': category,
-        })
+        # The page caches the subcategories, they must be in the context
+        context = category_tree(category)
+        context['title'] = _("Trash category")
+        context['error_message'] = _("Cannot be trashd because subcategories exist.")
+        return render(request, 'inventory/category_detail.html', context)
     parent = category.parent
     category.state = 't'
     category.save()
@@ -376,6 +624,83 @@ def category_untrash(request, pk):
 
     return HttpResponseRedirect(reverse('inventory:trash', args=()))
 
+def move_children(request, parent, detail):
+    """Move any of the children of ``parent`` below another node."""
+    model = parent._meta.model
+    form = MoveForm(request.POST or None,
+                    nodes=parent.get_children().filter(state='d').only('name', *TREE_FIELDS),
+                    targets=model.objects.active().only('name', *TREE_FIELDS))
+    if request.method == 'POST' and form.is_valid():
+        try:
+            tree.move(form.cleaned_data['nodes'], form.cleaned_data['target'])
+        except ValueError as e:
+            form.add_error('target', str(e))
+        else:
+            return HttpResponseRedirect(reverse(detail, args=(form.cleaned_data['target'].pk,)))
+
+    return render(request, 'inventory/move.html', {
+        'title': _("Move"),
+        'form': form,
+        'parent': parent,
+        'detail': detail,
+    })
+
+@permission_required('inventory.change_location')
+def location_move(request, pk):
+    return move_children(request, get_object_or_404(Location, pk=pk), 'inventory:location')
+
+@permission_required('inventory.change_category')
+def category_move(request, pk):
+    return move_children(request, get_object_or_404(Category, pk=pk), 'inventory:category')
+
+# Purging deletes in batches, each in a transaction of its own
+@transaction.non_atomic_requests
+@require_POST
+def trash_bulk(request):
+    """
+    Trash, restore or delete the selected objects of one type. Locations and
+    categories are trashed and restored with their subtrees.
+    """
+    kind = request.POST.get('type')
+    action = request.POST.get('action')
+    if kind not in types or action not in ('trash', 'untrash', 'delete'):
+        raise Http404(_("Wrong 'type' or 'action' argument"))
+    if not request.user.has_perm('inventory.{}_{}'.format('delete' if action == 'delete' else 'trash', kind)):
+        raise PermissionDenied
+    pks = [pk for pk in request.POST.getlist('selected') if pk.isdigit()]
+    model = search.searchable[kind]
+
+    if action == 'delete':
+        trash.purge(model, pks)
+    elif kind == 'item':
+        (trash.trash_items if action == 'trash' else trash.untrash_items)(pks)
+    else:
+        (trash.trash_subtrees if action == 'trash' else trash.untrash_subtrees)(model, pks)
+
+    next = request.POST.get('next')
+    if not next or not url_has_allowed_host_and_scheme(next, allowed_hosts={request.get_host()}):
+        next = '{}?type={}'.format(reverse('inventory:trash'), kind)
+    return HttpResponseRedirect(next)
+
+@permission_required('inventory.view_item')
+@permission_required('inventory.view_category')
+def category_rollup(request, pk):
+    category = get_object_or_404(Category, pk=pk)
+    return render(request, 'inventory/category_rollup.html', {
+        'title': _("Category summary"),
+        'category': category,
+        'rollup': reports.category_rollup(category),
+    })
+
+@permission_required('inventory.view_item')
+@permission_required('inventory.view_category')
+def category_rollup_json(request, pk):
+    category = get_object_or_404(Category, pk=pk)
+    return JsonResponse({
+        'category': category.pk,
+        'categories': reports.category_rollup(category),
+    })
+
 @permission_required('inventory.edit_category')
 def category_edit(request, pk):
     instance = get_object_or_404(Category, pk=pk)
@@ -431,23 +756,27 @@ def location_new(request, pk):
 
 @permission_required('inventory.add_location')
 def location_new_multiple(request, pk):
-    logger.warn("Yesssss")
     parent = get_object_or_404(Location, pk=pk)
     instance = Location(parent=parent)
+    error_message = None
     if request.method == 'POST':
         form = LocationEditForm(request.POST, instance=instance)
 
         if form.is_valid() and 'amount' in request.POST:
-            # Create 'amount' locations and name them 'Name 1', 'Name 2', etc
+            # Create 'amount' locations and name them 'Name 1', 'Name 2', etc,
+            # optionally with 'sub_amount' sublocations each
             try:
-                amount = int(request.POST['amount'])
-                for i in range(amount):
-                    l = Location.objects.create(name="{} {}".format(form.cleaned_data['name'], i+1),
-                                                description="{} {}".format(form.cleaned_data['description'], i+1),
-                                                parent=parent)
-                
-                return HttpResponseRedirect(reverse('inventory:location', args=(pk,)))
-            except:
+                levels = [(form.cleaned_data['name'], int(request.POST['amount']))]
+                if request.POST.get('sub_amount'):
+                    levels.append((request.POST.get('sub_name', ''), int(request.POST['sub_amount'])))
+            except ValueError:
+                levels = None
+            if not levels or any(amount < 1 for name, amount in levels):
+                error_message = _("Amounts must be positive numbers.")
+            elif tree.grid_size(levels) > MAX_NEW_LOCATIONS:
+                error_message = _("Cannot create more than %(max)d locations at once.") % {'max': MAX_NEW_LOCATIONS}
+            else:
+                tree.create_grid(parent, levels, form.cleaned_data['description'], form.cleaned_data['capacity'])
                 return HttpResponseRedirect(reverse('inventory:location', args=(pk,)))
     else:
         form = LocationEditForm(instance=instance)
@@ -455,6 +784,7 @@ def location_new_multiple(request, pk):
     return render(request, 'inventory/location_new_multiple.html', {
         'form': form,
         'instance': instance,
+        'error_message': error_message,
     })
 
 @permission_required('inventory.edit_location')
@@ -477,14 +807,40 @@ def location_edit(request, pk):
 
 @permission_required('inventory.view_location')
 def print_list(request):
-    try:
-        print_list = LocationPrintList.objects.get(user=request.user)
-    except:
-        print_list = LocationPrintList.objects.create(user=request.user) 
+    print_list = printlist.for_user(request.user)
+
+    def resolve(entries):
+        locations = [entry.location for entry in entries]
+        # All codes of the page inline, so a sheet comes in one response
+        codes = barcodes.inline([str(location.uuid) for location in locations if location.uuid])
+        for location in locations:
+            location.barcode_svg = codes.get(str(location.uuid))
+        return locations
+
+    # In the order the locations were added, like the label sheets
+    entries = printlist.Entry.objects.filter(locationprintlist=print_list).select_related('location') \
+        .only('location__name', 'location__uuid')
+    paginator = CursorPaginator(entries, PRINT_LIST_PAGE, ('id',), resolve=resolve, params=request.GET)
+    page = paginator.page(request.GET.get('cursor'))
     return render(request, 'inventory/print_list.html', {
-        'list': print_list.locations.all().order_by('name')
+        'list': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'label_form': LabelSheetForm(),
     })
 
+@permission_required('inventory.view_location')
+def print_list_labels(request):
+    form = LabelSheetForm(request.GET)
+    print_list = LocationPrintList.objects.filter(user=request.user).first()
+    if not form.is_valid() or print_list is None:
+        return HttpResponseRedirect(reverse('inventory:print_list'))
+    format = form.cleaned_data['format']
+    response = StreamingHttpResponse(labels.writers[format](print_list, form.cleaned_data['layout']),
+                                     content_type=labels.content_types[format])
+    response['Content-Disposition'] = 'inline; filename="labels.{}"'.format(format)
+    return response
+
 @permission_required('inventory.view_location')
 def print_list_clear(request):
     try:
@@ -496,23 +852,35 @@ def print_list_clear(request):
 
 @permission_required('inventory.view_location')
 def print_list_add(request, pk):
-    try:
-        print_list = LocationPrintList.for_user(user=request.user)
-        l = get_object_or_404(Location, pk=pk)
-        print_list.add(l)
-        return HttpResponseRedirect(reverse('inventory:print_list'))
-    except:
-        return HttpResponseRedirect(reverse('inventory:print_list'))
-    
+    printlist.add(printlist.for_user(request.user), [pk])
+    return HttpResponseRedirect(reverse('inventory:print_list'))
+
 @permission_required('inventory.view_location')
 def print_list_remove(request, pk):
-    try:
-        print_list = LocationPrintList.for_user(user=request.user)
-        l = get_object_or_404(Location, pk=pk)
-        print_list.remove(l)
-        return HttpResponseRedirect(reverse('inventory:print_list'))
-    except:
-        return HttpResponseRedirect(reverse('inventory:print_list'))
+    printlist.remove(printlist.for_user(request.user), [pk])
+    return HttpResponseRedirect(reverse('inventory:print_list'))
+
+@require_POST
+@permission_required('inventory.view_location')
+def print_list_bulk(request):
+    """
+    Add the selected locations, optionally with all their sublocations, to
+    the print list or remove them from it.
+    """
+    action = request.POST.get('action')
+    if action not in ('add', 'add_subtree', 'remove'):
+        raise Http404(_("Wrong 'action' argument"))
+    pks = [pk for pk in request.POST.getlist('selected') if pk.isdigit()]
+    print_list = printlist.for_user(request.user)
+    if action == 'remove':
+        printlist.remove(print_list, pks)
+    else:
+        printlist.add(print_list, pks, subtree=action == 'add_subtree')
+
+    next = request.POST.get('next')
+    if not next or not url_has_allowed_host_and_scheme(next, allowed_hosts={request.get_host()}):
+        next = reverse('inventory:print_list')
+    return HttpResponseRedirect(next)
 
 
 class AccountsProfile(LoginRequiredMixin, generic.DetailView):
@@ -523,7 +891,7 @@ class AccountsProfile(LoginRequiredMixin, generic.DetailView):
         return self.request.user
 
 
-class TrashView(PermissionRequiredMixin, generic.ListView):
+class TrashView(PermissionRequiredMixin, CursorPaginationMixin, generic.ListView):
     permission_required = ('inventory.view_item', 'inventory.view_location', 'inventory.view_category')
     paginate_by = 25
     template_name = 'inventory/trash.html'
@@ -535,16 +903,31 @@ class TrashView(PermissionRequiredMixin, generic.ListView):
             search_type = types[0]
 
         if search_type == 'item':
-            self.object_list = Item.objects.filter(state__exact='t')
+            self.object_list = Item.objects.trashed().for_list()
         elif search_type == 'location':
-            self.object_list = Location.objects.filter(state__exact='t')
+            self.object_list = Location.objects.trashed().for_list()
+            self.cursor_ordering = ('tree_id', 'lft')
         elif search_type == 'category':
-            self.object_list = Category.objects.filter(state__exact='t')
+            self.object_list = Category.objects.trashed().for_list()
+            self.cursor_ordering = ('tree_id', 'lft')
             
         context = self.get_context_data()
         context['search_type'] = search_type
         context['title'] = _("Trash")
 
-        return self.render_to_response(context) 
+        return self.render_to_response(context)
 
-    
+
+@user_passes_test(lambda user: user.is_superuser)
+def stats_queries(request):
+    if request.method == 'POST':
+        query_stats.reset()
+        cache.stats.reset()
+        return HttpResponseRedirect(reverse('inventory:stats_queries'))
+
+    return render(request, 'inventory/stats_queries.html', {
+        'title': _("Query statistics"),
+        'enabled': settings.QUERY_STATS,
+        'stats': query_stats.summary(),
+        'cache_stats': cache.stats.summary(),
+    })
@@ -54,6 +54,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per request query counts and timings, see inventory/middleware.py
+QUERY_STATS = os.getenv('INVENTORY_QUERY_STATS', 'False') == 'True'
+if QUERY_STATS:
+    MIDDLEWARE.insert(0, 'inventory.middleware.QueryStatsMiddleware')
+
+# Paginate long lists with next/previous cursors instead of page numbers,
+# see inventory/pagination.py
+CURSOR_PAGINATION = os.getenv('INVENTORY_CURSOR_PAGINATION', 'True') == 'True'
+
+# Seconds a change stays invisible in /changes/, longer than inserting the
+# change log rows of a commit takes, see inventory/changelog.py
+CHANGES_DELAY = float(os.getenv('INVENTORY_CHANGES_DELAY', '2'))
+
 ROOT_URLCONF = 'inventorymanager.urls'
 
 TEMPLATES = [
@@ -98,6 +111,70 @@ e = os.getenv('INVENTORY_DB_PORT')
 if e:
     DATABASES['default']['PORT'] = e
 
+# SQLite profile, on by default for SQLite databases: write-ahead log,
+# write transactions which wait for the lock (BEGIN IMMEDIATE) and
+# persistent connections, see inventory/sqlite.py. WAL needs a local file
+# system.
+SQLITE_PRAGMAS = {}
+if (DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+        and os.getenv('INVENTORY_DB_SQLITE_PROFILE', 'True') == 'True'):
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.getenv('INVENTORY_DB_SQLITE_BUSY_TIMEOUT', '5000')),
+        # Negative sizes are in KiB
+        'cache_size': -20000,
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('INVENTORY_DB_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Optional read replica, configured like the primary with
+# INVENTORY_DB_REPLICA_* (unset ones are copied from the primary), see
+# inventory/routers.py. Clients read from the primary for
+# REPLICA_PIN_SECONDS after they wrote something.
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = int(os.getenv('INVENTORY_DB_REPLICA_PIN_SECONDS', '10'))
+if os.getenv('INVENTORY_DB_REPLICA_NAME') or os.getenv('INVENTORY_DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT'):
+        e = os.getenv('INVENTORY_DB_REPLICA_' + key)
+        if e:
+            DATABASES['replica'][key] = e
+    DATABASE_REPLICAS = ['replica']
+    DATABASE_ROUTERS = ['inventory.routers.ReplicaRouter']
+    MIDDLEWARE.append('inventory.middleware.ReplicaMiddleware')
+
+if SQLITE_PRAGMAS:
+    # Needs to be the last middleware
+    MIDDLEWARE.append('inventory.middleware.WriteTransactionMiddleware')
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# INVENTORY_CACHE_BACKEND is 'locmem', 'file', 'memcached', 'redis' or the
+# dotted path of any other cache backend. The versions which invalidate
+# cached data are in the database (see inventory/cache.py), so 'locmem' is
+# fine with several processes too.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+e = os.getenv('INVENTORY_CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(e, e),
+        'LOCATION': os.getenv('INVENTORY_CACHE_LOCATION',
+                              os.path.join(BASE_DIR, 'cache') if e == 'file' else 'inventory'),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators